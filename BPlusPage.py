@@ -0,0 +1,80 @@
+import bisect
+
+from IndexPage import IndexPage, IndexRecord
+
+
+class BPlusPage(IndexPage):
+    # A node of the B+ tree layout. Leaves hold (key, data page number) records and are linked with their neighbours,
+    # internal pages hold separator keys only, in records with no data page number, and pointers to their children.
+    # Keys in the child i are not smaller than the separator i - 1 and smaller than the separator i.
+    free_kind = 0
+    leaf_kind = 1
+    internal_kind = 2
+
+    header_size = 5 * 4     # kind, records count, previous leaf, next leaf, first pointer
+    entry_size = 2 * 4      # key and either data page number or pointer
+
+    def __init__(self, records_per_page: int, page_number: int) -> None:
+        super().__init__(records_per_page, page_number)
+        self.leaf: bool | None = None  # None for a free page
+        self.prev_page: int | None = None
+        self.next_page: int | None = None
+
+    @staticmethod
+    def get_max_size(records_per_page: int) -> int:
+        # The page takes as many bytes as an index page of the same order, unless its header does not leave room
+        # for records_per_page entries. Without data page numbers in internal pages, the page holds more entries.
+        return max(IndexPage.get_max_size(records_per_page),
+                   BPlusPage.header_size + records_per_page * BPlusPage.entry_size)
+
+    @staticmethod
+    def get_capacity(page_size: int) -> int:
+        return (page_size - BPlusPage.header_size) // BPlusPage.entry_size
+
+    def find_child_position(self, key: int) -> int:
+        return bisect.bisect_right(self.records, key, key=IndexPage.record_key)
+
+    def get_separator(self, record_number: int) -> IndexRecord:
+        return IndexRecord(self.get_key(record_number), None)
+
+    def set_leaf(self, leaf: bool) -> None:
+        self.leaf = leaf
+        self.dirty_bit = True
+
+    def set_prev_page(self, prev_page: int | None) -> None:
+        self.prev_page = prev_page
+        self.dirty_bit = True
+
+    def set_next_page(self, next_page: int | None) -> None:
+        self.next_page = next_page
+        self.dirty_bit = True
+
+    def free(self) -> None:
+        super().free()
+        self.leaf = None
+        self.prev_page = None
+        self.next_page = None
+
+    def is_leaf(self) -> bool:
+        return self.leaf is True
+
+    def is_empty(self) -> bool:
+        return self.leaf is None
+
+
+class ClusteredPage(BPlusPage):
+    # A node of the clustered layout. Internal pages are the same as in the B+ tree layout, leaves hold the records
+    # themselves, as DataRecords in slots of leaf_entry_size bytes. Data of up to inline_data_size bytes is kept in
+    # the slot, longer data in overflow pages of the data file, the slot then holds the first one.
+    inline_data_size = 32
+    leaf_entry_size = 2 * 4 + inline_data_size  # key, data length, data or the first overflow page
+
+    @staticmethod
+    def get_max_size(records_per_page: int) -> int:
+        # Without a page size given, a leaf holds records_per_page records.
+        return max(BPlusPage.get_max_size(records_per_page),
+                   BPlusPage.header_size + records_per_page * ClusteredPage.leaf_entry_size)
+
+    @staticmethod
+    def get_leaf_capacity(page_size: int) -> int:
+        return (page_size - BPlusPage.header_size) // ClusteredPage.leaf_entry_size
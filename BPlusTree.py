@@ -0,0 +1,296 @@
+from BPlusPage import BPlusPage
+from BTree import BTree
+from BulkLoader import BPlusBulkLoader
+from Cursor import LeafCursor
+from IndexPage import IndexRecord
+from Metrics import traced
+
+
+class BPlusTree(BTree):
+    # B-Tree variant in which only leaves point to data pages. Internal pages hold separator keys only, so more of
+    # them fit in a page, and leaves are linked with their neighbours, so a range scan is a walk along the leaves.
+    layout = "bplus"
+    cursor_class = LeafCursor
+    bulk_loader_class = BPlusBulkLoader
+
+    def __init__(self, d=2, index_filename: str = "data/index.txt", data_filename: str = "data/data.txt",
+                 catalog_filename: str = "data/catalog.txt", create: bool = True, page_size: int | None = None,
+                 **options) -> None:
+        super().__init__(d, index_filename, data_filename, catalog_filename, create, page_size, **options)
+        # Number of separators in an internal page and of records in a leaf, the same in this layout. It follows
+        # from the page size, which is the size of an index page of order d if not given.
+        self.capacity: int = self.filesHandler.codec.capacity
+        self.leaf_capacity: int = self.filesHandler.codec.leaf_capacity
+
+# public:
+    @staticmethod
+    def create(d: int = 2, index_filename: str = "data/index.txt", data_filename: str = "data/data.txt",
+               catalog_filename: str = "data/catalog.txt", page_size: int | None = None, **options):
+        return BPlusTree(d, index_filename, data_filename, catalog_filename, create=True, page_size=page_size,
+                         **options)
+
+    def find_path(self, key: int, latch: bool | None = None) -> [(BPlusPage, int)]:
+        # Returns (page, position) pairs from the root to the leaf where the key belongs. The position is the child
+        # taken in internal pages and the position of the key in the leaf, which is latched if latch is given.
+        path = []
+        node = self.filesHandler.get_index_page(self.root_page)
+        while not node.is_leaf():
+            i = node.find_child_position(key)
+            path.append((node, i))
+            node = self.filesHandler.get_index_page(node.get_pointer(i))
+
+        if latch is not None and not self.latch.is_owned():
+            node = self.latch_page(node.page_number, latch)
+        path.append((node, node.find_position(key)))
+        return path
+
+    def check_structure(self) -> int:
+        # Also checks that the leaves, linked in both directions, hold all records in key order.
+        with self.latch.exclusive():
+            records = super().check_structure()
+            if self.root_page is None:
+                return records
+
+            node = self.filesHandler.get_index_page(self.root_page)
+            while not node.is_leaf():
+                node = self.filesHandler.get_index_page(node.get_pointer(0))
+
+            chained_records, last_key, prev_page = 0, None, None
+            while True:
+                if node.prev_page != prev_page:
+                    raise ValueError(f"Leaf {node.page_number} links back to {node.prev_page} instead of {prev_page}!")
+                if node.records and last_key is not None and node.get_key(0) <= last_key:
+                    raise ValueError(f"Leaf {node.page_number} is out of key order!")
+                chained_records += len(node.records)
+                if node.records:
+                    last_key = node.get_key(len(node.records) - 1)
+                if node.next_page is None:
+                    break
+                prev_page = node.page_number
+                node = self.filesHandler.get_index_page(node.next_page)
+
+            if chained_records != records:
+                raise ValueError(f"Leaves linked hold {chained_records} of {records} records!")
+            return records
+
+# private:
+    def relink_moved_page(self, node: BPlusPage) -> None:
+        if not node.is_leaf():
+            return
+
+        if node.prev_page is not None:
+            self.filesHandler.get_index_page(node.prev_page).set_next_page(node.page_number)
+        if node.next_page is not None:
+            self.filesHandler.get_index_page(node.next_page).set_prev_page(node.page_number)
+
+    def collect_index_records(self, page: int, keys: [int], index_records: dict) -> None:
+        # Separators in internal pages are not records, so keys are only looked up in leaves.
+        node = self.filesHandler.get_index_page(page)
+        if node.is_leaf():
+            self.collect_leaf_records(page, keys, index_records)
+            return
+
+        child_keys = {}
+        for key in keys:
+            child_keys.setdefault(node.find_child_position(key), []).append(key)
+        for i, keys_of_child in child_keys.items():
+            self.collect_index_records(node.get_pointer(i), keys_of_child, index_records)
+
+    @staticmethod
+    def holds_data(node: BPlusPage) -> bool:
+        return node.is_leaf()
+
+    @staticmethod
+    def key_in_bounds(key: int, low: int | None, high: int | None) -> bool:
+        # A separator is a copy of the first key of the subtree on its right.
+        return (low is None or low <= key) and (high is None or key < high)
+
+    def get_capacity(self, node: BPlusPage) -> int:
+        return self.leaf_capacity if node.is_leaf() else self.capacity
+
+    def is_overflown(self, node: BPlusPage) -> bool:
+        return len(node.records) > self.get_capacity(node)
+
+    def is_underflown(self, node: BPlusPage) -> bool:
+        return len(node.records) < self.get_capacity(node) // 2
+
+    def has_room(self, node: BPlusPage) -> bool:
+        return len(node.records) < self.get_capacity(node)
+
+    def can_lend(self, node: BPlusPage) -> bool:
+        return len(node.records) > self.get_capacity(node) // 2
+
+    @staticmethod
+    def split_point(records: [IndexRecord]) -> int:
+        return len(records) // 2
+
+    def create_root(self, record: IndexRecord | None = None, new_child_pointer: int | None = None) -> BPlusPage:
+        # Without arguments creates a leaf as the root of an empty tree, otherwise a root above the old one.
+        self.metrics.count("root_changes")
+        self.h += 1
+        root_node = self.filesHandler.create_new_index_page()
+        root_node.set_leaf(record is None)
+
+        if record is not None:
+            root_node.set_records([record])
+            root_node.set_pointers([self.root_page, new_child_pointer])
+
+        self.root_page = root_node.page_number
+        return root_node
+
+    @traced("insert_into_node")
+    def insert_into_node(self, record: IndexRecord, path: [(BPlusPage, int)]) -> None:
+        leaf, i = path[-1]
+        leaf.add_record(i, record)
+        self.repair_path_after_insertion(path)
+
+    def remove_from_node(self, path: [(BPlusPage, int)]) -> IndexRecord:
+        leaf, i = path[-1]
+        index_record = leaf.get_record(i)
+        leaf.remove_record(index_record)
+        self.repair_path_after_removal(path)
+        return index_record
+
+    def repair_path_after_insertion(self, path: [(BPlusPage, int)]) -> None:
+        # A page that got one record too many gives records to a neighbour or is split, which adds a separator to
+        # its parent, so the parent is checked next.
+        level = len(path) - 1
+        while level >= 0 and self.is_overflown(path[level][0]):
+            node = path[level][0]
+            if level == 0:
+                record, new_child_pointer = self.split(node)
+                self.create_root(record, new_child_pointer)
+                return
+
+            parent, i = path[level - 1]
+            if self.try_compensation(node, parent, i):
+                return
+
+            record, new_child_pointer = self.split(node)
+            parent.add_record(i, record)
+            parent.add_pointer(i + 1, new_child_pointer)
+            level -= 1
+
+    def try_compensation(self, node: BPlusPage, parent: BPlusPage, i: int) -> bool:
+        if i - 1 >= 0:
+            left_neighbour = self.filesHandler.get_index_page(parent.get_pointer(i - 1))
+            if self.has_room(left_neighbour):
+                self.compensation(left_neighbour, node, parent, i - 1)
+                return True
+            self.filesHandler.reduce_usage(left_neighbour)
+
+        if i + 1 < len(parent.pointers):
+            right_neighbour = self.filesHandler.get_index_page(parent.get_pointer(i + 1))
+            if self.has_room(right_neighbour):
+                self.compensation(node, right_neighbour, parent, i)
+                return True
+            self.filesHandler.reduce_usage(right_neighbour)
+
+        return False
+
+    def try_compensation_for_remove(self, node: BPlusPage, parent: BPlusPage, i: int) -> bool:
+        if i - 1 >= 0:
+            left_neighbour = self.filesHandler.get_index_page(parent.get_pointer(i - 1))
+            if self.can_lend(left_neighbour):
+                self.compensation(left_neighbour, node, parent, i - 1)
+                return True
+            self.filesHandler.reduce_usage(left_neighbour)
+
+        if i + 1 < len(parent.pointers):
+            right_neighbour = self.filesHandler.get_index_page(parent.get_pointer(i + 1))
+            if self.can_lend(right_neighbour):
+                self.compensation(node, right_neighbour, parent, i)
+                return True
+            self.filesHandler.reduce_usage(right_neighbour)
+
+        return False
+
+    @traced("compensation", "compensations")
+    def compensation(self, left_child: BPlusPage, right_child: BPlusPage, parent: BPlusPage, i: int) -> None:
+        # Distributes records of two neighbours equally between them, the separator i of the parent is between them.
+        if left_child.is_leaf():
+            records_distribution_list = left_child.get_records() + right_child.get_records()
+            middle = self.split_point(records_distribution_list)
+            left_child.set_records(records_distribution_list[:middle])
+            right_child.set_records(records_distribution_list[middle:])
+            parent.set_record(i, right_child.get_separator(0))
+            return
+
+        # Separators of internal pages go through the parent, like records in the B-Tree layout.
+        records_distribution_list = left_child.get_records() + [parent.get_record(i)] + right_child.get_records()
+        pointers_distribution_list = left_child.get_pointers() + right_child.get_pointers()
+        middle = self.split_point(records_distribution_list)
+        left_child.set_records(records_distribution_list[:middle])
+        right_child.set_records(records_distribution_list[middle + 1:])
+        parent.set_record(i, records_distribution_list[middle])
+        left_child.set_pointers(pointers_distribution_list[:middle + 1])
+        right_child.set_pointers(pointers_distribution_list[middle + 1:])
+
+    @traced("split", "splits")
+    def split(self, node: BPlusPage) -> (IndexRecord, int):
+        new_node = self.filesHandler.create_new_index_page()
+        new_node.set_leaf(node.is_leaf())
+        middle = self.split_point(node.get_records())
+
+        if node.is_leaf():
+            # The separator is a copy of the first key of the new leaf, which is linked after the split one.
+            new_node.set_records(node.get_records(middle))
+            node.set_records(node.get_records(0, middle))
+
+            new_node.set_prev_page(node.page_number)
+            new_node.set_next_page(node.next_page)
+            if node.next_page is not None:
+                self.filesHandler.get_index_page(node.next_page).set_prev_page(new_node.page_number)
+            node.set_next_page(new_node.page_number)
+            return new_node.get_separator(0), new_node.page_number
+
+        # The middle separator of an internal page moves up to the parent.
+        record_for_parent = node.get_record(middle)
+        new_node.set_records(node.get_records(middle + 1))
+        new_node.set_pointers(node.get_pointers(middle + 1))
+        node.set_records(node.get_records(0, middle))
+        node.set_pointers(node.get_pointers(0, middle + 1))
+        return record_for_parent, new_node.page_number
+
+    @traced("merge", "merges")
+    def merge(self, node: BPlusPage, parent: BPlusPage, i: int) -> None:
+        # Merges the node with its right neighbour or, for the last child, with the left one.
+        if i + 1 < len(parent.pointers):
+            left_child, right_child = node, self.filesHandler.get_index_page(parent.get_pointer(i + 1))
+        else:
+            left_child, right_child, i = self.filesHandler.get_index_page(parent.get_pointer(i - 1)), node, i - 1
+
+        if left_child.is_leaf():
+            left_child.set_records(left_child.get_records() + right_child.get_records())
+            left_child.set_next_page(right_child.next_page)
+            if right_child.next_page is not None:
+                self.filesHandler.get_index_page(right_child.next_page).set_prev_page(left_child.page_number)
+        else:
+            left_child.set_records(left_child.get_records() + [parent.get_record(i)] + right_child.get_records())
+            left_child.set_pointers(left_child.get_pointers() + right_child.get_pointers())
+
+        parent.remove_record(parent.get_record(i))
+        parent.remove_pointer(right_child.page_number)
+        right_child.free()
+
+    def visit_node(self, node: BPlusPage, print_records: bool = False) -> None:
+        self.prefetch_node(node, print_records)
+        if node.is_leaf():
+            if print_records:
+                for record in node.records:
+                    self.print_data_record(record)
+            else:
+                print("( " + "".join(f"{record.key} " for record in node.records) + ") ", end="")
+            return
+
+        # Separators are printed between the subtrees they separate, in square brackets.
+        if not print_records:
+            print("( ", end="")
+
+        for i, pointer in enumerate(node.pointers):
+            self.visit_node(self.filesHandler.get_index_page(pointer), print_records)
+            if not print_records and i < len(node.records):
+                print(f"[{node.get_key(i)}]", end=" ")
+
+        if not print_records:
+            print(") ", end="")
@@ -1,165 +1,730 @@
+import bisect
+import contextlib
+import os
+import time
+
+from BulkLoader import BulkLoader
+from Catalog import Catalog
+from Cursor import Cursor
+from DataPage import DataPage, OverflowPage
 from FilesHandler import FilesHandler
 from IndexPage import IndexRecord, IndexPage
+from KeyFilter import KeyFilter
+from Latch import Latch
+from Metrics import traced
+from PageFile import PageFile
 from DataRecord import DataRecord
 
 
 class BTree:
-    def __init__(self, d=2) -> None:
+    range_batch_size = 64   # index records collected before their data pages are read
+    read_operations = ("search", "get")     # the only operations of a tree open read-only
+    layout = "btree"
+    cursor_class = Cursor
+    bulk_loader_class = BulkLoader
+
+    def __init__(self, d=2, index_filename: str = "data/index.txt", data_filename: str = "data/data.txt",
+                 catalog_filename: str = "data/catalog.txt", create: bool = True, page_size: int | None = None,
+                 key_filter: bool = False, **options) -> None:
+        # options: buffer_size (in pages), buffer_bytes, buffer_policy ("lru", "clock" or "2q"), use_mmap, read_only
+        # (see read_snapshot), and for the write-ahead log: wal, log_filename, group_commit (commits per sync) and
+        # group_commit_interval.
+        # With key_filter, lookups and removals of absent keys are answered by a KeyFilter over the keys, mostly
+        # without reading any page. The filter is saved next to the index file when the tree is closed.
+        # With page_size given, d is the largest order whose nodes fit in a page of that many bytes, rounded up to
+        # a multiple of the OS page.
+        if page_size is not None:
+            page_size = PageFile.align_to_os_page(page_size)
+            d = IndexPage.get_order_for_page_size(page_size)
+
         self.d: int = d
         self.root_page: int | None = None  # root page address
         self.h: int = 0
-        self.filesHandler = FilesHandler(2 * d)
+        self.batch_depth: int = 0
+        self.verbose: bool = True   # when cleared, operations print no messages and no page access counts
+        self.filesHandler = FilesHandler(2 * d, index_filename, data_filename, catalog_filename, create,
+                                         page_size=page_size, layout=self.layout, **options)
+        self.metrics = self.filesHandler.metrics
+        # The tree can be used by many threads. Reading operations, and changing ones that change only a single leaf,
+        # hold the tree latch shared and latch the leaf they use, see run_latched. All others hold it exclusively.
+        # Pages other than leaves change only then, so they need no latches of their own.
+        self.latch = Latch()
+
+        if not create:
+            self.root_page = self.filesHandler.catalog.root_page
+            self.h = self.filesHandler.catalog.h
+
+        self.key_filter_filename: str = os.path.splitext(index_filename)[0] + ".keys"
+        self.key_filter: KeyFilter | None = None
+        self.open_key_filter(key_filter, create)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
 
 # public:
-    def insert(self, record: DataRecord) -> None:
-        data_page_number = self.filesHandler.add_record_to_data_file(record)
+    @staticmethod
+    def create(d: int = 2, index_filename: str = "data/index.txt", data_filename: str = "data/data.txt",
+               catalog_filename: str = "data/catalog.txt", page_size: int | None = None, **options):
+        return BTree(d, index_filename, data_filename, catalog_filename, create=True, page_size=page_size, **options)
 
-        index_record = IndexRecord(record.key, data_page_number)
+    @staticmethod
+    def open(index_filename: str = "data/index.txt", data_filename: str = "data/data.txt",
+             catalog_filename: str = "data/catalog.txt", **options):
+        # The tree order and layout are taken from the catalog, so reopening needs no information about how the tree
+        # was built.
+        catalog = BTree.load_catalog(catalog_filename, options.get("read_only", False))
+        tree_class = BTree
+        if catalog.layout == "bplus":
+            from BPlusTree import BPlusTree
+            tree_class = BPlusTree
+        elif catalog.layout == "clustered":
+            from ClusteredTree import ClusteredTree
+            tree_class = ClusteredTree
+
+        return tree_class(catalog.records_per_page // 2, index_filename, data_filename, catalog_filename,
+                          create=False, page_size=catalog.page_size, **options)
 
-        if self.root_page is None:
-            root_node = self.create_root()
-        else:
-            root_node = self.filesHandler.get_index_page(self.root_page)
+    @staticmethod
+    def exists(catalog_filename: str = "data/catalog.txt") -> bool:
+        # Whether there is a tree to open with the catalog, see open.
+        return os.path.exists(catalog_filename)
+
+    def close(self) -> None:
+        with self.latch.exclusive():
+            self.flush_buffers()
+            self.filesHandler.close()
+            if self.key_filter is not None:
+                self.key_filter.save(self.key_filter_filename)
+
+    def checkpoint(self) -> None:
+        # Writes all changes to the files and syncs them, after which the write-ahead log is empty.
+        self.check_writable()
+        with self.latch.exclusive():
+            self.flush_buffers()
+            self.filesHandler.checkpoint()
+
+    def insert(self, record: DataRecord) -> bool:
+        self.check_key(record.key)
+        self.begin_operation("insert")
+        inserted = False
         try:
-            index_record, child_pointer = self.insert_into_node(index_record, root_node)
-            if index_record and child_pointer:
-                self.create_root(index_record, child_pointer)
+            inserted = self.run_latched(self.insert_record, record)
+            if not inserted:
+                self.print_message("Record already exists!")
+        finally:
+            self.end_operation(print_reads_and_writes=inserted)
 
-            self.filesHandler.flush_buffers()
-            self.print_reads_and_writes()
-        except ValueError:
-            print("Record already exists!")
+        return inserted
 
-    def search(self, key: int) -> None:
-        self.filesHandler.reset_io_counters()
+    def search(self, key: int) -> bool:
+        self.begin_operation("search")
+        try:
+            with self.latch.shared():
+                result = False
+                if self.root_page is not None and self.may_hold(key):
+                    with self.latched_path(key) as path:
+                        result = self.holds_key(path, key)
+
+            if result:
+                self.print_message("Key found!")
+            else:
+                self.print_message("Key not found!")
+        finally:
+            self.end_operation(flush=False)
 
-        result = self.search_by_key(key, self.root_page)
-        if result:
-            print(f"Key found!")
-        else:
-            print("Key not found!")
+        return result
+
+    def get(self, key: int) -> DataRecord | None:
+        # Returns the record with the given key or None if there is none.
+        self.begin_operation("get")
+        try:
+            with self.latch.shared():
+                record = self.read_record(key)
+        finally:
+            self.end_operation(flush=False)
+
+        return record
+
+    def get_many(self, keys):
+        # Yields the record of every key, or None if there is none, in the order of the keys. The keys are looked
+        # up in one walk down the tree, which reads every index page at most once, and every data page is read once.
+        # The records are yielded once all of them are read, so the caller holds no latch between them.
+        keys = list(keys)
+        if not self.batch_depth:
+            self.filesHandler.reset_io_counters()
+
+        self.metrics.begin_operation("get_many")
+        try:
+            data_records = {}
+            with self.latch.shared():
+                index_records = {}
+                held_keys = sorted({key for key in keys if self.may_hold(key)})
+                if self.root_page is not None and held_keys:
+                    self.collect_index_records(self.root_page, held_keys, index_records)
+
+                for data_record in self.get_data_records(list(index_records.values())):
+                    data_records[data_record.key] = data_record
+
+            for key in keys:
+                yield data_records.get(key)
+        finally:
+            self.metrics.end_operation()
+
+    def remove(self, key: int) -> bool:
+        if self.root_page is None:
+            self.print_message("B-Tree is empty!")
+            return False
+
+        self.begin_operation("remove")
+        removed = False
+        try:
+            removed = self.run_latched(self.remove_record, key)
+            if not removed:
+                self.print_message(f"No record with key {key}!")
+        finally:
+            self.end_operation(print_reads_and_writes=removed)
+
+        return removed
+
+    def insert_many(self, records) -> int:
+        # Records are inserted in key order within one batch, so every modified page is written once at the end.
+        with self.batch():
+            inserted = sum(self.insert(record) for record in sorted(records, key=lambda record: record.key))
 
-        self.filesHandler.flush_buffers()
         self.print_reads_and_writes()
+        return inserted
 
-    def remove(self, key: int) -> None:
-        self.filesHandler.reset_io_counters()
+    def remove_many(self, keys) -> int:
+        with self.batch():
+            removed = sum(self.remove(key) for key in sorted(keys))
 
+        self.print_reads_and_writes()
+        return removed
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Operations inside the batch leave modified pages in the buffers, which keep dirty pages until the batch
+        # ends. Then all of them are written once. Batches can be nested, only the outermost one writes. The batch
+        # holds the tree latch exclusively, so operations of other threads wait until it ends.
+        with self.latch.exclusive():
+            if not self.batch_depth:
+                self.filesHandler.reset_io_counters()
+                self.filesHandler.set_no_steal(True)
+            self.batch_depth += 1
+            try:
+                yield self
+            finally:
+                self.batch_depth -= 1
+                if not self.batch_depth:
+                    self.filesHandler.set_no_steal(False)
+                    self.flush_buffers()
+
+    def update(self, old_key: int, record: DataRecord) -> bool:
+        # Replaces the record of old_key with the given one and returns whether there was one. With the same key the
+        # record is replaced in place, like by update_value. Otherwise only the index record moves to the new key, the
+        # data record is replaced in its data page and stays there if it fits.
+        self.check_key(record.key)
         if self.root_page is None:
-            print("B-Tree is empty!")
-            return
+            self.print_message("B-Tree is empty!")
+            return False
 
-        root_node = self.filesHandler.get_index_page(self.root_page)
-        data_page_number = self.remove_from_node(key, root_node)
+        self.begin_operation("update")
+        updated = False
+        try:
+            if record.key == old_key:
+                updated = self.run_latched(self.replace_record, record)
+                if not updated:
+                    self.print_message(f"No record with key {old_key}!")
+                return updated
+
+            with self.latch.exclusive():
+                if not self.may_hold(old_key) or self.locate(old_key)[0] is None:
+                    self.print_message(f"No record with key {old_key}!")
+                elif self.may_hold(record.key) and self.locate(record.key)[0] is not None:
+                    self.print_message("Record already exists!")
+                else:
+                    index_record = self.move_record(self.remove_from_node(self.find_path(old_key)), record)
+                    if self.root_page is None:
+                        self.create_root()
+                    self.add_key(record.key)
+                    self.insert_into_node(index_record, self.find_path(record.key))
+                    updated = True
+        finally:
+            self.end_operation(print_reads_and_writes=updated)
+
+        return updated
+
+    def update_value(self, key: int, data: str) -> bool:
+        # Replaces data of the record in its data page. The index is written only when the data no longer fits in
+        # the page and the record is moved to another one.
+        if self.root_page is None:
+            self.print_message("B-Tree is empty!")
+            return False
 
-        if data_page_number:
-            self.filesHandler.remove_record_from_data_file(data_page_number, key)
-            self.filesHandler.flush_buffers()
-            self.print_reads_and_writes()
-        else:
-            print(f"No record with key {key}!")
+        self.begin_operation("update_value")
+        updated = False
+        try:
+            updated = self.run_latched(self.replace_record, DataRecord(key, data))
+            if not updated:
+                self.print_message(f"No record with key {key}!")
+        finally:
+            self.end_operation(print_reads_and_writes=updated)
+
+        return updated
+
+    def upsert(self, record: DataRecord) -> bool:
+        # Inserts the record or replaces the one with the same key, with a single descent. Returns True when the record
+        # was inserted and False when it replaced another one.
+        self.check_key(record.key)
+        self.begin_operation("upsert")
+        inserted = False
+        try:
+            inserted = self.run_latched(self.upsert_record, record)
+        finally:
+            self.end_operation()
 
-    def update(self, old_key: int, record: DataRecord) -> None:
-        self.remove(old_key)
-        self.insert(record)
+        return inserted
 
-    def print(self, print_records: bool = False) -> None:
-        if self.root_page is not None:
+    def bulk_load(self, records, fill_factor: float = 1.0, run_size: int | None = None) -> int:
+        # Builds the tree bottom-up from records, which have to be sorted by key to avoid the external sort.
+        self.check_writable()
+        self.filesHandler.reset_io_counters()
+
+        self.metrics.begin_operation("bulk_load")
+        try:
+            with self.latch.exclusive():
+                with self.filesHandler.unlogged():
+                    count = self.bulk_loader_class(self, fill_factor, run_size).load(records)
+
+                self.flush_buffers()
+                if self.key_filter is not None:
+                    self.rebuild_key_filter()
+        finally:
+            self.metrics.end_operation()
+        self.print_reads_and_writes()
+        return count
+
+    def vacuum(self) -> (int, int):
+        # Moves records and overflow pages from the last data pages to free space in the first ones and index pages
+        # from the end of the index file to free pages before them, then cuts both files after the last page in use.
+        # Every page is emptied by a separate operation, so a crash in the middle leaves a consistent tree.
+        # Returns numbers of moved records and moved index pages.
+        self.check_writable()
+        self.filesHandler.reset_io_counters()
+        self.metrics.begin_operation("vacuum")
+        try:
+            with self.latch.exclusive():
+                self.flush_buffers()
+
+                moved_records = self.compact_data_pages(self.count_needed_data_pages())
+                self.checkpoint()
+                self.filesHandler.truncate_data_file(self.filesHandler.count_data_pages_in_use())
+
+                index_pages = self.filesHandler.index_next_page - 1 - self.filesHandler.index_space.get_free_count()
+                moved_pages = self.compact_index_pages(index_pages)
+                self.checkpoint()
+                self.filesHandler.truncate_index_file(index_pages)
+
+                self.flush_buffers()
+                if self.key_filter is not None:
+                    # Removed keys are dropped from the filter.
+                    self.rebuild_key_filter()
+        finally:
+            self.metrics.end_operation()
+        self.print_message(f"Moved {moved_records} records and {moved_pages} index pages.")
+        self.print_reads_and_writes()
+        return moved_records, moved_pages
+
+    def read_snapshot(self, operation, *arguments):
+        # For a tree open read-only while another process writes it. Runs the operation, e.g. a lookup or a list
+        # of records of a range, on the last state of the tree the writer published and returns its result. When
+        # the writer changes the files meanwhile, reading the next page fails, see FilesHandler.get_page_image, and
+        # the operation is run again on the new state. After FilesHandler.snapshot_attempts runs the reader holds
+        # the writer off, so that an operation taking longer than the writer takes between two states still ends.
+        attempts = 0
+        while True:
+            attempts += 1
+            hold = contextlib.nullcontext()
+            if attempts > FilesHandler.snapshot_attempts:
+                hold = self.filesHandler.hold_snapshot()
+            with hold:
+                with self.latch.exclusive():
+                    version = self.filesHandler.refresh_snapshot()
+                    self.root_page = self.filesHandler.catalog.root_page
+                    self.h = self.filesHandler.catalog.h
+
+                try:
+                    return operation(*arguments)
+                except ValueError:
+                    if self.filesHandler.is_snapshot_current(version):
+                        raise
+
+    def cursor(self, key: int | None = None) -> Cursor:
+        return self.cursor_class(self, key)
+
+    def range(self, low: int, high: int):
+        # Yields records with keys from low to high inclusive, in key order. Its measured latency includes the time
+        # the caller takes between records. Every batch of records is read holding the tree latch shared, which is
+        # released before they are yielded, and the next batch is sought from the key after the last one.
+        if not self.batch_depth:
             self.filesHandler.reset_io_counters()
 
-            root_node = self.filesHandler.get_index_page(self.root_page)
-            self.visit_node(root_node, print_records)
+        self.metrics.begin_operation("range")
+        try:
+            while low <= high:
+                with self.latch.shared():
+                    batch = []
+                    cursor = self.cursor_class(self, low, latched=True)
+                    try:
+                        while len(batch) < BTree.range_batch_size:
+                            index_record = cursor.next_index_record()
+                            if index_record is None or index_record.key > high:
+                                break
+                            batch.append(index_record)
+                    finally:
+                        cursor.close()
+                    data_records = self.get_data_records(batch)
+
+                yield from data_records
+                if len(batch) < BTree.range_batch_size:
+                    break
+                low = batch[-1].key + 1
+        finally:
+            self.metrics.end_operation()
+
+    def print(self, print_records: bool = False) -> None:
+        with self.latch.exclusive():
+            if self.root_page is not None:
+                self.filesHandler.reset_io_counters()
 
-            print()
-            self.filesHandler.flush_buffers()
-            self.print_reads_and_writes()
-        else:
-            print("B-Tree is empty!")
+                root_node = self.filesHandler.get_index_page(self.root_page)
+                self.visit_node(root_node, print_records)
+
+                print()
+                self.flush_buffers()
+                self.print_reads_and_writes()
+            else:
+                print("B-Tree is empty!")
+
+    def check_structure(self) -> int:
+        # Checks the invariants of the tree and returns the number of its records. Keys of every page are sorted and
+        # lie between the keys that lead to the page, pages other than the root are neither overflown nor underflown,
+        # all leaves are at height h and every index record has its data record. Raises ValueError at the first
+        # violation found.
+        with self.latch.exclusive():
+            if self.root_page is None:
+                return 0
+
+            leaf_depths = set()
+            records = self.check_page(self.root_page, None, None, 1, leaf_depths)
+            if leaf_depths != {self.h}:
+                raise ValueError(f"Leaves are at depths {sorted(leaf_depths)} in a tree of height {self.h}!")
+            return records
+
+    @staticmethod
+    def check_key(key: int) -> None:
+        # Keys are stored in 4 bytes and the largest one marks a missing key. A key out of range is rejected before
+        # anything changes, as a page holding it could not be written and would stay dirty in the buffers.
+        if not 0 <= key < DataRecord.null_byte_key:
+            raise ValueError(f"Key {key} is out of range 0..{DataRecord.null_byte_key - 1}!")
+
+    def find_path(self, key: int, latch: bool | None = None) -> [(IndexPage, int)]:
+        # Returns (page, position) pairs from the root to the page holding the key or, if there is none, to the leaf
+        # where it belongs. The position is the child taken in the pages above and the position of the key in the
+        # last page. Pages have no parent pointers, the path is what changes to a page are carried up along.
+        # With latch given, a leaf on the path is latched, exclusively if it is True, see latch_page. Holding the tree
+        # latch exclusively no leaf needs it.
+        path = []
+        page_number = self.root_page
+        while True:
+            node = self.filesHandler.get_index_page(page_number)
+            if latch is not None and node.is_leaf() and not self.latch.is_owned():
+                node = self.latch_page(page_number, latch)
+            i = node.find_position(key)
+            path.append((node, i))
+            if node.is_leaf() or (i < len(node.records) and node.get_key(i) == key):
+                return path
+
+            page_number = node.get_pointer(i)
 
 # private:
-    def create_root(self, record: IndexRecord | None = None, new_child_pointer: int | None = None) -> IndexPage:
-        self.h += 1
-        previous_root = None
-        if self.root_page is not None:
-            previous_root = self.filesHandler.get_index_page(self.root_page)
+    @staticmethod
+    def load_catalog(catalog_filename: str, read_only: bool) -> Catalog:
+        # A reader can find the catalog in the middle of being rewritten by the writer and then reads it again. Only
+        # what never changes is taken from it here.
+        deadline = time.monotonic() + FilesHandler.snapshot_timeout
+        while True:
+            try:
+                return Catalog.load(catalog_filename)
+            except ValueError:
+                if not read_only or time.monotonic() > deadline:
+                    raise
+                time.sleep(FilesHandler.snapshot_retry_interval)
+
+    def open_key_filter(self, enabled: bool, create: bool) -> None:
+        # A saved filter is taken and its file removed at once, so that a filter missing keys inserted after it was
+        # saved is never found after a crash, nor after the tree was changed without it. The filter is then rebuilt
+        # by a scan. Readers use none, as keys change behind their back.
+        if self.filesHandler.read_only:
+            return
 
-        root_node = self.filesHandler.create_new_index_page()
-        self.root_page = root_node.page_number
+        key_filter = None if create else KeyFilter.load(self.key_filter_filename)
+        if os.path.exists(self.key_filter_filename):
+            os.remove(self.key_filter_filename)
+        if enabled:
+            self.key_filter = key_filter
+            if key_filter is None:
+                self.rebuild_key_filter()
+
+    def rebuild_key_filter(self) -> None:
+        # Scans the keys into a new filter with room for as many more. No other thread may use the tree meanwhile.
+        keys = []
+        cursor = self.cursor_class(self)
+        try:
+            index_record = cursor.next_index_record()
+            while index_record is not None:
+                keys.append(index_record.key)
+                index_record = cursor.next_index_record()
+        finally:
+            cursor.close()
+
+        key_filter = KeyFilter(2 * len(keys))
+        for key in keys:
+            key_filter.add(key)
+        self.key_filter = key_filter
+
+    def may_hold(self, key: int) -> bool:
+        # False only when the key is surely not in the tree.
+        if self.key_filter is None or self.key_filter.may_contain(key):
+            return True
+        self.metrics.count("key_filter_skips")
+        return False
 
-        if record and new_child_pointer and previous_root:
-            root_node.add_record(0, record)
-            root_node.add_pointer(0, previous_root.page_number)
-            root_node.add_pointer(1, new_child_pointer)
-            self.update_parent([previous_root.page_number, new_child_pointer], root_node.page_number)
+    def add_key(self, key: int) -> None:
+        # Called before the key is inserted, so a thread that finds the key in the tree finds it in the filter too.
+        if self.key_filter is not None:
+            self.key_filter.add(key)
 
-        return root_node
+    @staticmethod
+    def holds_key(path: [(IndexPage, int)], key: int) -> bool:
+        # Whether the path found by find_path ends at the record with the given key.
+        node, i = path[-1]
+        return i < len(node.records) and node.get_key(i) == key
+
+    def run_latched(self, operation, *arguments):
+        # Runs the operation holding the tree latch shared, so that operations of other threads run along. Then it
+        # may change only the leaf it latched, an operation that would change more returns None and is run again
+        # holding the tree latch exclusively. When no other thread holds the latch, the operation takes it
+        # exclusively at once and runs only once, without leaf latches.
+        if self.latch.acquire_exclusive(blocking=False):
+            try:
+                return operation(*arguments, exclusive=True)
+            finally:
+                self.latch.release_exclusive()
+
+        with self.latch.shared():
+            result = operation(*arguments, exclusive=False)
+        if result is not None:
+            return result
+
+        with self.latch.exclusive():
+            return operation(*arguments, exclusive=True)
+
+    def insert_record(self, record: DataRecord, exclusive: bool) -> bool | None:
+        # Returns False when the key exists, see run_latched for None.
+        if self.root_page is None:
+            if not exclusive:
+                return None
+            self.create_root()
+
+        with self.latched_path(record.key, exclusive=True) as path:
+            if self.holds_key(path, record.key):
+                return False
+            if not exclusive and not self.has_room(path[-1][0]):
+                return None
+
+            # The data record is written only once the key is known to be new.
+            self.add_key(record.key)
+            self.insert_into_node(self.store_record(record), path)
+            return True
+
+    def remove_record(self, key: int, exclusive: bool) -> bool | None:
+        if self.root_page is None or not self.may_hold(key):
+            return False
+
+        with self.latched_path(key, exclusive=True) as path:
+            if not self.holds_key(path, key):
+                return False
+            if not exclusive and not self.can_remove_from(path[-1][0]):
+                return None
 
-    def insert_into_node(self, record: IndexRecord, node: IndexPage) -> (IndexRecord | None, int | None):
-        i = self.find_position(node, record.key)
+            self.drop_record(self.remove_from_node(path))
+            return True
 
-        if i < len(node.records) and node.get_key(i) == record.key:
-            raise ValueError
+    def replace_record(self, record: DataRecord, exclusive: bool) -> bool | None:
+        # Returns whether there was a record with the key to replace.
+        if self.root_page is None or not self.may_hold(record.key):
+            return False
 
+        with self.latched_path(record.key, exclusive=True) as path:
+            if not self.holds_key(path, record.key):
+                return False
+            node, i = path[-1]
+            if not exclusive and not node.is_leaf():
+                return None
+
+            self.replace_data_record(node, i, record)
+            return True
+
+    def upsert_record(self, record: DataRecord, exclusive: bool) -> bool | None:
+        # Returns whether the record was inserted.
+        if self.root_page is None:
+            if not exclusive:
+                return None
+            self.create_root()
+
+        with self.latched_path(record.key, exclusive=True) as path:
+            node, i = path[-1]
+            if self.holds_key(path, record.key):
+                if not exclusive and not node.is_leaf():
+                    return None
+                self.replace_data_record(node, i, record)
+                return False
+
+            if not exclusive and not self.has_room(node):
+                return None
+            self.add_key(record.key)
+            self.insert_into_node(self.store_record(record), path)
+            return True
+
+    def read_record(self, key: int) -> DataRecord | None:
+        # The tree latch has to be held.
+        if self.root_page is None or not self.may_hold(key):
+            return None
+
+        with self.latched_path(key) as path:
+            if not self.holds_key(path, key):
+                return None
+            node, i = path[-1]
+            return self.read_data_record(node.get_record(i))
+
+    @contextlib.contextmanager
+    def latched_path(self, key: int, exclusive: bool = False):
+        # Yields the path found by find_path with its leaf latched until the block ends.
+        path = self.find_path(key, latch=exclusive)
+        try:
+            yield path
+        finally:
+            if path[-1][0].is_leaf():
+                self.unlatch_page(path[-1][0].page_number, exclusive)
+
+    def latch_page(self, page_number: int, exclusive: bool = False) -> IndexPage:
+        # Latches the page, unless the tree latch is held exclusively, and takes it from the buffer again, as another
+        # thread could have changed it before it was latched.
+        if not self.latch.is_owned():
+            self.filesHandler.get_index_latch(page_number).acquire(exclusive)
+        return self.filesHandler.get_index_page(page_number)
+
+    def unlatch_page(self, page_number: int, exclusive: bool = False) -> None:
+        if not self.latch.is_owned():
+            self.filesHandler.get_index_latch(page_number).release(exclusive)
+
+    def has_room(self, node: IndexPage) -> bool:
+        return len(node.records) < 2 * self.d
+
+    def can_remove_from(self, node: IndexPage) -> bool:
+        # Whether removing a record from the page changes no other page: the page is a leaf that does not underflow,
+        # or the root leaf that does not become empty.
         if not node.is_leaf():
-            node_page_number = node.page_number
+            return False
+        if node.page_number == self.root_page:
+            return len(node.records) > 1
+        return self.can_lend(node)
 
-            record, new_child_pointer = self.insert_into_node(record, self.filesHandler.get_index_page(node.get_pointer(i)))
+    def can_lend(self, node: IndexPage) -> bool:
+        return len(node.records) > self.d
 
-            node = self.filesHandler.get_index_page(node_page_number)
+    def store_record(self, record: DataRecord) -> IndexRecord:
+        # Writes the data record, returns the index record pointing to it.
+        return IndexRecord(record.key, self.filesHandler.add_record_to_data_file(record))
 
-            if new_child_pointer:
-                if len(node.records) < 2 * self.d:
-                    node.add_record(i, record)
-                    node.add_pointer(i + 1, new_child_pointer)
-                else:
-                    can_compensation = self.try_compensation(node, record, new_child_pointer)
-                    if not can_compensation:
-                        record, new_child_pointer = self.split(node, i, record, new_child_pointer)
-                        return record, new_child_pointer
-        else:
-            if len(node.records) < 2 * self.d:
-                node.add_record(i, record)
-            else:
-                can_compensation = self.try_compensation(node, record)
-                if not can_compensation:
-                    record, new_child_pointer = self.split(node, i, record)
-                    return record, new_child_pointer
+    def drop_record(self, index_record: IndexRecord) -> None:
+        # Removes the data record of the index record taken out of the tree.
+        self.filesHandler.remove_record_from_data_file(index_record.data_page_number, index_record.key)
 
-        return None, None
+    def move_record(self, index_record: IndexRecord, record: DataRecord) -> IndexRecord:
+        # Replaces the data record of the index record taken out of the tree with the record, whose key differs,
+        # returns the index record pointing to it.
+        return IndexRecord(record.key, self.filesHandler.update_record_in_data_file(index_record.data_page_number,
+                                                                                    index_record.key, record))
 
-    @staticmethod
-    def find_position(node: IndexPage, key: int) -> int:
-        i = len(node.records) - 1
-        while i >= 0 and key < node.get_key(i):
-            i -= 1
+    def read_data_record(self, index_record: IndexRecord) -> DataRecord | None:
+        return self.filesHandler.get_data_record(index_record.data_page_number, index_record.key)
 
-        if 0 <= i < len(node.records) and node.get_key(i) == key:
-            return i
-        else:
-            return i + 1
-
-    def try_compensation(self, node: IndexPage, record: IndexRecord, pointer: int | None = None) -> bool:
-        can_compensate = False
-        if node.get_parent():
-            parent_node = self.filesHandler.get_index_page(node.get_parent())
-            index = parent_node.pointers.index(node.page_number)
-            if index - 1 >= 0:
-                left_neighbour = self.filesHandler.get_index_page(parent_node.get_pointer(index - 1))
-                if len(left_neighbour.records) < 2 * self.d:
-                    self.compensation(left_neighbour, node, parent_node, index - 1, record, pointer)
-                    can_compensate = True
-                else:
-                    self.filesHandler.reduce_usage(left_neighbour)
-            if index + 1 < len(parent_node.pointers) and not can_compensate:
-                right_neighbour = self.filesHandler.get_index_page(parent_node.get_pointer(index + 1))
-                if len(right_neighbour.records) < 2 * self.d:
-                    self.compensation(node, right_neighbour, parent_node, index, record, pointer)
-                    can_compensate = True
-                else:
-                    self.filesHandler.reduce_usage(right_neighbour)
+    def replace_data_record(self, node: IndexPage, i: int, record: DataRecord) -> None:
+        # Replaces the data record of the index record i of the node, which is changed only if the data record moves.
+        data_page_number = self.filesHandler.update_record_in_data_file(node.get_data_page_number(i), record.key,
+                                                                        record)
+        if data_page_number != node.get_data_page_number(i):
+            node.set_record(i, IndexRecord(record.key, data_page_number))
 
-        return can_compensate
+    def create_root(self, record: IndexRecord | None = None, new_child_pointer: int | None = None) -> IndexPage:
+        # Without arguments creates an empty root of an empty tree, otherwise a root above the old one.
+        self.metrics.count("root_changes")
+        self.h += 1
+        root_node = self.filesHandler.create_new_index_page()
+
+        if record is not None:
+            root_node.set_records([record])
+            root_node.set_pointers([self.root_page, new_child_pointer])
+
+        self.root_page = root_node.page_number
+        return root_node
 
+    @traced("insert_into_node")
+    def insert_into_node(self, record: IndexRecord, path: [(IndexPage, int)]) -> None:
+        # Inserts the record at the end of the path from the root to a leaf. A full page gives records to a neighbour
+        # or is split, then the record going up is inserted into the page above it on the path.
+        pointer = None
+        for level in range(len(path) - 1, -1, -1):
+            node, i = path[level]
+            if len(node.records) < 2 * self.d:
+                node.add_record(i, record)
+                if pointer is not None:
+                    node.add_pointer(i + 1, pointer)
+                return
+
+            parent, parent_i = path[level - 1] if level > 0 else (None, 0)
+            if parent is not None and self.try_compensation(node, parent, parent_i, record, pointer):
+                return
+
+            record, pointer = self.split(node, i, record, pointer)
+
+        self.create_root(record, pointer)
+
+    def try_compensation(self, node: IndexPage, parent: IndexPage, i: int, record: IndexRecord,
+                         pointer: int | None = None) -> bool:
+        # The node is the child i of the parent.
+        if i - 1 >= 0:
+            left_neighbour = self.filesHandler.get_index_page(parent.get_pointer(i - 1))
+            if len(left_neighbour.records) < 2 * self.d:
+                self.compensation(left_neighbour, node, parent, i - 1, record, pointer)
+                return True
+            self.filesHandler.reduce_usage(left_neighbour)
+
+        if i + 1 < len(parent.pointers):
+            right_neighbour = self.filesHandler.get_index_page(parent.get_pointer(i + 1))
+            if len(right_neighbour.records) < 2 * self.d:
+                self.compensation(node, right_neighbour, parent, i, record, pointer)
+                return True
+            self.filesHandler.reduce_usage(right_neighbour)
+
+        return False
+
+    @traced("compensation", "compensations")
     def compensation(self, left_child: IndexPage, right_child: IndexPage, parent: IndexPage, i: int, record: IndexRecord, pointer: int | None = None) -> None:
         # Pointer parameter is necessary only for non-leaf nodes.
         # This function is called after verifying that compensation is possible.
@@ -169,10 +734,7 @@ class BTree:
         records_distribution_list = left_child.get_records() + [parent.get_record(i)] + right_child.get_records()
 
         # Also add the new record to be added in the appropriate place in this list.
-        j = len(records_distribution_list) - 1
-        while j >= 0 and record.key < records_distribution_list[j].key:
-            j -= 1
-        j += 1
+        j = bisect.bisect_right(records_distribution_list, record.key, key=IndexPage.record_key)
 
         records_distribution_list.insert(j, record)
 
@@ -192,9 +754,8 @@ class BTree:
         pointers_distribution_list.insert(j + 1, pointer)
         left_child.set_pointers(pointers_distribution_list[0:middle + 1])
         right_child.set_pointers(pointers_distribution_list[middle + 1:])
-        self.update_parent(pointers_distribution_list[0:middle + 1], left_child.page_number)
-        self.update_parent(pointers_distribution_list[middle + 1:], right_child.page_number)
 
+    @traced("split", "splits")
     def split(self, node: IndexPage, index: int, record: IndexRecord, pointer: int | None = None) -> (IndexRecord, int):
         new_node = self.filesHandler.create_new_index_page()
 
@@ -204,24 +765,17 @@ class BTree:
         record_for_parent = node.get_record(middle)
 
         new_node.set_records(node.get_records(middle+1))
-        new_node.set_parent(node.get_parent())
         node.set_records(node.get_records(0, middle))
 
         if not node.is_leaf():
             node.add_pointer(index + 1, pointer)
-            pointers = node.get_pointers(middle + 1)
-            new_node.set_pointers(pointers)
+            new_node.set_pointers(node.get_pointers(middle + 1))
             node.set_pointers(node.get_pointers(0, middle + 1))
-            self.update_parent(pointers, new_node.page_number)
 
         return record_for_parent, new_node.page_number
 
-    def update_parent(self, children_pointers: [int], parent_page: int) -> None:
-        for child_page in children_pointers:
-            child_node = self.filesHandler.get_index_page(child_page)
-            child_node.set_parent(parent_page)
-
     def visit_node(self, node: IndexPage, print_records: bool = False) -> None:
+        self.prefetch_node(node, print_records)
         if not print_records:
             print("( ", end="")
 
@@ -232,8 +786,7 @@ class BTree:
             if not print_records:
                 print(node.get_key(i), end=" ")
             else:
-                data_page = self.filesHandler.get_data_page(node.get_data_page_number(i))
-                data_page.print_record(node.get_key(i))
+                self.print_data_record(node.get_record(i))
 
         if not node.is_leaf():
             self.visit_node(self.filesHandler.get_index_page(node.get_pointer(len(node.records))), print_records)
@@ -241,96 +794,306 @@ class BTree:
         if not print_records:
             print(") ", end="")
 
-    def search_by_key(self, key: int, page: int) -> bool:
-        if page is None or self.root_page is None:
-            return False
-
-        node = self.filesHandler.get_index_page(page)
+    def print_data_record(self, index_record: IndexRecord) -> None:
+        data_record = self.read_data_record(index_record)
+        if data_record is not None:
+            print(data_record)
+
+    def check_page(self, page_number: int, low: int | None, high: int | None, depth: int, leaf_depths: set) -> int:
+        # Checks the subtree of the page, whose keys lie between low and high, see check_structure. Returns the
+        # number of its records.
+        node = self.filesHandler.get_index_page(page_number)
+        self.prefetch_node(node, True)
+        keys = [record.key for record in node.records]
+        if any(keys[i] >= keys[i + 1] for i in range(len(keys) - 1)):
+            raise ValueError(f"Keys of page {page_number} are not sorted!")
+        if any(not self.key_in_bounds(key, low, high) for key in keys):
+            raise ValueError(f"Keys of page {page_number} are out of range {low}..{high}!")
+        if self.is_overflown(node) or (page_number != self.root_page and self.is_underflown(node)):
+            raise ValueError(f"Page {page_number} holds {len(keys)} records!")
+
+        records = 0
+        if self.holds_data(node):
+            for record in node.records:
+                if self.read_data_record(record) is None:
+                    raise ValueError(f"Record {record.key} is missing from data page {record.data_page_number}!")
+            records = len(keys)
 
-        i = 0
-        while i < len(node.records) and key > node.get_key(i):
-            i += 1
+        if node.is_leaf():
+            leaf_depths.add(depth)
+            return records
+
+        if len(node.pointers) != len(keys) + 1:
+            raise ValueError(f"Page {page_number} has {len(node.pointers)} children and {len(keys)} keys!")
+        bounds = [low] + keys + [high]
+        for i, pointer in enumerate(node.get_pointers()):
+            records += self.check_page(pointer, bounds[i], bounds[i + 1], depth + 1, leaf_depths)
+        return records
+
+    def prefetch_node(self, node: IndexPage, with_data: bool) -> None:
+        # A traversal of the subtree reads the children of the node next and, with_data, the data pages of its
+        # records, which are asked for while the traversal goes on, see FilesHandler.prefetch_index_pages.
+        if not node.is_leaf():
+            self.filesHandler.prefetch_index_pages(node.get_pointers())
+        if with_data and self.holds_data(node):
+            self.filesHandler.prefetch_data_pages(record.data_page_number for record in node.records)
 
-        if i < len(node.records) and key == node.get_key(i):
-            return True
+    @staticmethod
+    def holds_data(node: IndexPage) -> bool:
+        # Whether records of the page point to data records.
+        return True
 
-        if node.is_leaf():
-            return False
+    @staticmethod
+    def key_in_bounds(key: int, low: int | None, high: int | None) -> bool:
+        # Keys of a subtree lie strictly between the records around its pointer.
+        return (low is None or low < key) and (high is None or key < high)
+
+    def get_data_records(self, index_records: [IndexRecord]) -> [DataRecord]:
+        # Records sharing a data page are taken from it with a single page access. A record missing from its page
+        # was moved or removed by another thread after its leaf was unlatched, so it is looked up again.
+        data_records = {}
+        data_page_numbers = sorted({index_record.data_page_number for index_record in index_records})
+        self.filesHandler.prefetch_data_pages(data_page_numbers)
+        for data_page_number in data_page_numbers:
+            for data_record in self.filesHandler.get_data_page_records(data_page_number):
+                data_records.setdefault((data_page_number, data_record.key), data_record)
+
+        result = []
+        for index_record in index_records:
+            data_record = data_records.get((index_record.data_page_number, index_record.key))
+            if data_record is None:
+                data_record = self.read_record(index_record.key)
+            if data_record is not None:
+                result.append(data_record)
+        return result
+
+    def locate(self, key: int) -> (IndexPage | None, int):
+        # Returns the page holding the index record with the given key and the record position in it.
+        if self.root_page is None:
+            return None, 0
+
+        path = self.find_path(key)
+        if self.holds_key(path, key):
+            return path[-1]
+        return None, 0
+
+    def find_parent(self, node: IndexPage) -> IndexPage | None:
+        # Pages have no parent pointers, the parent is found on the path to the first key of the page.
+        path = self.find_path(node.get_key(0))
+        for level, (page, _) in enumerate(path):
+            if page.page_number == node.page_number:
+                return path[level - 1][0] if level > 0 else None
+
+        raise ValueError("This exception should never occur!")
+
+    def relink_moved_page(self, node: IndexPage) -> None:
+        # Only the parent refers to a page of the B-Tree layout, which is changed by the caller.
+        pass
+
+    def count_needed_data_pages(self) -> int:
+        # Number of data pages enough to hold all records and overflow pages, if they were packed tightly.
+        capacity = self.filesHandler.data_page_capacity
+        pages = self.filesHandler.data_next_page - 1
+        used = pages * capacity - self.filesHandler.data_space.get_total()
+        return -(-used // capacity)
+
+    def compact_data_pages(self, last_page: int) -> int:
+        # Moves records from pages after last_page to free space in pages up to it and overflow pages to empty pages
+        # up to it. Whatever does not fit anywhere stays where it is.
+        destinations = self.filesHandler.data_space.get_free_pages(last_page)
+
+        moved = 0
+        for page_number in range(self.filesHandler.data_next_page - 1, last_page, -1):
+            self.begin_operation("vacuum")
+            try:
+                if self.filesHandler.get_data_page(page_number).is_overflow():
+                    self.move_overflow_page(page_number, destinations)
+                else:
+                    moved += self.move_data_records(page_number, destinations)
+            finally:
+                self.end_operation(print_reads_and_writes=False)
+
+        return moved
+
+    def move_data_records(self, page_number: int, destinations: [int]) -> int:
+        # Pages are taken from the buffer whenever they are used, as freeing overflow pages can evict them.
+        moved = 0
+        for key in sorted({record.key for record in self.filesHandler.get_data_page(page_number).records}):
+            # A record which no index record points to is left over by a failed insert, it is dropped. So are later
+            # records with the same key, which are never read.
+            record = None
+            node, i = self.locate(key)
+            if node is not None and node.get_data_page_number(i) == page_number:
+                record = self.filesHandler.get_data_page(page_number).remove_record(key)
+            while self.filesHandler.get_data_page(page_number).get_record(key) is not None:
+                self.filesHandler.remove_record_from_data_file(page_number, key)
+            if record is None:
+                continue
+
+            while destinations and self.filesHandler.data_space.get(destinations[0]) <= DataPage.slot_size:
+                destinations.pop(0)
+            size = DataPage.get_record_size(record)
+            destination_number = next((destination for destination in destinations
+                                       if self.filesHandler.data_space.get(destination) >= size), page_number)
+
+            # So is a record with the same key on the destination page, which would hide the moved one.
+            while self.filesHandler.get_data_page(destination_number).get_record(key) is not None:
+                self.filesHandler.remove_record_from_data_file(destination_number, key)
+
+            destination = self.filesHandler.get_data_page(destination_number)
+            destination.add_record(record)
+            self.filesHandler.update_data_space(destination)
+            self.filesHandler.update_data_space(self.filesHandler.get_data_page(page_number))
+            if destination_number != page_number:
+                node.set_record(i, IndexRecord(key, destination_number))
+                moved += 1
+
+        return moved
+
+    def move_overflow_page(self, page_number: int, destinations: [int]) -> None:
+        overflow_page = self.filesHandler.get_data_page(page_number)
+        holder_number = self.find_overflow_holder(overflow_page)
+        destination_number = self.find_empty_data_page(destinations)
+        if holder_number is None or destination_number is None:
+            return
 
-        return self.search_by_key(key, node.get_pointer(i))
+        self.filesHandler.move_overflow_page(overflow_page, destination_number)
+        holder = self.filesHandler.get_data_page(holder_number)
+        if holder.is_overflow():
+            holder.set_next_page(destination_number)
+        else:
+            holder.set_overflow_page(overflow_page.key, destination_number)
 
-    def remove_from_node(self, key: int, node: IndexPage) -> int | None:
-        i = self.find_position(node, key)
+    def find_empty_data_page(self, destinations: [int]) -> int | None:
+        return next((destination for destination in destinations
+                     if self.filesHandler.data_space.get(destination) == self.filesHandler.data_page_capacity), None)
 
-        if node.is_leaf() and i < len(node.records) and node.get_key(i) == key:
-            data_page_number = node.get_data_page_number(i)
-            self.remove_from_leaf(node, i)
-            return data_page_number
-        elif not node.is_leaf() and i < len(node.records) and node.get_key(i) == key:
-            data_page_number = node.get_data_page_number(i)
-            self.remove_from_internal_node(node, i)
-            return data_page_number
-        elif node.is_leaf() and (i > len(node.records) or (i < len(node.records) and node.get_key(i) != key)):
+    def find_overflow_holder(self, overflow_page: OverflowPage) -> int | None:
+        # Returns the number of the data page of the record pointing to the overflow page or of the overflow page
+        # before it in the chain. Overflow pages left over by a failed insert belong to no record found that way.
+        node, i = self.locate(overflow_page.key)
+        if node is None:
             return None
-        else:
-            return self.remove_from_node(key, self.filesHandler.get_index_page(node.get_pointer(i)))
-
-    def remove_from_leaf(self, node: IndexPage, i: int) -> None:
-        node.remove_record(node.get_record(i))
-        self.repair_node_after_removal(self.filesHandler.get_index_page(node.page_number))
-
-    def repair_node_after_removal(self, node: IndexPage) -> None:
-        if node.page_number != self.root_page and len(node.records) < self.d:
-            can_compensate = self.try_compensation_for_remove(node)
-            if not can_compensate:
-                parent_node = self.filesHandler.get_index_page(node.get_parent())
-                i = parent_node.pointers.index(node.page_number)
-                if i + 1 < len(parent_node.pointers):
-                    right_neighbour = self.filesHandler.get_index_page(parent_node.get_pointer(i + 1))
-                    self.merge(node, right_neighbour, parent_node, i)
-                elif i - 1 >= 0:
-                    left_neighbour = self.filesHandler.get_index_page(parent_node.get_pointer(i - 1))
-                    self.merge(left_neighbour, node, parent_node, i - 1)
-                else:
-                    raise ValueError("This exception should never occur!")
-        elif node.page_number == self.root_page:
-            if len(node.records) == 0:
-                if not node.is_leaf():
-                    self.root_page = node.get_pointer(0)
-                    node.set_records([])
-                    node.set_pointers([])
-                    node.set_parent(None)
-                    self.update_parent([self.root_page], None)
+
+        holder_number = node.get_data_page_number(i)
+        record = self.filesHandler.get_data_page(holder_number).get_record(overflow_page.key)
+        next_page = record.overflow_page if record is not None else None
+        while next_page is not None and next_page != overflow_page.page_number:
+            holder_number = next_page
+            holder = self.filesHandler.get_data_page(holder_number)
+            next_page = holder.next_page if holder.is_overflow() else None
+
+        return holder_number if next_page is not None else None
+
+    def compact_index_pages(self, last_page: int) -> int:
+        destinations = self.filesHandler.index_space.get_free_pages(last_page)
+
+        moved = 0
+        for page_number in range(self.filesHandler.index_next_page - 1, last_page, -1):
+            if self.filesHandler.index_space.get(page_number):
+                continue
+
+            self.begin_operation("vacuum")
+            try:
+                node = self.filesHandler.get_index_page(page_number)
+                parent = self.find_parent(node)
+                moved_node = self.filesHandler.move_index_page(node, destinations.pop(0))
+                if parent is None:
+                    self.root_page = moved_node.page_number
                 else:
-                    self.root_page = None
+                    parent.set_pointer(parent.pointers.index(page_number), moved_node.page_number)
+                self.relink_moved_page(moved_node)
+                moved += 1
+            finally:
+                self.end_operation(print_reads_and_writes=False)
 
-                self.h -= 1
+        return moved
 
-    def try_compensation_for_remove(self, node: IndexPage) -> bool:
-        can_compensate = False
-        if not node.get_parent():
-            return can_compensate
+    def collect_index_records(self, page: int, keys: [int], index_records: dict) -> None:
+        # Adds index records of the sorted keys to index_records, going down to every child page only once for all
+        # keys belonging under it.
+        node = self.filesHandler.get_index_page(page)
+        if node.is_leaf():
+            self.collect_leaf_records(page, keys, index_records)
+            return
 
-        parent_node = self.filesHandler.get_index_page(node.get_parent())
-        index = parent_node.pointers.index(node.page_number)
-        if index - 1 >= 0:
-            left_neighbour = self.filesHandler.get_index_page(parent_node.get_pointer(index - 1))
-            if len(left_neighbour.records) > self.d:
-                self.compensate_with_left_neighbour(node, left_neighbour, parent_node, index - 1)
-                can_compensate = True
+        child_keys = {}
+        for key in keys:
+            i = node.find_position(key)
+            if i < len(node.records) and key == node.get_key(i):
+                index_records[key] = node.get_record(i)
             else:
-                self.filesHandler.reduce_usage(left_neighbour)
+                child_keys.setdefault(i, []).append(key)
 
-        if not can_compensate and index + 1 < len(parent_node.pointers):
-            right_neighbour = self.filesHandler.get_index_page(parent_node.get_pointer(index + 1))
+        for i, keys_of_child in child_keys.items():
+            self.collect_index_records(node.get_pointer(i), keys_of_child, index_records)
+
+    def collect_leaf_records(self, page: int, keys: [int], index_records: dict) -> None:
+        leaf = self.latch_page(page)
+        try:
+            for key in keys:
+                i = leaf.find_position(key)
+                if i < len(leaf.records) and key == leaf.get_key(i):
+                    index_records[key] = leaf.get_record(i)
+        finally:
+            self.unlatch_page(page)
+
+    def remove_from_node(self, path: [(IndexPage, int)]) -> IndexRecord:
+        # Removes the record at the end of the path found by find_path and returns it.
+        node, i = path[-1]
+        index_record = node.get_record(i)
+        if node.is_leaf():
+            node.remove_record(node.get_record(i))
+            self.repair_path_after_removal(path)
+        else:
+            self.remove_from_internal_node(path)
+
+        return index_record
+
+    def is_overflown(self, node: IndexPage) -> bool:
+        return len(node.records) > 2 * self.d
+
+    def is_underflown(self, node: IndexPage) -> bool:
+        return len(node.records) < self.d
+
+    def repair_path_after_removal(self, path: [(IndexPage, int)]) -> None:
+        # A page left with too few records borrows from a neighbour or is merged with it, which takes a record from
+        # its parent, so the parent is checked next.
+        level = len(path) - 1
+        while level > 0 and self.is_underflown(path[level][0]):
+            node = path[level][0]
+            parent, i = path[level - 1]
+            if self.try_compensation_for_remove(node, parent, i):
+                return
+
+            self.merge(node, parent, i)
+            level -= 1
+
+        root_node = path[0][0]
+        if level == 0 and not root_node.records:
+            self.root_page = None if root_node.is_leaf() else root_node.get_pointer(0)
+            root_node.free()
+            self.h -= 1
+            self.metrics.count("root_changes")
+
+    def try_compensation_for_remove(self, node: IndexPage, parent: IndexPage, i: int) -> bool:
+        if i - 1 >= 0:
+            left_neighbour = self.filesHandler.get_index_page(parent.get_pointer(i - 1))
+            if len(left_neighbour.records) > self.d:
+                self.compensate_with_left_neighbour(node, left_neighbour, parent, i - 1)
+                return True
+            self.filesHandler.reduce_usage(left_neighbour)
+
+        if i + 1 < len(parent.pointers):
+            right_neighbour = self.filesHandler.get_index_page(parent.get_pointer(i + 1))
             if len(right_neighbour.records) > self.d:
-                self.compensate_with_right_neighbour(node, right_neighbour, parent_node, index)
-                can_compensate = True
-            else:
-                self.filesHandler.reduce_usage(right_neighbour)
+                self.compensate_with_right_neighbour(node, right_neighbour, parent, i)
+                return True
+            self.filesHandler.reduce_usage(right_neighbour)
 
-        return can_compensate
+        return False
 
+    @traced("compensation", "compensations")
     def compensate_with_left_neighbour(self, node: IndexPage, neighbour: IndexPage, parent: IndexPage, i: int) -> None:
         node.add_record(0, parent.get_record(i))
 
@@ -345,8 +1108,8 @@ class BTree:
         pointer = neighbour.get_pointer(-1)
         node.add_pointer(0, pointer)
         neighbour.remove_pointer(pointer)
-        self.update_parent([pointer], node.page_number)
 
+    @traced("compensation", "compensations")
     def compensate_with_right_neighbour(self, node: IndexPage, neighbour: IndexPage, parent: IndexPage, i: int) -> None:
         node.add_record(len(node.records), parent.get_record(i))
 
@@ -361,73 +1124,108 @@ class BTree:
         pointer = neighbour.get_pointer(0)
         node.add_pointer(len(node.pointers), pointer)
         neighbour.remove_pointer(pointer)
-        self.update_parent([pointer], node.page_number)
 
-    def remove_from_internal_node(self, node: IndexPage, i: int) -> None:
-        node_page_number = node.page_number
+    def remove_from_internal_node(self, path: [(IndexPage, int)]) -> None:
+        # The record is replaced with its predecessor or successor, which is removed from its leaf instead.
+        node, i = path[-1]
 
         left_child = self.filesHandler.get_index_page(node.get_pointer(i))
         if len(left_child.records) > self.d:
-            leaf_node, predecessor = self.find_predecessor(left_child)
-            node = self.filesHandler.get_index_page(node_page_number)
-            node.set_record(i, predecessor)
-            self.remove_from_node(predecessor.key, leaf_node)
-            return
-
-        self.filesHandler.reduce_usage(left_child)
-        right_child = self.filesHandler.get_index_page(node.get_pointer(i + 1))
-        if len(right_child.records) > self.d:
-            leaf_node, successor = self.find_successor(right_child)
-            node = self.filesHandler.get_index_page(node_page_number)
-            node.set_record(i, successor)
-            self.remove_from_node(successor.key, leaf_node)
+            leaf_path = self.find_predecessor(path)
         else:
-            self.filesHandler.reduce_usage(right_child)
-            left_child = self.filesHandler.get_index_page(node.get_pointer(i))
-            leaf_node, predecessor = self.find_predecessor(left_child)
-            node = self.filesHandler.get_index_page(node_page_number)
-            node.set_record(i, predecessor)
-            self.remove_from_node(predecessor.key, leaf_node)
-
-    def find_predecessor(self, node: IndexPage) -> (IndexPage, IndexRecord):
-        predecessor = node.get_record(-1)
+            self.filesHandler.reduce_usage(left_child)
+            right_child = self.filesHandler.get_index_page(node.get_pointer(i + 1))
+            if len(right_child.records) > self.d:
+                leaf_path = self.find_successor(path)
+            else:
+                self.filesHandler.reduce_usage(right_child)
+                leaf_path = self.find_predecessor(path)
+
+        leaf, j = leaf_path[-1]
+        record = leaf.get_record(j)
+        node.set_record(i, record)
+        leaf.remove_record(record)
+        self.repair_path_after_removal(leaf_path)
+
+    def find_predecessor(self, path: [(IndexPage, int)]) -> [(IndexPage, int)]:
+        # Extends the path ending at a record of an internal page to the last record of the subtree on its left.
+        node, i = path[-1]
+        path = path.copy()
+        node = self.filesHandler.get_index_page(node.get_pointer(i))
         while not node.is_leaf():
+            path.append((node, len(node.records)))
             node = self.filesHandler.get_index_page(node.get_pointer(-1))
-            predecessor = node.get_record(-1)
 
-        return node, predecessor
+        path.append((node, len(node.records) - 1))
+        return path
 
-    def find_successor(self, node: IndexPage) -> (IndexPage, IndexRecord):
-        successor = node.get_record(0)
+    def find_successor(self, path: [(IndexPage, int)]) -> [(IndexPage, int)]:
+        # Extends the path ending at a record of an internal page to the first record of the subtree on its right.
+        node, i = path[-1]
+        path = path[:-1] + [(node, i + 1)]
+        node = self.filesHandler.get_index_page(node.get_pointer(i + 1))
         while not node.is_leaf():
+            path.append((node, 0))
             node = self.filesHandler.get_index_page(node.get_pointer(0))
-            successor = node.get_record(0)
 
-        return node, successor
+        path.append((node, 0))
+        return path
 
-    def merge(self, node: IndexPage, neighbour: IndexPage, parent: IndexPage, i: int) -> None:
-        neighbour_page_number = neighbour.page_number
-        parent_page_number = parent.page_number
+    @traced("merge", "merges")
+    def merge(self, node: IndexPage, parent: IndexPage, i: int) -> None:
+        # Merges the node with its right neighbour or, for the last child, with the left one, together with the record
+        # of the parent between them.
+        if i + 1 < len(parent.pointers):
+            left_child, right_child = node, self.filesHandler.get_index_page(parent.get_pointer(i + 1))
+        else:
+            left_child, right_child, i = self.filesHandler.get_index_page(parent.get_pointer(i - 1)), node, i - 1
 
         record_from_parent = parent.get_record(i)
-        node.set_records(node.get_records() + [record_from_parent] + neighbour.get_records())
-
-        if not node.is_leaf():
-            node.set_pointers(node.get_pointers() + neighbour.get_pointers())
+        left_child.set_records(left_child.get_records() + [record_from_parent] + right_child.get_records())
+        if not left_child.is_leaf():
+            left_child.set_pointers(left_child.get_pointers() + right_child.get_pointers())
 
         parent.remove_record(record_from_parent)
-        parent.remove_pointer(neighbour.page_number)
+        parent.remove_pointer(right_child.page_number)
+        right_child.free()
+
+    def begin_operation(self, name: str) -> None:
+        if name not in BTree.read_operations:
+            self.check_writable()
+        if not self.batch_depth:
+            self.filesHandler.reset_io_counters()
+        self.filesHandler.begin_operation()
+        self.metrics.begin_operation(name)
+
+    def end_operation(self, print_reads_and_writes: bool = True, flush: bool = True) -> None:
+        # Pages are unpinned only once they are flushed, so that no other thread evicts a page changed by the
+        # operation before. Operations that change nothing need no flush.
+        if not self.batch_depth and flush:
+            self.flush_buffers()
+        self.filesHandler.end_operation()
+        self.metrics.end_operation()
+        if not self.batch_depth and print_reads_and_writes:
+            self.print_reads_and_writes()
 
-        self.update_parent(neighbour.get_pointers(), node.page_number)
+    def flush_buffers(self) -> None:
+        # Pages are written while no other operation runs, so none of them is written in the middle of a change.
+        with self.latch.exclusive():
+            self.filesHandler.catalog.root_page = self.root_page
+            self.filesHandler.catalog.h = self.h
+            self.filesHandler.flush_buffers()
 
-        neighbour = self.filesHandler.get_index_page(neighbour_page_number)
-        neighbour.set_pointers([])
-        neighbour.set_records([])
-        neighbour.set_parent(None)
+    def check_writable(self) -> None:
+        if self.filesHandler.read_only:
+            raise ValueError("The B-Tree is open read-only!")
 
-        self.repair_node_after_removal(self.filesHandler.get_index_page(parent_page_number))
+    def print_message(self, message: str) -> None:
+        if self.verbose:
+            print(message)
 
     def print_reads_and_writes(self) -> None:
+        if not self.verbose:
+            return
+
         index_writes, index_reads, data_writes, data_reads = self.filesHandler.get_reads_and_writes()
         print()
         print(f"\tIndex\treads: {index_reads}\twrites: {index_writes}")
@@ -0,0 +1,353 @@
+import argparse
+import contextlib
+import gc
+import itertools
+import json
+import math
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+from BPlusTree import BPlusTree
+from BTree import BTree
+from ClusteredTree import ClusteredTree
+from DataRecord import DataRecord
+
+
+class Benchmark:
+    # Runs reproducible workloads against freshly created trees. Every workload is a list of operations generated
+    # up front from the seed, so only the operations themselves are timed. Trees that a workload needs filled are
+    # bulk loaded before the timer starts. Every workload is run repeats times on a fresh tree and the fastest run
+    # is kept, so that a run slowed down by the machine, or by cold caches in the first one, is not reported. How
+    # much slower the slowest run is tells how noisy the throughput is, see compare.
+    workloads = ("sequential_insert", "random_insert", "zipf_insert", "lookup", "zipf_lookup", "delete", "update",
+                 "mixed")
+    layouts = {"btree": BTree, "bplus": BPlusTree, "clustered": ClusteredTree}
+    zipf_exponent = 1.1
+    metrics = ("ops_per_second", "index_reads_per_op", "index_writes_per_op", "data_reads_per_op",
+               "data_writes_per_op")
+    tolerance = 0.1     # allowed relative drop of throughput of workloads of 2000 operations
+    max_noise = 0.1     # largest noise of a result that widens the allowed drop
+    configuration = ("records", "seed", "wal", "key_filter")   # settings a baseline has to share to be compared
+
+    def __init__(self, records: int = 2000, seed: int = 0, repeats: int = 5, **options) -> None:
+        # options are passed to every created tree, see BTree.__init__.
+        if repeats < 1:
+            raise ValueError("A workload has to be run at least once!")
+        self.records: int = records
+        self.seed: int = seed
+        self.repeats: int = repeats
+        self.options: dict = options
+
+# public:
+    def run(self, workloads: [str], orders: [int], buffer_sizes: [int], layouts: [str] = ("btree",),
+            read_ratios: [float] = (0.5, 0.9)) -> [dict]:
+        results = []
+        for workload, layout, d, buffer_size in itertools.product(workloads, layouts, orders, buffer_sizes):
+            for read_ratio in (read_ratios if workload == "mixed" else [None]):
+                result = self.run_workload(workload, layout, d, buffer_size, read_ratio)
+                self.print_result(result)
+                results.append(result)
+
+        return results
+
+    def run_workload(self, workload: str, layout: str = "btree", d: int = 2, buffer_size: int | None = None,
+                     read_ratio: float | None = None) -> dict:
+        if workload not in Benchmark.workloads:
+            raise ValueError(f"Unknown workload {workload}!")
+        if layout not in Benchmark.layouts:
+            raise ValueError(f"Unknown layout {layout}!")
+
+        rng = random.Random(self.seed)
+        if workload == "mixed":
+            preload, operations = self.generate_mixed(rng, read_ratio)
+        else:
+            preload, operations = getattr(self, "generate_" + workload)(rng)
+
+        with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+            files = {
+                "index_filename": os.path.join(directory, "index.txt"),
+                "data_filename": os.path.join(directory, "data.txt"),
+                "catalog_filename": os.path.join(directory, "catalog.txt"),
+            }
+            options = dict(self.options)
+            if buffer_size is not None:
+                options["buffer_size"] = buffer_size
+
+            # The trees print after every operation, which is not what is measured. Page accesses are the same in
+            # every run.
+            run_seconds = []
+            with contextlib.redirect_stdout(devnull):
+                for _ in range(self.repeats):
+                    btree = Benchmark.layouts[layout].create(d, **files, **options)
+                    try:
+                        if preload:
+                            btree.bulk_load(preload)
+                        seconds, io = self.execute(btree, operations)
+                        run_seconds.append(seconds)
+                        height = btree.h
+                    finally:
+                        btree.close()
+
+            index_file_size = os.path.getsize(files["index_filename"])
+            data_file_size = os.path.getsize(files["data_filename"])
+
+        index_writes, index_reads, data_writes, data_reads = io
+        count = max(1, len(operations))
+        return {
+            "workload": workload if read_ratio is None else f"mixed_{round(read_ratio * 100)}",
+            "read_ratio": read_ratio,
+            "layout": layout,
+            "d": d,
+            "buffer_size": buffer_size,
+            "operations": len(operations),
+            "seconds": min(run_seconds),
+            "ops_per_second": len(operations) / min(run_seconds) if min(run_seconds) else 0.0,
+            "noise": 1 - min(run_seconds) / max(run_seconds) if min(run_seconds) else 0.0,
+            "index_reads_per_op": index_reads / count,
+            "index_writes_per_op": index_writes / count,
+            "data_reads_per_op": data_reads / count,
+            "data_writes_per_op": data_writes / count,
+            "height": height,
+            "index_file_size": index_file_size,
+            "data_file_size": data_file_size,
+        }
+
+    @staticmethod
+    def compare(results: [dict], baseline: [dict], tolerance: float = 0.1, io_tolerance: float = 0.0) -> [str]:
+        # Returns a description of every metric worse than in the baseline by more than the tolerance, which is
+        # relative. Throughput is allowed to vary by tolerance plus the noise of the new result, up to max_noise,
+        # counts of page accesses, which do not depend on the machine, by io_tolerance.
+        def key(result: dict) -> tuple:
+            return result["workload"], result["layout"], result["d"], result["buffer_size"]
+
+        baseline_results = {key(result): result for result in baseline}
+        regressions = []
+        for result in results:
+            previous = baseline_results.get(key(result))
+            if previous is None:
+                continue
+
+            for metric in Benchmark.metrics:
+                old, new = previous[metric], result[metric]
+                if metric == "ops_per_second":
+                    worse = new < old * (1 - tolerance - min(result.get("noise", 0.0), Benchmark.max_noise))
+                else:
+                    worse = new > old * (1 + io_tolerance) + 1e-9
+                if worse:
+                    change = (new - old) / old * 100 if old else float("inf")
+                    regressions.append(f"{result['workload']} {result['layout']} d={result['d']} "
+                                       f"buffer={result['buffer_size']}: {metric} {old:.3f} -> {new:.3f} "
+                                       f"({change:+.1f}%)")
+
+        return regressions
+
+    def retry(self, result: dict) -> dict:
+        # Runs the workload of the result again and returns the faster of both results.
+        workload = result["workload"] if result.get("read_ratio") is None else "mixed"
+        again = self.run_workload(workload, result["layout"], result["d"], result["buffer_size"],
+                                  result.get("read_ratio"))
+        return max(result, again, key=lambda compared: compared["ops_per_second"])
+
+    @staticmethod
+    def get_default_tolerance(records: int) -> float:
+        # Shorter workloads are timed less precisely, the error of a mean shrinks with the square root of the count.
+        return Benchmark.tolerance * max(1.0, math.sqrt(2000 / max(1, records)))
+
+    @staticmethod
+    def compare_configuration(configuration: dict, baseline_configuration: dict) -> [str]:
+        # Returns a description of every setting of Benchmark.configuration in which the baseline differs.
+        return [f"{name} is {configuration.get(name)!r}, in the baseline {baseline_configuration.get(name)!r}"
+                for name in Benchmark.configuration if configuration.get(name) != baseline_configuration.get(name)]
+
+    @staticmethod
+    def print_result(result: dict) -> None:
+        print(f"{result['workload']:<18} {result['layout']:<6} d={result['d']:<3} buffer={str(result['buffer_size']):<5}"
+              f"{result['ops_per_second']:>10.0f} ops/s"
+              f"\tindex r/w: {result['index_reads_per_op']:.2f}/{result['index_writes_per_op']:.2f}"
+              f"\tdata r/w: {result['data_reads_per_op']:.2f}/{result['data_writes_per_op']:.2f}"
+              f"\theight: {result['height']}")
+
+# private:
+    @staticmethod
+    def execute(btree: BTree, operations: [tuple]) -> (float, (int, int, int, int)):
+        # Garbage collections, which come at random points of a run, are left until it ends.
+        start_counters = btree.metrics.get_counters()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for operation, key, record in operations:
+                match operation:
+                    case "insert":
+                        btree.insert(record)
+                    case "search":
+                        btree.search(key)
+                    case "remove":
+                        btree.remove(key)
+                    case "update":
+                        btree.update(key, record)
+            seconds = time.perf_counter() - start
+        finally:
+            gc.enable()
+
+        counters = btree.metrics.get_counters()
+        return seconds, tuple(counters[name] - start_counters[name]
+                              for name in ("index_writes", "index_reads", "data_writes", "data_reads"))
+
+    @staticmethod
+    def create_record(rng: random.Random, key: int) -> DataRecord:
+        length = rng.randint(1, DataRecord.max_length)
+        return DataRecord(key, "".join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+
+    @staticmethod
+    def create_records(rng: random.Random, keys) -> [DataRecord]:
+        return [Benchmark.create_record(rng, key) for key in sorted(keys)]
+
+    @staticmethod
+    def zipf_choices(rng: random.Random, population: [int], count: int) -> [int]:
+        # The i-th most popular element is chosen with probability proportional to 1 / i ** zipf_exponent. Popularity
+        # does not follow the key order.
+        population = list(population)
+        rng.shuffle(population)
+        weights = itertools.accumulate(1 / rank ** Benchmark.zipf_exponent for rank in range(1, len(population) + 1))
+        return rng.choices(population, cum_weights=list(weights), k=count)
+
+    def generate_sequential_insert(self, rng: random.Random) -> ([DataRecord], [tuple]):
+        return [], [("insert", key, self.create_record(rng, key)) for key in range(1, self.records + 1)]
+
+    def generate_random_insert(self, rng: random.Random) -> ([DataRecord], [tuple]):
+        keys = rng.sample(range(1, 10 * self.records), self.records)
+        return [], [("insert", key, self.create_record(rng, key)) for key in keys]
+
+    def generate_zipf_insert(self, rng: random.Random) -> ([DataRecord], [tuple]):
+        # Inserts concentrate on a few popular keys, so many of them are rejected duplicates.
+        keys = self.zipf_choices(rng, range(1, 10 * self.records), self.records)
+        return [], [("insert", key, self.create_record(rng, key)) for key in keys]
+
+    def generate_lookup(self, rng: random.Random) -> ([DataRecord], [tuple]):
+        # One in ten lookups is for a missing key.
+        keys = rng.sample(range(1, 10 * self.records), self.records)
+        lookups = [rng.choice(keys) if rng.random() < 0.9 else rng.randrange(10 * self.records)
+                   for _ in range(self.records)]
+        return self.create_records(rng, keys), [("search", key, None) for key in lookups]
+
+    def generate_zipf_lookup(self, rng: random.Random) -> ([DataRecord], [tuple]):
+        keys = rng.sample(range(1, 10 * self.records), self.records)
+        lookups = self.zipf_choices(rng, keys, self.records)
+        return self.create_records(rng, keys), [("search", key, None) for key in lookups]
+
+    def generate_delete(self, rng: random.Random) -> ([DataRecord], [tuple]):
+        keys = rng.sample(range(1, 10 * self.records), self.records)
+        removals = rng.sample(keys, len(keys))
+        return self.create_records(rng, keys), [("remove", key, None) for key in removals]
+
+    def generate_update(self, rng: random.Random) -> ([DataRecord], [tuple]):
+        keys = rng.sample(range(1, 10 * self.records), self.records)
+        updates = [rng.choice(keys) for _ in range(self.records)]
+        return self.create_records(rng, keys), [("update", key, self.create_record(rng, key)) for key in updates]
+
+    def generate_mixed(self, rng: random.Random, read_ratio: float) -> ([DataRecord], [tuple]):
+        # Lookups of existing keys with the given ratio, the rest are equally inserts of new keys and removals.
+        keys = rng.sample(range(1, 10 * self.records), self.records)
+        preload = self.create_records(rng, keys)
+
+        live = list(keys)
+        positions = {key: i for i, key in enumerate(live)}
+        operations = []
+        for _ in range(self.records):
+            if live and rng.random() < read_ratio:
+                operations.append(("search", rng.choice(live), None))
+            elif live and rng.random() < 0.5:
+                # The removed key is swapped with the last one, so removal from the list is O(1).
+                key = rng.choice(live)
+                last = live.pop()
+                if last != key:
+                    live[positions[key]] = last
+                    positions[last] = positions[key]
+                del positions[key]
+                operations.append(("remove", key, None))
+            else:
+                key = rng.randrange(1, 20 * self.records)
+                if key not in positions:
+                    positions[key] = len(live)
+                    live.append(key)
+                operations.append(("insert", key, self.create_record(rng, key)))
+
+        return preload, operations
+
+
+def main():
+    # Usage: Benchmark.py [--records N] [--repeats N] [--orders D ...] [--buffer-sizes PAGES ...]
+    #                     [--workloads NAME ...] [--layouts btree bplus clustered] [--output FILE] [--baseline FILE]
+    # Exits with status 1 when a result is worse than the baseline, and with status 2 without running anything when
+    # the baseline was run with other records, seed, wal or key_filter.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=2000, help="records loaded or operations run per workload")
+    parser.add_argument("--repeats", type=int, default=5, help="runs of every workload, the fastest one is kept")
+    parser.add_argument("--orders", type=int, nargs="+", default=[2, 4, 8], help="orders d of the trees")
+    parser.add_argument("--buffer-sizes", type=int, nargs="+", default=[4, 64], help="buffer sizes in pages")
+    parser.add_argument("--workloads", nargs="+", default=list(Benchmark.workloads), choices=Benchmark.workloads)
+    parser.add_argument("--layouts", nargs="+", default=["btree"], choices=list(Benchmark.layouts))
+    parser.add_argument("--read-ratios", type=float, nargs="+", default=[0.5, 0.9],
+                        help="shares of lookups in the mixed workload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--wal", action="store_true", help="write changes through the write-ahead log")
+    parser.add_argument("--key-filter", action="store_true", help="answer lookups of absent keys from a filter")
+    parser.add_argument("--output", help="file the results are written to as JSON")
+    parser.add_argument("--baseline", help="JSON file of earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="allowed relative drop of throughput, by default 0.1 for 2000 records and more for fewer")
+    parser.add_argument("--io-tolerance", type=float, default=0.0,
+                        help="allowed relative growth of page reads and writes per operation")
+    arguments = parser.parse_args()
+
+    configuration = {"records": arguments.records, "seed": arguments.seed, "wal": arguments.wal,
+                     "key_filter": arguments.key_filter}
+    baseline = None
+    if arguments.baseline:
+        # Results of another configuration are not comparable, which is found out before anything is run.
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+        mismatches = Benchmark.compare_configuration(configuration, baseline)
+        for mismatch in mismatches:
+            print("Baseline mismatch: " + mismatch, file=sys.stderr)
+        if mismatches:
+            sys.exit(2)
+
+    benchmark = Benchmark(arguments.records, arguments.seed, arguments.repeats, wal=arguments.wal,
+                          key_filter=arguments.key_filter)
+    results = benchmark.run(arguments.workloads, arguments.orders, arguments.buffer_sizes, arguments.layouts,
+                            arguments.read_ratios)
+
+    regressions = []
+    if baseline is not None:
+        tolerance = arguments.tolerance
+        if tolerance is None:
+            tolerance = Benchmark.get_default_tolerance(arguments.records)
+        regressions = Benchmark.compare(results, baseline["results"], tolerance, arguments.io_tolerance)
+        if regressions:
+            # Workloads that regressed are run once more, so that a slow moment of the machine is not taken for one.
+            results = [benchmark.retry(result)
+                       if Benchmark.compare([result], baseline["results"], tolerance, arguments.io_tolerance) else result
+                       for result in results]
+            regressions = Benchmark.compare(results, baseline["results"], tolerance, arguments.io_tolerance)
+
+    # The results written are the ones compared, with those of workloads run again.
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(configuration | {"repeats": arguments.repeats, "results": results}, file, indent=2)
+
+    if baseline is not None:
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
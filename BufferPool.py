@@ -0,0 +1,233 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUPolicy:
+    def __init__(self, capacity: int) -> None:
+        self.pages: OrderedDict = OrderedDict()   # least recently used first
+
+    def insert(self, page_number: int) -> None:
+        self.pages[page_number] = None
+
+    def access(self, page_number: int) -> None:
+        self.pages.move_to_end(page_number)
+
+    def demote(self, page_number: int) -> None:
+        self.pages.move_to_end(page_number, last=False)
+
+    def remove(self, page_number: int) -> None:
+        del self.pages[page_number]
+
+    def victim(self, is_evictable) -> int | None:
+        for page_number in self.pages:
+            if is_evictable(page_number):
+                return page_number
+        return None
+
+
+class ClockPolicy:
+    # Second chance variant of CLOCK: the front of the queue is the clock hand, referenced pages are moved behind it.
+    def __init__(self, capacity: int) -> None:
+        self.pages: OrderedDict = OrderedDict()   # page number -> reference bit
+
+    def insert(self, page_number: int) -> None:
+        self.pages[page_number] = False
+
+    def access(self, page_number: int) -> None:
+        self.pages[page_number] = True
+
+    def demote(self, page_number: int) -> None:
+        self.pages[page_number] = False
+        self.pages.move_to_end(page_number, last=False)
+
+    def remove(self, page_number: int) -> None:
+        del self.pages[page_number]
+
+    def victim(self, is_evictable) -> int | None:
+        for _ in range(2 * len(self.pages)):
+            page_number, referenced = next(iter(self.pages.items()))
+            if is_evictable(page_number) and not referenced:
+                return page_number
+
+            self.pages[page_number] = False
+            self.pages.move_to_end(page_number)
+        return None
+
+
+class TwoQPolicy:
+    # Full 2Q: pages seen once wait in a FIFO queue, pages referenced again after leaving it go to the LRU queue.
+    def __init__(self, capacity: int) -> None:
+        self.in_size: int = max(1, capacity // 4)
+        self.out_size: int = max(1, capacity // 2)
+
+        self.recent: OrderedDict = OrderedDict()    # A1in, FIFO
+        self.frequent: OrderedDict = OrderedDict()  # Am, LRU
+        self.ghosts: OrderedDict = OrderedDict()    # A1out, page numbers only
+
+    def insert(self, page_number: int) -> None:
+        if page_number in self.ghosts:
+            del self.ghosts[page_number]
+            self.frequent[page_number] = None
+        else:
+            self.recent[page_number] = None
+
+    def access(self, page_number: int) -> None:
+        if page_number in self.frequent:
+            self.frequent.move_to_end(page_number)
+
+    def demote(self, page_number: int) -> None:
+        queue = self.frequent if page_number in self.frequent else self.recent
+        queue.move_to_end(page_number, last=False)
+
+    def remove(self, page_number: int) -> None:
+        if page_number in self.frequent:
+            del self.frequent[page_number]
+            return
+
+        del self.recent[page_number]
+        self.ghosts[page_number] = None
+        if len(self.ghosts) > self.out_size:
+            self.ghosts.popitem(last=False)
+
+    def victim(self, is_evictable) -> int | None:
+        queues = (self.recent, self.frequent) if len(self.recent) > self.in_size else (self.frequent, self.recent)
+        for queue in queues:
+            for page_number in queue:
+                if is_evictable(page_number):
+                    return page_number
+        return None
+
+
+class BufferPool:
+    policies = {"lru": LRUPolicy, "clock": ClockPolicy, "2q": TwoQPolicy}
+
+    def __init__(self, page_size: int, capacity: int | None = None, capacity_bytes: int | None = None,
+                 policy: str = "lru", write_page=None) -> None:
+        if capacity_bytes is not None:
+            capacity = capacity_bytes // page_size
+        if not capacity or capacity < 1:
+            raise ValueError("Buffer pool has to hold at least one page!")
+        if policy not in BufferPool.policies:
+            raise ValueError(f"Unknown replacement policy {policy}!")
+
+        self.page_size: int = page_size
+        self.capacity: int = capacity
+        self.policy = BufferPool.policies[policy](capacity)
+        self.write_page = write_page  # called with every dirty page that is evicted or flushed
+
+        # Threads share the pool, every public method holds the mutex, also while an evicted page is written.
+        self.mutex = threading.RLock()
+        self.pages: dict = {}
+        self.pins: dict = {}
+        self.no_steal: bool = False     # when set, dirty pages are kept until they are flushed
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __contains__(self, page_number: int) -> bool:
+        return page_number in self.pages
+
+# public:
+    def get(self, page_number: int):
+        with self.mutex:
+            page = self.pages.get(page_number)
+            if page is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.policy.access(page_number)
+            return page
+
+    def add(self, page) -> None:
+        with self.mutex:
+            if page.page_number in self.pages:
+                self.pages[page.page_number] = page
+                self.policy.access(page.page_number)
+                return
+
+            self.insert(page)
+
+    def add_if_absent(self, page):
+        # Adds a page read from its file, unless another thread added the page since it missed it, and returns the
+        # page held by the pool.
+        with self.mutex:
+            held_page = self.pages.get(page.page_number)
+            if held_page is not None:
+                return held_page
+
+            self.insert(page)
+            return page
+
+    def demote(self, page_number: int) -> None:
+        with self.mutex:
+            if page_number in self.pages:
+                self.policy.demote(page_number)
+
+    def pin(self, page_number: int) -> None:
+        # A page can be pinned before it is added, then it is never evicted once it is in the pool.
+        with self.mutex:
+            self.pins[page_number] = self.pins.get(page_number, 0) + 1
+
+    def unpin(self, page_number: int) -> None:
+        with self.mutex:
+            if self.pins[page_number] == 1:
+                del self.pins[page_number]
+            else:
+                self.pins[page_number] -= 1
+
+    def remove(self, page_number: int) -> None:
+        with self.mutex:
+            if page_number in self.pages:
+                del self.pages[page_number]
+                self.policy.remove(page_number)
+
+    def flush(self) -> None:
+        with self.mutex:
+            for page in self.pages.values():
+                if page.is_dirty():
+                    self.write_page(page)
+
+            # The pool could have grown over its capacity while pages were pinned or kept dirty.
+            while len(self.pages) > self.capacity and self.evict():
+                pass
+
+    def clear(self) -> None:
+        with self.mutex:
+            self.pages = {}
+            self.pins = {}
+            self.policy = type(self.policy)(self.capacity)
+
+    def get_stats(self) -> dict:
+        with self.mutex:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "pages": len(self.pages),
+                    "capacity": self.capacity}
+
+# private:
+    def insert(self, page) -> None:
+        while len(self.pages) >= self.capacity and self.evict():
+            pass
+
+        self.pages[page.page_number] = page
+        self.policy.insert(page.page_number)
+
+    def is_evictable(self, page_number: int) -> bool:
+        return page_number not in self.pins and not (self.no_steal and self.pages[page_number].is_dirty())
+
+    def evict(self) -> bool:
+        # Pinned pages are never evicted. When no page can be evicted, the pool grows over its capacity instead.
+        page_number = self.policy.victim(self.is_evictable)
+        if page_number is None:
+            return False
+
+        page = self.pages[page_number]
+        if page.is_dirty():
+            self.write_page(page)
+
+        self.remove(page_number)
+        self.evictions += 1
+        return True
@@ -0,0 +1,297 @@
+import heapq
+import itertools
+import math
+import struct
+import tempfile
+
+from DataPage import DataPage
+from DataRecord import DataRecord
+from IndexPage import IndexPage, IndexRecord
+
+
+class BulkLoader:
+    run_size = 100000   # records sorted in memory at once by the external merge sort
+    pair_format = struct.Struct(">II")  # (key, data page number) spilled between the levels
+
+    def __init__(self, btree, fill_factor: float = 1.0, run_size: int | None = None) -> None:
+        if not 0 < fill_factor <= 1:
+            raise ValueError("Fill factor has to be in range (0, 1]!")
+
+        self.btree = btree
+        self.filesHandler = btree.filesHandler
+        self.d: int = btree.d
+        self.run_size: int = run_size if run_size else BulkLoader.run_size
+
+        # Number of records put into every index page, kept within the limits of a B-Tree node.
+        self.fill: int = min(2 * self.d, max(self.d, round(fill_factor * 2 * self.d)))
+
+# public:
+    def load(self, records) -> int:
+        if self.btree.root_page is not None:
+            raise ValueError("Bulk loading requires an empty B-Tree!")
+
+        self.filesHandler.reset_storage()
+
+        iterator = iter(records)
+        spill = tempfile.TemporaryFile()
+        try:
+            count, unsorted_record = self.write_data_pages(iterator, spill)
+
+            if unsorted_record is not None:
+                # The input turned out not to be sorted. Records written so far are read back and sorted together
+                # with the rest of the input, then the data file is written again from the beginning.
+                runs = self.create_runs(itertools.chain(self.read_written_records(spill), [unsorted_record],
+                                                        iterator))
+                spill.close()
+                try:
+                    self.filesHandler.reset_storage()
+                    spill = tempfile.TemporaryFile()
+                    merged = heapq.merge(*[self.read_run(run) for run in runs], key=lambda record: record.key)
+                    count, _ = self.write_data_pages(merged, spill)
+                finally:
+                    for run in runs:
+                        run.close()
+
+            self.write_index_pages(count, spill)
+        except ValueError:
+            self.filesHandler.reset_storage()
+            raise
+        finally:
+            spill.close()
+
+        return count
+
+# private:
+    def create_runs(self, records) -> list:
+        runs = []
+        while True:
+            chunk = list(itertools.islice(records, self.run_size))
+            if not chunk:
+                return runs
+
+            chunk.sort(key=lambda record: record.key)
+            run = tempfile.TemporaryFile()
+            for record in chunk:
+                run.write(self.filesHandler.codec.encode_data_record(record))
+            run.seek(0)
+            runs.append(run)
+
+    def read_run(self, run):
+        record = self.filesHandler.codec.read_data_record(run)
+        while record is not None:
+            yield record
+            record = self.filesHandler.codec.read_data_record(run)
+
+    def read_written_records(self, spill):
+        # Records written by write_data_pages, which wrote them to data pages.
+        for page_number in range(1, self.filesHandler.data_next_page):
+            data_page = self.filesHandler.get_data_page(page_number)
+            if not data_page.is_overflow():
+                yield from data_page.records
+
+    def write_data_pages(self, records, spill) -> (int, DataRecord | None):
+        # Records are packed into consecutive data pages, every page is written once when it gets full.
+        # Returns the number of written records and the first record that broke the key order, if any.
+        count = 0
+        previous_key = None
+        data_page = None
+
+        for record in records:
+            if previous_key is not None and record.key <= previous_key:
+                if record.key == previous_key:
+                    raise ValueError(f"Duplicate key {record.key}!")
+                if data_page is not None:
+                    self.filesHandler.save_data_page(data_page)
+                return count, record
+
+            self.filesHandler.write_overflow_data(record)
+            if data_page is None or not data_page.fits(record):
+                if data_page is not None:
+                    self.filesHandler.save_data_page(data_page)
+                data_page = DataPage(self.filesHandler.data_page_size, self.filesHandler.data_next_page)
+                self.filesHandler.data_next_page += 1
+
+            data_page.add_record(record)
+            spill.write(BulkLoader.pair_format.pack(record.key, data_page.page_number))
+            previous_key = record.key
+            count += 1
+
+        if data_page is not None:
+            self.filesHandler.save_data_page(data_page)
+            self.filesHandler.last_data_page_number = data_page.page_number
+
+        return count, None
+
+    def plan_levels(self, count: int) -> [(int, int, int)]:
+        # For every level, starting from leaves, returns (pages, records per page, pages with one more record).
+        # A level of k pages holding n items uses k - 1 of them as separators for the level above.
+        levels = []
+        items = count
+        while items > 2 * self.d:
+            pages = math.ceil((items + 1) / (self.fill + 1))
+            min_pages = math.ceil((items + 1) / (2 * self.d + 1))
+            max_pages = (items + 1) // (self.d + 1)
+            pages = min(max(pages, min_pages), max_pages)
+
+            records_per_page, larger_pages = divmod(items - (pages - 1), pages)
+            levels.append((pages, records_per_page, larger_pages))
+            items = pages - 1
+
+        levels.append((1, items, 0))
+        return levels
+
+    def write_index_pages(self, count: int, spill) -> None:
+        if count == 0:
+            return
+
+        levels = self.plan_levels(count)
+
+        first_pages = [1]
+        for pages, _, _ in levels:
+            first_pages.append(first_pages[-1] + pages)
+
+        # Levels are written from the leaves up, so index pages are written once each, in the page number order.
+        for level, (pages, records_per_page, larger_pages) in enumerate(levels):
+            spill.seek(0)
+            separators = tempfile.TemporaryFile()
+            child = 0
+
+            for i in range(pages):
+                size = records_per_page + (1 if i < larger_pages else 0)
+                index_page = IndexPage(self.filesHandler.records_per_page, first_pages[level] + i)
+                index_page.set_records([IndexRecord(*BulkLoader.pair_format.unpack(spill.read(BulkLoader.pair_format.size)))
+                                        for _ in range(size)])
+
+                if level > 0:
+                    index_page.set_pointers(list(range(first_pages[level - 1] + child,
+                                                       first_pages[level - 1] + child + size + 1)))
+                    child += size + 1
+
+                self.filesHandler.save_index_page(index_page)
+
+                if i < pages - 1:
+                    separators.write(spill.read(BulkLoader.pair_format.size))
+
+            spill.close()
+            spill = separators
+
+        spill.close()
+        self.filesHandler.index_next_page = first_pages[-1]
+        self.btree.root_page = first_pages[-1] - 1
+        self.btree.h = len(levels)
+
+
+class BPlusBulkLoader(BulkLoader):
+    # Builds the B+ tree layout. Leaves are written first, in key order and linked with their neighbours, then every
+    # internal level above them. The first key of every page is spilled as the separator for the level above.
+
+    def __init__(self, btree, fill_factor: float = 1.0, run_size: int | None = None) -> None:
+        super().__init__(btree, fill_factor, run_size)
+        self.capacity: int = btree.capacity
+        self.fill: int = min(self.capacity, max(self.capacity // 2, round(fill_factor * self.capacity)))
+        self.leaf_capacity: int = btree.leaf_capacity
+        self.leaf_fill: int = min(self.leaf_capacity, max(self.leaf_capacity // 2,
+                                                          round(fill_factor * self.leaf_capacity)))
+
+# private:
+    @staticmethod
+    def plan_level(items: int, capacity: int, minimum: int, fill: int) -> (int, int, int):
+        # Returns (pages, items per page, pages with one more item) for a level holding the given number of items.
+        pages = math.ceil(items / fill)
+        pages = min(max(pages, math.ceil(items / capacity)), max(1, items // minimum))
+        items_per_page, larger_pages = divmod(items, pages)
+        return pages, items_per_page, larger_pages
+
+    def read_leaf_records(self, spill, count: int) -> [IndexRecord]:
+        pair_size = BulkLoader.pair_format.size
+        return [IndexRecord(*BulkLoader.pair_format.unpack(spill.read(pair_size))) for _ in range(count)]
+
+    def write_index_pages(self, count: int, spill) -> None:
+        if count == 0:
+            return
+
+        pair_size = BulkLoader.pair_format.size
+        first_page = 1
+        spill.seek(0)
+        separators = tempfile.TemporaryFile()
+
+        pages, records_per_page, larger_pages = self.plan_level(count, self.leaf_capacity, self.leaf_capacity // 2,
+                                                                self.leaf_fill)
+        for i in range(pages):
+            size = records_per_page + (1 if i < larger_pages else 0)
+            leaf = self.filesHandler.codec.create_index_page(first_page + i)
+            leaf.set_leaf(True)
+            leaf.set_records(self.read_leaf_records(spill, size))
+            leaf.set_prev_page(leaf.page_number - 1 if i > 0 else None)
+            leaf.set_next_page(leaf.page_number + 1 if i < pages - 1 else None)
+            self.filesHandler.save_index_page(leaf)
+            separators.write(BulkLoader.pair_format.pack(leaf.get_key(0), leaf.page_number))
+
+        first_page += pages
+        h = 1
+        while pages > 1:
+            spill.close()
+            spill = separators
+            spill.seek(0)
+            separators = tempfile.TemporaryFile()
+
+            # An internal page of n separators has n + 1 children.
+            pages, children_per_page, larger_pages = self.plan_level(pages, self.capacity + 1,
+                                                                     self.capacity // 2 + 1, self.fill + 1)
+            for i in range(pages):
+                size = children_per_page + (1 if i < larger_pages else 0)
+                children = [BulkLoader.pair_format.unpack(spill.read(pair_size)) for _ in range(size)]
+                index_page = self.filesHandler.codec.create_index_page(first_page + i)
+                index_page.set_leaf(False)
+                index_page.set_records([IndexRecord(key, None) for key, _ in children[1:]])
+                index_page.set_pointers([page_number for _, page_number in children])
+                self.filesHandler.save_index_page(index_page)
+                separators.write(BulkLoader.pair_format.pack(children[0][0], index_page.page_number))
+
+            first_page += pages
+            h += 1
+
+        spill.close()
+        separators.close()
+        self.filesHandler.index_next_page = first_page
+        self.btree.root_page = first_page - 1
+        self.btree.h = h
+
+
+class ClusteredBulkLoader(BPlusBulkLoader):
+    # Builds the clustered layout. Records are spilled as leaf slots, only data too long for a slot is written to
+    # overflow pages of the data file, then the leaves are built from the spill like in the B+ tree layout.
+
+# private:
+    def write_data_pages(self, records, spill) -> (int, DataRecord | None):
+        count = 0
+        previous_key = None
+
+        for record in records:
+            if previous_key is not None and record.key <= previous_key:
+                if record.key == previous_key:
+                    raise ValueError(f"Duplicate key {record.key}!")
+                return count, record
+
+            record = DataRecord(record.key, record.data)
+            self.filesHandler.write_overflow_data(record)
+            spill.write(self.filesHandler.codec.encode_leaf_record(record))
+            previous_key = record.key
+            count += 1
+
+        return count, None
+
+    def read_written_records(self, spill):
+        entry_size = self.filesHandler.codec.leaf_entry_struct.size
+        spill.seek(0)
+        entry = spill.read(entry_size)
+        while len(entry) == entry_size:
+            record = self.filesHandler.codec.decode_leaf_record(entry)
+            if record.overflow_page is not None:
+                record = DataRecord(record.key, self.filesHandler.read_overflow_data(record.overflow_page))
+            yield record
+            entry = spill.read(entry_size)
+
+    def read_leaf_records(self, spill, count: int) -> [DataRecord]:
+        entry_size = self.filesHandler.codec.leaf_entry_struct.size
+        return [self.filesHandler.codec.decode_leaf_record(spill.read(entry_size)) for _ in range(count)]
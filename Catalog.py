@@ -0,0 +1,96 @@
+import os
+
+from DataRecord import DataRecord
+
+
+class Catalog:
+    magic_number = 0x42545245   # "BTRE"
+    version = 6
+    layouts = ("btree", "bplus", "clustered")   # stored as the position in this tuple
+
+    def __init__(self, records_per_page: int, page_size: int | None = None, layout: str = "btree") -> None:
+        self.records_per_page: int = records_per_page
+        self.page_size: int | None = page_size   # None when pages are only as big as their records
+        self.layout: str = layout
+        self.root_page: int | None = None
+        self.h: int = 0
+        self.index_next_page: int = 1
+        self.data_next_page: int = 1
+        self.last_data_page_number: int | None = None
+
+    def serialize(self) -> bytes:
+        numbers = [
+            Catalog.magic_number,
+            Catalog.version,
+            self.records_per_page,
+            self.page_size,
+            Catalog.layouts.index(self.layout),
+            self.root_page,
+            self.h,
+            self.index_next_page,
+            self.data_next_page,
+            self.last_data_page_number,
+        ]
+
+        result = []
+        for number in numbers:
+            if number is None:
+                number = DataRecord.null_byte_key
+            result.append(number.to_bytes(DataRecord.int_size, DataRecord.byte_order))
+        return b"".join(result)
+
+    @staticmethod
+    def deserialize(raw: bytes):
+        numbers = []
+        for offset in range(0, len(raw) - DataRecord.int_size + 1, DataRecord.int_size):
+            number = int.from_bytes(raw[offset:offset + DataRecord.int_size], DataRecord.byte_order)
+            numbers.append(None if number == DataRecord.null_byte_key else number)
+
+        if len(numbers) < 2 or numbers[0] != Catalog.magic_number:
+            raise ValueError("Catalog file is corrupted or is not a B-Tree catalog!")
+        if numbers[1] != Catalog.version:
+            # Trees before version 5 have data records of a fixed size, which cannot be read as slotted pages, and
+            # before version 6 index pages with parent pointers.
+            raise ValueError(f"Unsupported catalog version {numbers[1]}, the B-Tree has to be created again!")
+
+        if len(numbers) < 10 or numbers[4] >= len(Catalog.layouts):
+            raise ValueError("Catalog file is corrupted or is not a B-Tree catalog!")
+
+        catalog = Catalog(numbers[2], numbers[3], Catalog.layouts[numbers[4]])
+        catalog.root_page = numbers[5]
+        catalog.h = numbers[6]
+        catalog.index_next_page = numbers[7]
+        catalog.data_next_page = numbers[8]
+        catalog.last_data_page_number = numbers[9]
+
+        return catalog
+
+    def save(self, filename: str) -> None:
+        Catalog.write(filename, self.serialize())
+
+    @staticmethod
+    def write(filename: str, image: bytes) -> None:
+        # The catalog is written to a temporary file, synced and renamed over the old one, so that a crash leaves
+        # either the old catalog or the new one, never a truncated one the tree could not be opened with.
+        temporary_filename = filename + ".tmp"
+        with open(temporary_filename, "wb") as file:
+            file.write(image)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_filename, filename)
+
+        if os.name != "nt":
+            # The rename is durable once the directory is synced.
+            fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def load(filename: str):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"No catalog file {filename}!")
+
+        with open(filename, "rb") as file:
+            return Catalog.deserialize(file.read())
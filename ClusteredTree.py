@@ -0,0 +1,77 @@
+from BPlusPage import ClusteredPage
+from BPlusTree import BPlusTree
+from BulkLoader import ClusteredBulkLoader
+from DataRecord import DataRecord
+
+
+class ClusteredTree(BPlusTree):
+    # B+ tree variant in which leaves hold the records themselves instead of pointing to data pages, so a lookup
+    # reads one path from the root and a range scan reads the records in key order along the leaves. Data longer
+    # than ClusteredPage.inline_data_size is kept in overflow pages of the data file, which holds nothing else.
+    # Leaves hold fewer records than internal pages hold separators, see ClusteredPage.
+    layout = "clustered"
+    bulk_loader_class = ClusteredBulkLoader
+
+# public:
+    @staticmethod
+    def create(d: int = 2, index_filename: str = "data/index.txt", data_filename: str = "data/data.txt",
+               catalog_filename: str = "data/catalog.txt", page_size: int | None = None, **options):
+        # Without a page size, a leaf holds 2 * d records.
+        return ClusteredTree(d, index_filename, data_filename, catalog_filename, create=True, page_size=page_size,
+                             **options)
+
+# private:
+    def store_record(self, record: DataRecord) -> DataRecord:
+        # The leaf keeps a copy of the record, so that the caller cannot change it behind the tree's back.
+        record = DataRecord(record.key, record.data)
+        self.filesHandler.add_overflow_data(record)
+        return record
+
+    def drop_record(self, record: DataRecord) -> None:
+        self.filesHandler.remove_overflow_data(record)
+
+    def move_record(self, record: DataRecord, new_record: DataRecord) -> DataRecord:
+        stored = self.store_record(new_record)
+        self.drop_record(record)
+        return stored
+
+    def read_data_record(self, record: DataRecord) -> DataRecord:
+        return DataRecord(record.key, record.data)
+
+    def replace_data_record(self, node: ClusteredPage, i: int, record: DataRecord) -> None:
+        # The new data is written before the old one is freed, like in a data page.
+        old_record = node.get_record(i)
+        node.set_record(i, self.store_record(record))
+        self.drop_record(old_record)
+
+    def get_data_records(self, records: [DataRecord]) -> [DataRecord]:
+        return [self.read_data_record(record) for record in records]
+
+    def prefetch_node(self, node: ClusteredPage, with_data: bool) -> None:
+        # The records are read with their leaves.
+        super().prefetch_node(node, False)
+
+    def move_overflow_page(self, page_number: int, destinations: [int]) -> None:
+        # The first page of a chain is referred to by its record in a leaf, every other one by the page before it.
+        overflow_page = self.filesHandler.get_data_page(page_number)
+        node, i = self.locate(overflow_page.key)
+        destination_number = self.find_empty_data_page(destinations)
+        if node is None or destination_number is None:
+            return
+
+        holder_number = None
+        next_page = node.get_record(i).overflow_page
+        while next_page is not None and next_page != page_number:
+            holder_number = next_page
+            holder = self.filesHandler.get_data_page(holder_number)
+            next_page = holder.next_page if holder.is_overflow() else None
+        if next_page is None:
+            # Left over by a failed insert.
+            return
+
+        self.filesHandler.move_overflow_page(overflow_page, destination_number)
+        if holder_number is None:
+            record = node.get_record(i)
+            node.set_record(i, DataRecord(record.key, record.data, destination_number))
+        else:
+            self.filesHandler.get_data_page(holder_number).set_next_page(destination_number)
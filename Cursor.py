@@ -0,0 +1,228 @@
+from DataRecord import DataRecord
+from IndexPage import IndexPage, IndexRecord
+
+
+class Cursor:
+    # The cursor stands in a gap between two neighbouring keys. Its position is the path from the root to a leaf:
+    # one [page number, index] pair per level, where index is the child pointer taken in internal pages and the
+    # gap position in the leaf. The tree must not be modified while a cursor is in use, unless the cursor is
+    # latched: then it holds the latch of the leaf it stands in shared, see BTree.latch, until it leaves the leaf or
+    # is closed. Only leaves change while the tree latch is held shared, which the user of a latched cursor holds.
+
+    def __init__(self, btree, key: int | None = None, latched: bool = False) -> None:
+        self.btree = btree
+        self.filesHandler = btree.filesHandler
+        self.path: [[int, int]] = []
+        self.latched: bool = latched
+        self.latched_page: int | None = None
+
+        if key is None:
+            self.seek_first()
+        else:
+            self.seek(key)
+
+    def __iter__(self):
+        record = self.next()
+        while record is not None:
+            yield record
+            record = self.next()
+
+# public:
+    def seek(self, key: int) -> None:
+        # Positions the cursor so that next() returns the first record with a key not smaller than the given key.
+        self.leave_leaf()
+        self.path = []
+        page_number = self.btree.root_page
+        while page_number is not None:
+            node = self.filesHandler.get_index_page(page_number)
+            if node.is_leaf():
+                node = self.enter_leaf(page_number)
+                self.path.append([page_number, node.find_position(key)])
+                return
+
+            i = node.find_position(key)
+            self.path.append([page_number, i])
+
+            if i < len(node.records) and node.get_key(i) == key:
+                # The gap before a record of an internal page is the last gap of its left subtree.
+                self.descend(node.get_pointer(i), to_the_right=True)
+                return
+
+            page_number = node.get_pointer(i)
+
+    def seek_first(self) -> None:
+        self.leave_leaf()
+        self.path = []
+        if self.btree.root_page is not None:
+            self.descend(self.btree.root_page, to_the_right=False)
+
+    def seek_last(self) -> None:
+        self.leave_leaf()
+        self.path = []
+        if self.btree.root_page is not None:
+            self.descend(self.btree.root_page, to_the_right=True)
+
+    def close(self) -> None:
+        self.leave_leaf()
+
+    def next(self) -> DataRecord | None:
+        index_record = self.next_index_record()
+        if index_record is None:
+            return None
+        return self.get_data_record(index_record)
+
+    def prev(self) -> DataRecord | None:
+        index_record = self.prev_index_record()
+        if index_record is None:
+            return None
+        return self.get_data_record(index_record)
+
+    def next_index_record(self) -> IndexRecord | None:
+        if not self.path:
+            return None
+
+        leaf = self.get_node(-1)
+        if self.path[-1][1] < len(leaf.records):
+            self.path[-1][1] += 1
+            return leaf.get_record(self.path[-1][1] - 1)
+
+        # The gap after the last record of a leaf is the gap before the record of the first ancestor, which was
+        # entered through other than its last pointer.
+        level = len(self.path) - 2
+        while level >= 0:
+            node = self.get_node(level)
+            if self.path[level][1] < len(node.records):
+                record = node.get_record(self.path[level][1])
+                self.path[level][1] += 1
+                self.leave_leaf()
+                del self.path[level + 1:]
+                self.descend(node.get_pointer(self.path[level][1]), to_the_right=False)
+                return record
+            level -= 1
+
+        return None
+
+    def prev_index_record(self) -> IndexRecord | None:
+        if not self.path:
+            return None
+
+        if self.path[-1][1] > 0:
+            self.path[-1][1] -= 1
+            return self.get_node(-1).get_record(self.path[-1][1])
+
+        level = len(self.path) - 2
+        while level >= 0:
+            if self.path[level][1] > 0:
+                node = self.get_node(level)
+                self.path[level][1] -= 1
+                record = node.get_record(self.path[level][1])
+                self.leave_leaf()
+                del self.path[level + 1:]
+                self.descend(node.get_pointer(self.path[level][1]), to_the_right=True)
+                return record
+            level -= 1
+
+        return None
+
+# private:
+    def descend(self, page_number: int, to_the_right: bool) -> None:
+        while True:
+            node = self.filesHandler.get_index_page(page_number)
+            if node.is_leaf():
+                node = self.enter_leaf(page_number)
+                self.path.append([page_number, len(node.records) if to_the_right else 0])
+                return
+
+            i = len(node.records) if to_the_right else 0
+            self.path.append([page_number, i])
+            page_number = node.get_pointer(i)
+
+    def get_node(self, level: int) -> IndexPage:
+        return self.filesHandler.get_index_page(self.path[level][0])
+
+    def enter_leaf(self, page_number: int) -> IndexPage:
+        if not self.latched:
+            return self.filesHandler.get_index_page(page_number)
+
+        self.latched_page = page_number
+        return self.btree.latch_page(page_number)
+
+    def leave_leaf(self) -> None:
+        if self.latched_page is not None:
+            self.btree.unlatch_page(self.latched_page)
+            self.latched_page = None
+
+    def get_data_record(self, index_record: IndexRecord) -> DataRecord:
+        return self.btree.read_data_record(index_record)
+
+
+class LeafCursor(Cursor):
+    # Cursor of the B+ tree layout. Records are only in leaves, which are linked with their neighbours, so the
+    # position is just the leaf page number and the gap in that leaf.
+
+    def __init__(self, btree, key: int | None = None, latched: bool = False) -> None:
+        self.page_number: int | None = None
+        self.position: int = 0
+        super().__init__(btree, key, latched)
+
+# public:
+    def seek(self, key: int) -> None:
+        self.leave_leaf()
+        self.page_number = None
+        if self.btree.root_page is not None:
+            leaf = self.enter_leaf(self.btree.find_path(key)[-1][0].page_number)
+            self.page_number = leaf.page_number
+            self.position = leaf.find_position(key)
+
+    def seek_first(self) -> None:
+        self.leave_leaf()
+        self.page_number = None
+        super().seek_first()
+
+    def seek_last(self) -> None:
+        self.leave_leaf()
+        self.page_number = None
+        super().seek_last()
+
+    def next_index_record(self) -> IndexRecord | None:
+        while self.page_number is not None:
+            leaf = self.filesHandler.get_index_page(self.page_number)
+            if self.position < len(leaf.records):
+                self.position += 1
+                return leaf.get_record(self.position - 1)
+            if leaf.next_page is None:
+                return None
+
+            # Links between leaves change only while the tree latch is held exclusively, so the next leaf is
+            # latched only after the current one is left.
+            self.leave_leaf()
+            self.page_number = self.enter_leaf(leaf.next_page).page_number
+            self.position = 0
+
+        return None
+
+    def prev_index_record(self) -> IndexRecord | None:
+        while self.page_number is not None:
+            leaf = self.filesHandler.get_index_page(self.page_number)
+            if self.position > 0:
+                self.position -= 1
+                return leaf.get_record(self.position)
+            if leaf.prev_page is None:
+                return None
+
+            self.leave_leaf()
+            leaf = self.enter_leaf(leaf.prev_page)
+            self.page_number = leaf.page_number
+            self.position = len(leaf.records)
+
+        return None
+
+# private:
+    def descend(self, page_number: int, to_the_right: bool) -> None:
+        node = self.filesHandler.get_index_page(page_number)
+        while not node.is_leaf():
+            node = self.filesHandler.get_index_page(node.get_pointer(-1 if to_the_right else 0))
+
+        node = self.enter_leaf(node.page_number)
+        self.page_number = node.page_number
+        self.position = len(node.records) if to_the_right else 0
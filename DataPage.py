@@ -1,52 +1,105 @@
+import bisect
+import operator
+
 from DataRecord import DataRecord
 
 
 class DataPage:
-    next_page: int = 1
-    max_size: int = 0
+    # Slotted page: a directory of slots sorted by key, one for every record, and data of the records of any length.
+    # Data longer than the limit given by get_max_inline_size is kept in overflow pages, the page holds only the
+    # number of the first of them.
+    header_size = 2 * 4             # kind, slots count
+    slot_size = 3 * 4               # key, data offset, data length
+    overflow_reference_size = 4     # first overflow page
+    record_key = operator.attrgetter("key")
 
-    def __init__(self, records_per_page: int, page_number: int | None = None) -> None:
-        self.records_per_page: int = records_per_page
-        DataPage.max_size = records_per_page * DataRecord.max_size
+    def __init__(self, page_size: int, page_number: int) -> None:
         self.records: [DataRecord] = []
+        self.free_space: int = DataPage.get_capacity(page_size)
         self.dirty_bit: bool = False
+        self.page_number: int = page_number
+
+    @staticmethod
+    def get_page_size(records_per_page: int) -> int:
+        # Size of a page holding records_per_page records of the longest generated data.
+        return DataPage.header_size + records_per_page * (DataPage.slot_size + DataRecord.max_length)
+
+    @staticmethod
+    def get_capacity(page_size: int) -> int:
+        return page_size - DataPage.header_size
 
-        if page_number is None:
-            self.page_number: int = DataPage.next_page
-            DataPage.next_page += 1
-        else:
-            self.page_number: int = page_number
+    @staticmethod
+    def get_max_inline_size(page_size: int) -> int:
+        # Records taking up to a quarter of the page are kept in it, but data of the generated length always is.
+        return max(DataRecord.max_length, DataPage.get_capacity(page_size) // 4 - DataPage.slot_size)
+
+    @staticmethod
+    def get_record_size(record: DataRecord) -> int:
+        if record.overflow_page is not None:
+            return DataPage.slot_size + DataPage.overflow_reference_size
+        return DataPage.slot_size + record.get_data_size()
 
     def add_record(self, record: DataRecord) -> None:
-        self.records.append(record)
+        bisect.insort_right(self.records, record, key=DataPage.record_key)
+        self.free_space -= DataPage.get_record_size(record)
         self.dirty_bit = True
 
-    def is_full(self) -> bool:
-        return len(self.records) == self.records_per_page
+    def fits(self, record: DataRecord) -> bool:
+        return DataPage.get_record_size(record) <= self.free_space
 
-    def serialize(self) -> [bytes]:
-        result = []
+    def get_record(self, key: int) -> DataRecord | None:
+        i = bisect.bisect_left(self.records, key, key=DataPage.record_key)
+        if i < len(self.records) and self.records[i].key == key:
+            return self.records[i]
+        return None
 
-        for record in self.records:
-            result += record.serialize()
+    def print_record(self, key: int) -> None:
+        record = self.get_record(key)
+        if record is not None:
+            print(record)
 
-        for _ in range(self.records_per_page - len(self.records)):
-            result += DataRecord.get_empty_record_bytes()
+    def remove_record(self, key: int) -> DataRecord | None:
+        i = bisect.bisect_left(self.records, key, key=DataPage.record_key)
+        if i < len(self.records) and self.records[i].key == key:
+            record = self.records.pop(i)
+            self.free_space += DataPage.get_record_size(record)
+            self.dirty_bit = True
+            return record
+        return None
 
-        return result
+    def set_overflow_page(self, key: int, overflow_page: int) -> None:
+        self.get_record(key).overflow_page = overflow_page
+        self.dirty_bit = True
 
-    def print_record(self, key: int) -> None:
-        for record in self.records:
-            if record.key == key:
-                print(record)
-                break
-
-    def remove_record(self, key: int) -> None:
-        for record in self.records:
-            if record.key == key:
-                self.records.remove(record)
-                self.dirty_bit = True
-                return
+    def is_overflow(self) -> bool:
+        return False
+
+    def is_dirty(self) -> bool:
+        return self.dirty_bit
+
+
+class OverflowPage:
+    # A part of the data of one record, which is too long for a data page. Parts are chained by next_page.
+    header_size = 4 * 4     # kind, key of the record, next page, data length
+    free_space = 0          # the page is never shared with other records
+
+    def __init__(self, page_number: int) -> None:
+        self.key: int | None = None
+        self.data: bytes = b""
+        self.next_page: int | None = None
+        self.dirty_bit: bool = False
+        self.page_number: int = page_number
+
+    @staticmethod
+    def get_capacity(page_size: int) -> int:
+        return page_size - OverflowPage.header_size
+
+    def set_next_page(self, next_page: int | None) -> None:
+        self.next_page = next_page
+        self.dirty_bit = True
+
+    def is_overflow(self) -> bool:
+        return True
 
     def is_dirty(self) -> bool:
         return self.dirty_bit
@@ -1,268 +1,768 @@
-import os.path
-
+import contextlib
+import io
+import os
+import threading
+import time
+
+from BufferPool import BufferPool
+from Catalog import Catalog
 from DataRecord import DataRecord
-from DataPage import DataPage
-from IndexPage import IndexPage, IndexRecord
+from DataPage import DataPage, OverflowPage
+from FreeSpaceMap import FreeSpaceMap
+from Latch import Latch
+from IndexPage import IndexPage
+from Metrics import Metrics
+from BPlusPage import BPlusPage, ClusteredPage
+from PageCodec import PageCodec, BPlusPageCodec, ClusteredPageCodec
+from PageFile import PageFile
+from SnapshotVersion import SnapshotVersion
+from WriteAheadLog import WriteAheadLog
 
 
 class FilesHandler:
-    index_buffer_size = 3
-    data_buffer_size = 3
-
-    def __init__(self, records_per_page: int, index_filename: str = "data/index.txt", data_filename: str = "data/data.txt") -> None:
+    index_buffer_size = 64
+    data_buffer_size = 64
+    snapshot_timeout = 10.0             # seconds a reader waits for the writer to publish a consistent state
+    snapshot_retry_interval = 0.001
+    snapshot_attempts = 4               # reads of a state a reader tries before it holds the writer off
+
+    def __init__(self, records_per_page: int, index_filename: str = "data/index.txt", data_filename: str = "data/data.txt",
+                 catalog_filename: str = "data/catalog.txt", create: bool = True, buffer_size: int | None = None,
+                 buffer_bytes: int | None = None, buffer_policy: str = "lru", use_mmap: bool = False,
+                 page_size: int | None = None, layout: str = "btree", wal: bool = False,
+                 log_filename: str | None = None, group_commit: int = 1,
+                 group_commit_interval: float | None = None, read_only: bool = False) -> None:
         self.index_filename: str = index_filename
         self.data_filename: str = data_filename
-
+        self.catalog_filename: str = catalog_filename
+        self.log_filename: str = log_filename if log_filename else os.path.splitext(catalog_filename)[0] + ".log"
+
+        # By default pages are just as big as their records need, data pages hold records_per_page records of the
+        # longest generated data. With a page size given, both index and data pages take exactly that many bytes.
+        if page_size is not None and page_size < max(IndexPage.get_max_size(records_per_page),
+                                                     DataPage.get_page_size(1)):
+            raise ValueError(f"Page size {page_size} is too small for {records_per_page} records per page!")
+        # The layout is "btree", "bplus", which has its own index page format, or "clustered", which keeps records
+        # in leaves and only overflow pages in the data file.
+        self.page_size: int | None = page_size
+        self.layout: str = layout
         self.records_per_page: int = records_per_page
+        if page_size:
+            self.index_page_size: int = page_size
+        elif layout == "bplus":
+            self.index_page_size: int = BPlusPage.get_max_size(records_per_page)
+        elif layout == "clustered":
+            self.index_page_size: int = ClusteredPage.get_max_size(records_per_page)
+        else:
+            self.index_page_size: int = IndexPage.get_max_size(records_per_page)
+        self.data_page_size: int = page_size if page_size else DataPage.get_page_size(records_per_page)
+        self.data_page_capacity: int = DataPage.get_capacity(self.data_page_size)
+        self.max_inline_size: int = DataPage.get_max_inline_size(self.data_page_size)
+        if layout == "clustered":
+            self.max_inline_size = ClusteredPage.inline_data_size
         self.last_data_page_number: int | None = None
 
-        self.index_empty_pages = []
-        self.data_non_full_pages = []
-
-        self.index_reads: int = 0
-        self.index_writes: int = 0
-        self.data_reads: int = 0
-        self.data_writes: int = 0
-        self.index_buffer: [IndexPage] = []
-        self.data_buffer: [DataPage] = []
-
-        self.clean_files()
+        self.index_next_page: int = 1
+        self.data_next_page: int = 1
+
+        # Page reads and writes are counted in the metrics, those since reset_io_counters are their difference with
+        # the counters at the reset.
+        self.metrics: Metrics = Metrics()
+        self.io_counters_start: dict = self.metrics.get_counters()
+
+        # Buffers live as long as the files are open, so pages stay cached between operations.
+        # Their size is given either in pages or in bytes, which is the same for both buffers.
+        self.operation = threading.local()    # pages pinned by the operation of every thread
+        self.index_buffer = BufferPool(self.index_page_size,
+                                       buffer_size if buffer_size else FilesHandler.index_buffer_size,
+                                       buffer_bytes, buffer_policy, self.save_index_page)
+        self.data_buffer = BufferPool(self.data_page_size,
+                                      buffer_size if buffer_size else FilesHandler.data_buffer_size,
+                                      buffer_bytes, buffer_policy, self.save_data_page)
+
+        codec_class = {"bplus": BPlusPageCodec, "clustered": ClusteredPageCodec}.get(layout, PageCodec)
+        self.codec = codec_class(records_per_page, self.index_page_size, self.data_page_size)
+
+        # A read-only handler reads the files while another process writes them, see SnapshotVersion. It reads
+        # pages with pread, as a page of a mapped file cut by the writer would kill the process when read, and never
+        # touches the log, the free space maps or anything else only the writer needs.
+        self.read_only: bool = read_only
+        if read_only:
+            if create:
+                raise ValueError("A read-only B-Tree cannot be created!")
+            use_mmap = False
+            wal = False
+
+        # Both files stay open for the lifetime of the handler.
+        self.index_file = PageFile(index_filename, self.index_page_size, use_mmap, read_only)
+        self.data_file = PageFile(data_filename, self.data_page_size, use_mmap, read_only)
+
+        # Free index pages and free space of data pages are kept in a map next to each file. Maps missing from an
+        # existing tree are rebuilt from the pages.
+        index_space_filename = os.path.splitext(index_filename)[0] + ".fsm"
+        data_space_filename = os.path.splitext(data_filename)[0] + ".fsm"
+        self.rebuild_space_maps: bool = not read_only and not (os.path.exists(index_space_filename) and
+                                                               os.path.exists(data_space_filename))
+        self.index_space: FreeSpaceMap | None = None if read_only else FreeSpaceMap(index_space_filename)
+        self.data_space: FreeSpaceMap | None = None if read_only else FreeSpaceMap(data_space_filename)
+
+        # Version of the state of the files published to read-only handlers, and for them the version their
+        # buffers hold pages of.
+        self.version = SnapshotVersion(os.path.splitext(catalog_filename)[0] + ".version", read_only)
+        self.snapshot: int | None = None
+
+        self.catalog: Catalog = Catalog(records_per_page, page_size, layout)
+        self.saved_catalog: bytes | None = None
+
+        # With the write-ahead log, every flush of the buffers is written to the log first and pages are written in
+        # place only after the log is synced. Dirty pages are never evicted, so no page reaches its file before
+        # the flush that commits it.
+        self.wal: WriteAheadLog | None = None
+        self.logging: bool = True
+        if wal:
+            self.wal = WriteAheadLog(self.log_filename, self.write_page_image, self.write_catalog_image, group_commit,
+                                     group_commit_interval)
+            self.set_no_steal(False)
+        self.metrics.add_collector(self.collect_metrics)
+
+        # Latches of index pages, see BTree.latch. Data pages are used by one thread at a time, holding the mutex.
+        self.index_latches: dict = {}
+        self.index_latches_mutex = threading.Lock()
+        self.data_mutex = threading.RLock()
+
+        if create:
+            self.clean_files()
+            self.clean_log()
+            with self.unlogged():
+                self.save_catalog()
+        elif read_only:
+            self.refresh_snapshot()
+        else:
+            self.recover()
+            self.load_catalog()
+        if not read_only:
+            self.version.publish()
 
 # public:
+    def begin_operation(self) -> None:
+        # Until the operation ends, every index page it uses is pinned, so the page objects held by the B-Tree
+        # algorithms are never evicted and reloaded behind their back. Every thread has its own operation.
+        self.operation.pages = set()
+
+    def end_operation(self) -> None:
+        for page_number in self.operation.pages:
+            self.index_buffer.unpin(page_number)
+        self.operation.pages = None
+
+    def get_index_latch(self, page_number: int) -> Latch:
+        latch = self.index_latches.get(page_number)
+        if latch is None:
+            with self.index_latches_mutex:
+                latch = self.index_latches.setdefault(page_number, Latch())
+        return latch
+
+    def get_data_record(self, data_page_number: int, key: int) -> DataRecord | None:
+        with self.data_mutex:
+            return self.get_data_page(data_page_number).get_record(key)
+
+    def get_data_page_records(self, data_page_number: int) -> [DataRecord]:
+        # A copy of the list, which other threads can change once the mutex is released.
+        with self.data_mutex:
+            return list(self.get_data_page(data_page_number).records)
+
     def add_record_to_data_file(self, record: DataRecord) -> int:
-        self.reset_io_counters()
-        if self.last_data_page_number is None or self.get_data_page(self.last_data_page_number).is_full():
-            last_data_page = self.create_new_data_page()
+        with self.data_mutex:
+            self.write_overflow_data(record)
+            return self.place_record(record)
+
+    def update_record_in_data_file(self, data_page_number: int, key: int, record: DataRecord) -> int:
+        # Replaces the record of the given key with the record, whose key can be different. The record stays in the
+        # page if it fits there, otherwise it is placed like a new one. Returns the number of the page holding it.
+        with self.data_mutex:
+            # Overflow pages are written first, so that they cannot take the page emptied by the removal.
+            self.write_overflow_data(record)
+            self.remove_record_from_data_file(data_page_number, key)
+
+            # The page is taken from the buffer again, as writing and freeing overflow pages can evict it.
+            data_page = self.get_data_page(data_page_number)
+            if not data_page.fits(record):
+                return self.place_record(record)
+
+            data_page.add_record(record)
+            self.update_data_space(data_page)
+            return data_page_number
+
+    def add_overflow_data(self, record: DataRecord) -> None:
+        # For records kept outside data pages, writes their data to overflow pages if it is too long.
+        with self.data_mutex:
+            self.write_overflow_data(record)
+
+    def remove_overflow_data(self, record: DataRecord) -> None:
+        with self.data_mutex:
+            self.free_overflow_pages(record.overflow_page)
+
+    def place_record(self, record: DataRecord) -> int:
+        # Adds the record, whose overflow pages are written already, to the last data page or to a page with enough
+        # free space.
+        if self.last_data_page_number is None or not self.get_data_page(self.last_data_page_number).fits(record):
+            last_data_page = self.create_new_data_page(DataPage.get_record_size(record))
             self.last_data_page_number = last_data_page.page_number
         else:
             last_data_page = self.get_data_page(self.last_data_page_number)
 
         last_data_page.add_record(record)
+        self.update_data_space(last_data_page)
 
         return self.last_data_page_number
 
     def create_new_index_page(self) -> IndexPage:
-        if self.index_empty_pages:
-            page_number = self.index_empty_pages[0]
-            page = self.get_index_page(page_number)
-            self.index_empty_pages.remove(page_number)
+        page_number = self.index_space.find()
+        if page_number is not None:
+            page = self.get_index_page(page_number)  # page was added to buffer
+            self.index_space.set(page_number, 0)
         else:
-            page = IndexPage(self.records_per_page)
+            page = self.codec.create_index_page(self.index_next_page)
+            self.index_next_page += 1
+            self.add_index_page_to_buffer(page)
+            self.pin_for_operation(page.page_number)
 
-        self.add_index_page_to_buffer(page)
         return page
 
+    def close(self) -> None:
+        if self.read_only:
+            self.index_file.close()
+            self.data_file.close()
+            self.version.close()
+            return
+
+        self.flush_buffers()
+        if self.wal is not None:
+            self.wal.checkpoint(self.sync_files)
+            self.wal.close()
+        self.version.publish()
+        self.index_file.close()
+        self.data_file.close()
+        self.index_space.close()
+        self.data_space.close()
+        self.version.close()
+
     def flush_buffers(self):
+        # Pages changed by a reader would never be written, so it must not change any.
+        if self.read_only:
+            return
+
         self.flush_index_buffer()
         self.flush_data_buffer()
+        self.index_space.flush(lambda block_number, block: self.store_page_image(WriteAheadLog.index_space_map,
+                                                                                 block_number, block))
+        self.data_space.flush(lambda block_number, block: self.store_page_image(WriteAheadLog.data_space_map,
+                                                                                block_number, block))
+        self.save_catalog()
+
+        if self.wal is not None and self.logging:
+            self.wal.commit()
+            if self.wal.should_checkpoint():
+                self.wal.checkpoint(self.sync_files)
+        self.version.publish()
+
+    def checkpoint(self) -> None:
+        # Makes everything flushed so far durable in the files themselves.
+        self.flush_buffers()
+        if self.wal is not None:
+            self.wal.checkpoint(self.sync_files)
+        else:
+            self.sync_files()
+        self.version.publish()
+
+    def refresh_snapshot(self) -> int:
+        # For a read-only handler. Waits until the files hold a state published by the writer and returns its
+        # version. Pages buffered from an older state are dropped and the catalog is read again.
+        deadline = time.monotonic() + FilesHandler.snapshot_timeout
+        while True:
+            version = self.version.read()
+            if version == self.snapshot:
+                return version
+
+            if not version % 2:
+                self.index_buffer.clear()
+                self.data_buffer.clear()
+                self.index_file.refresh()
+                self.data_file.refresh()
+                try:
+                    self.load_catalog()
+                except (ValueError, FileNotFoundError):
+                    # The writer is rewriting the catalog, the version has already changed.
+                    pass
+                if self.version.read() == version:
+                    self.snapshot = version
+                    return version
+
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No consistent state of the B-Tree in {FilesHandler.snapshot_timeout} s!")
+            time.sleep(FilesHandler.snapshot_retry_interval)
+
+    def is_snapshot_current(self, version: int) -> bool:
+        return self.version.read() == version
+
+    def hold_snapshot(self):
+        # Keeps the writer from changing the files in place while the block runs, see SnapshotVersion.hold.
+        return self.version.hold()
+
+    @contextlib.contextmanager
+    def unlogged(self):
+        # Pages are written straight to the files, e.g. while the whole tree is built from scratch. The log is
+        # emptied before and the files are synced after, so the flush that follows logs a catalog pointing to pages
+        # which are already durable.
+        if self.wal is None:
+            yield
+            return
+
+        self.wal.checkpoint(self.sync_files)
+        self.logging = False
+        try:
+            yield
+        finally:
+            self.logging = True
+            self.sync_files()
 
-    def get_data_page(self, page_number: int) -> DataPage:
-        for data_page in self.data_buffer:
-            if data_page.page_number == page_number:
-                self.move_to_the_beginning(self.data_buffer, data_page)
-                return data_page
+    def get_data_page(self, page_number: int) -> DataPage | OverflowPage:
+        data_page = self.data_buffer.get(page_number)
+        if data_page is not None:
+            return data_page
 
         return self.load_data_page(page_number)
 
     def get_index_page(self, page_number: int) -> IndexPage:
-        for index_page in self.index_buffer:
-            if index_page.page_number == page_number:
-                self.move_to_the_beginning(self.index_buffer, index_page)
-                return index_page
+        # The page is pinned before it is taken, so that no other thread evicts it in between.
+        self.pin_for_operation(page_number)
+        index_page = self.index_buffer.get(page_number)
+        if index_page is None:
+            index_page = self.load_index_page(page_number)
+        return index_page
 
-        return self.load_index_page(page_number)
+    def prefetch_index_pages(self, page_numbers) -> None:
+        # Pages which are not buffered are asked for ahead, so that the OS reads them meanwhile, see
+        # PageFile.prefetch.
+        self.metrics.count("prefetched_pages", self.index_file.prefetch(
+            [page_number for page_number in page_numbers if page_number not in self.index_buffer]))
+
+    def prefetch_data_pages(self, page_numbers) -> None:
+        self.metrics.count("prefetched_pages", self.data_file.prefetch(
+            [page_number for page_number in page_numbers if page_number not in self.data_buffer]))
+
+    def get_buffer_stats(self) -> (dict, dict):
+        return self.index_buffer.get_stats(), self.data_buffer.get_stats()
 
     def get_reads_and_writes(self) -> (int, int, int, int):
-        return self.index_writes, self.index_reads, self.data_writes, self.data_reads
+        return tuple(self.metrics.counters[name] - self.io_counters_start[name]
+                     for name in ("index_writes", "index_reads", "data_writes", "data_reads"))
 
     def print_index_file(self):
         print("Index file:")
-
-        read_bytes = 0
-        page_number = 1
-        with open(self.index_filename, "rb") as file:
-            while read_bytes < os.path.getsize(self.index_filename):
-                page_bytes = 0
-                print(f"Page {page_number}:\t", end=" ")
-                while page_bytes < IndexPage.max_size:
-                    num = int.from_bytes(file.read(DataRecord.int_size), DataRecord.byte_order)
-                    if num == DataRecord.null_byte_key:
-                        print(".", end=" ")
-                    else:
-                        print(num, end=" ")
-                    page_bytes += DataRecord.int_size
-                    read_bytes += DataRecord.int_size
-                print()
-                page_number += 1
+        self.sync_log()
+
+        for page_number in range(1, self.index_file.get_pages_count() + 1):
+            file = io.BytesIO(self.index_file.read_page(page_number))
+            page_bytes = 0
+            print(f"Page {page_number}:\t", end=" ")
+            while page_bytes < self.codec.index_struct.size:
+                num = int.from_bytes(file.read(DataRecord.int_size), DataRecord.byte_order)
+                if num == DataRecord.null_byte_key:
+                    print(".", end=" ")
+                else:
+                    print(num, end=" ")
+                page_bytes += DataRecord.int_size
+            print()
 
     def print_data_file(self):
         print("Data file:")
+        self.sync_log()
 
-        page_number = 1
-        with open(self.data_filename, "rb") as input_file:
-            record = DataRecord.deserialize(input_file)
-
-            while record:
-                print(f"Page {page_number}:\t", end="")
-                page_number += 1
-
-                for _ in range(self.records_per_page):
-                    print(" ", end="")
-                    if record.key != DataRecord.null_byte_key:
-                        print(record.key, end=" ")
-                    else:
-                        print("_", end=" ")
+        for page_number in range(1, self.data_file.get_pages_count() + 1):
+            data_page = self.codec.decode_data_page(self.data_file.read_page(page_number), page_number)
+            print(f"Page {page_number}:\t", end="")
 
-                    for elem in record.data:
-                        print(elem, end="")
+            if data_page.is_overflow():
+                print(f" overflow of {data_page.key}, next page {data_page.next_page}: {data_page.data!r}")
+                continue
 
-                    if len(record.data) < DataRecord.max_length:
-                        for _ in range(DataRecord.max_length - len(record.data)):
-                            print(".", end="")
-
-                    record = DataRecord.deserialize(input_file)
-                print()
+            for record in data_page.records:
+                if record.overflow_page is not None:
+                    print(f" {record.key} -> page {record.overflow_page}", end="")
+                else:
+                    print(f" {record.key} \"{record.data}\"", end="")
+            print(f" ({data_page.free_space} bytes free)")
         print()
 
+    def move_index_page(self, index_page: IndexPage, page_number: int) -> IndexPage:
+        # Copies the page to a free page with the given number, then the old page becomes free. References to the
+        # page from other pages have to be changed by the caller.
+        moved_page = self.codec.decode_index_page(self.codec.encode_index_page(index_page), page_number)
+        moved_page.dirty_bit = True
+        self.index_space.set(page_number, 0)
+        self.add_index_page_to_buffer(moved_page)
+        self.pin_for_operation(page_number)
+
+        free_page = self.codec.create_index_page(index_page.page_number)
+        free_page.dirty_bit = True
+        self.add_index_page_to_buffer(free_page)
+        return moved_page
+
+    def truncate_index_file(self, pages: int) -> None:
+        # Cuts off free pages after the given number of pages. Buffers have to be flushed and the log checkpointed
+        # before, so nothing is written after the new end of the file later.
+        for page_number in range(pages + 1, self.index_next_page):
+            self.index_buffer.remove(page_number)
+        self.index_next_page = pages + 1
+        self.version.begin_write()
+        self.index_space.truncate(pages)
+        self.index_file.truncate(pages * self.index_page_size)
+
+    def move_overflow_page(self, overflow_page: OverflowPage, page_number: int) -> OverflowPage:
+        # Copies the page to an empty data page with the given number, then the old page becomes empty. The reference
+        # to the page has to be changed by the caller.
+        moved_page = self.codec.decode_data_page(self.codec.encode_data_page(overflow_page), page_number)
+        moved_page.dirty_bit = True
+        if page_number == self.last_data_page_number:
+            self.last_data_page_number = None
+        self.add_data_page_to_buffer(moved_page)
+        self.update_data_space(moved_page)
+
+        self.free_data_page(overflow_page.page_number)
+        return moved_page
+
+    def count_data_pages_in_use(self) -> int:
+        # Number of data pages up to the last one which is not empty.
+        pages = self.data_next_page - 1
+        while pages and self.data_space.get(pages) == self.data_page_capacity:
+            pages -= 1
+        return pages
+
+    def truncate_data_file(self, pages: int) -> None:
+        for page_number in range(pages + 1, self.data_next_page):
+            self.data_buffer.remove(page_number)
+        self.data_next_page = pages + 1
+        if self.last_data_page_number is not None and self.last_data_page_number > pages:
+            self.last_data_page_number = None
+        self.version.begin_write()
+        self.data_space.truncate(pages)
+        self.data_file.truncate(pages * self.data_page_size)
+
     def reduce_usage(self, index_page: IndexPage) -> None:
-        self.index_buffer.remove(index_page)
-        self.index_buffer.append(index_page)
+        self.index_buffer.demote(index_page.page_number)
 
     def remove_record_from_data_file(self, data_page_number: int, key: int) -> None:
-        data_page = self.get_data_page(data_page_number)
-        data_page.remove_record(key)
-
-        if data_page_number != self.last_data_page_number and data_page_number not in self.data_non_full_pages:
-            self.data_non_full_pages.append(data_page_number)
+        with self.data_mutex:
+            data_page = self.get_data_page(data_page_number)
+            record = data_page.remove_record(key)
+            self.update_data_space(data_page)
+            if record is not None and record.overflow_page is not None:
+                self.free_overflow_pages(record.overflow_page)
+
+    def write_overflow_data(self, record: DataRecord) -> None:
+        # Data too long to be kept in a data page is written to a chain of empty pages, the record gets the number
+        # of the first one.
+        record.overflow_page = None
+        data = record.data.encode("utf-8")
+        if len(data) <= self.max_inline_size:
+            return
 
-    def reset_io_counters(self) -> None:
-        self.index_reads = 0
-        self.index_writes = 0
+        part_size = OverflowPage.get_capacity(self.data_page_size)
+        parts = [data[start:start + part_size] for start in range(0, len(data), part_size)]
+        page_numbers = [self.take_empty_data_page() for _ in parts]
+        for i, part in enumerate(parts):
+            overflow_page = OverflowPage(page_numbers[i])
+            overflow_page.key = record.key
+            overflow_page.data = part
+            overflow_page.next_page = page_numbers[i + 1] if i + 1 < len(parts) else None
+            overflow_page.dirty_bit = True
+            self.add_data_page_to_buffer(overflow_page)
+
+        record.overflow_page = page_numbers[0]
+
+    def free_overflow_pages(self, page_number: int | None) -> None:
+        while page_number is not None:
+            overflow_page = self.get_data_page(page_number)
+            if not overflow_page.is_overflow():
+                return
+
+            self.free_data_page(page_number)
+            page_number = overflow_page.next_page
+
+    def set_no_steal(self, no_steal: bool) -> None:
+        # While set, dirty pages are not evicted from the buffers, so they are not written before flush_buffers.
+        # The write-ahead log needs it all the time.
+        no_steal = no_steal or self.wal is not None
+        self.index_buffer.no_steal = no_steal
+        self.data_buffer.no_steal = no_steal
+
+    def reset_storage(self) -> None:
+        # Drops every page of the tree, used before the whole tree is rebuilt.
+        self.clean_files()
+        self.index_buffer.clear()
+        self.data_buffer.clear()
 
-        self.data_reads = 0
-        self.data_writes = 0
+        self.index_next_page = 1
+        self.data_next_page = 1
+        self.last_data_page_number = None
 
-        self.index_buffer = []
-        self.data_buffer = []
+    def reset_io_counters(self) -> None:
+        with self.metrics.mutex:
+            self.io_counters_start = dict(self.metrics.counters)
 
 # private
     def add_data_page_to_buffer(self, data_page: DataPage) -> None:
-        if len(self.data_buffer) >= FilesHandler.data_buffer_size:
-            lru_page = self.data_buffer.pop()
-            self.save_data_page(lru_page)
-        self.data_buffer.insert(0, data_page)
+        self.data_buffer.add(data_page)
 
     def add_index_page_to_buffer(self, index_page: IndexPage) -> None:
-        if len(self.index_buffer) >= self.index_buffer_size:
-            lru_page = self.index_buffer.pop()
-            self.save_index_page(lru_page)
-        self.index_buffer.insert(0, index_page)
+        self.index_buffer.add(index_page)
+
+    def pin_for_operation(self, page_number: int) -> None:
+        pages = getattr(self.operation, "pages", None)
+        if pages is not None and page_number not in pages:
+            pages.add(page_number)
+            self.index_buffer.pin(page_number)
+
+    def collect_metrics(self) -> dict:
+        counters = {
+            "index_buffer_hits": self.index_buffer.hits,
+            "index_buffer_misses": self.index_buffer.misses,
+            "data_buffer_hits": self.data_buffer.hits,
+            "data_buffer_misses": self.data_buffer.misses,
+        }
+        if self.wal is not None:
+            counters["log_commits"] = self.wal.commits
+            counters["log_syncs"] = self.wal.syncs
+        return counters
 
     def clean_files(self) -> None:
-        open(self.index_filename, "w").close()
-        open(self.data_filename, "w").close()
+        self.version.begin_write()
+        self.index_file.truncate()
+        self.data_file.truncate()
+        self.index_space.clear()
+        self.data_space.clear()
+        self.rebuild_space_maps = False
+
+    def clean_log(self) -> None:
+        # A log left by another tree must never be recovered into this one.
+        if self.wal is not None:
+            self.wal.truncate()
+        elif os.path.exists(self.log_filename):
+            os.remove(self.log_filename)
+
+    def recover(self) -> None:
+        # The log is recovered whenever it exists, even if the tree is opened without it, since it can hold changes
+        # committed before a crash.
+        wal = self.wal
+        if wal is None:
+            if not os.path.exists(self.log_filename):
+                return
+            wal = WriteAheadLog(self.log_filename, self.write_page_image, self.write_catalog_image)
+
+        wal.recover()
+        wal.checkpoint(self.sync_files)
+        if wal is not self.wal:
+            wal.close()
+            os.remove(self.log_filename)
+
+    def sync_log(self) -> None:
+        if self.wal is not None:
+            self.wal.sync()
+
+    def sync_files(self) -> None:
+        self.index_file.sync()
+        self.data_file.sync()
+        self.index_space.sync()
+        self.data_space.sync()
+        if os.path.exists(self.catalog_filename):
+            fd = os.open(self.catalog_filename, os.O_RDWR | getattr(os, "O_BINARY", 0))
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def write_page_image(self, kind: int, page_number: int, image) -> None:
+        self.version.begin_write()
+        if kind == WriteAheadLog.index_space_map:
+            self.index_space.write_block(page_number, image)
+        elif kind == WriteAheadLog.data_space_map:
+            self.data_space.write_block(page_number, image)
+        else:
+            file = self.index_file if kind == WriteAheadLog.index_page else self.data_file
+            file.write_page(page_number, image)
 
-    def create_new_data_page(self) -> DataPage:
-        # If there is any page that is not full, then use it.
-        if self.data_non_full_pages:
-            page_number = self.data_non_full_pages[0]
+    def write_catalog_image(self, image: bytes) -> None:
+        self.version.begin_write()
+        Catalog.write(self.catalog_filename, image)
+
+    def store_page_image(self, kind: int, page_number: int, image) -> None:
+        if self.wal is not None and self.logging:
+            self.wal.log_page(kind, page_number, image)
+        else:
+            self.write_page_image(kind, page_number, image)
+
+    def get_page_image(self, kind: int, page_number: int) -> (bytes, int):
+        # Returns a buffer holding the page and the page offset in it, see PageFile.get_page_buffer.
+        image = self.wal.get_page(kind, page_number) if self.wal is not None else None
+        if image is not None:
+            return image, 0
+
+        file = self.index_file if kind == WriteAheadLog.index_page else self.data_file
+        image = file.get_page_buffer(page_number)
+        # A reader uses a page only if the writer has not started changing the files since the reader took their
+        # state. The writer changes the version before it writes any page, so every page used was read whole from
+        # the same state and the tree is never seen half changed.
+        if self.read_only and self.version.read() != self.snapshot:
+            raise ValueError("The B-Tree was changed while it was read!")
+        return image
+
+    def load_catalog(self) -> None:
+        self.catalog = Catalog.load(self.catalog_filename)
+        if self.catalog.records_per_page != self.records_per_page:
+            raise ValueError(f"Catalog was created with {self.catalog.records_per_page} records per page, "
+                             f"not {self.records_per_page}!")
+        if self.catalog.page_size != self.page_size:
+            raise ValueError(f"Catalog was created with page size {self.catalog.page_size}, not {self.page_size}!")
+        if self.catalog.layout != self.layout:
+            raise ValueError(f"Catalog was created with {self.catalog.layout} layout, not {self.layout}!")
+
+        self.index_next_page = self.catalog.index_next_page
+        self.data_next_page = self.catalog.data_next_page
+        self.last_data_page_number = self.catalog.last_data_page_number
+        self.saved_catalog = self.catalog.serialize()
+
+        if self.read_only:
+            return
+
+        # Maps are loaded only now, as the recovery could have written them.
+        self.index_space.load()
+        self.data_space.load()
+        if self.rebuild_space_maps:
+            self.rebuild_free_space_maps()
+
+    def save_catalog(self) -> None:
+        self.catalog.index_next_page = self.index_next_page
+        self.catalog.data_next_page = self.data_next_page
+        self.catalog.last_data_page_number = self.last_data_page_number
+
+        # The catalog is rewritten only when the tree state has changed since the last save.
+        serialized_catalog = self.catalog.serialize()
+        if serialized_catalog != self.saved_catalog:
+            if self.wal is not None and self.logging:
+                self.wal.log_catalog(serialized_catalog)
+            else:
+                self.version.begin_write()
+                self.catalog.save(self.catalog_filename)
+            self.saved_catalog = serialized_catalog
+
+    def update_data_space(self, data_page: DataPage | OverflowPage) -> None:
+        self.data_space.set(data_page.page_number, data_page.free_space)
+
+    def rebuild_free_space_maps(self) -> None:
+        # Every page is read once, without going through the buffers.
+        for page_number in range(1, self.index_next_page):
+            buffer, offset = self.get_page_image(WriteAheadLog.index_page, page_number)
+            self.index_space.set(page_number, 1 if self.codec.decode_index_page(buffer, page_number, offset).is_empty()
+                                 else 0)
+        for page_number in range(1, self.data_next_page):
+            buffer, offset = self.get_page_image(WriteAheadLog.data_page, page_number)
+            self.update_data_space(self.codec.decode_data_page(buffer, page_number, offset))
+        self.rebuild_space_maps = False
+
+    def create_new_data_page(self, needed: int) -> DataPage:
+        # If there is any page with the needed free space, then use it.
+        page_number = self.data_space.find(needed)
+        if page_number is not None:
             page = self.get_data_page(page_number)  # page was added to buffer
-            self.data_non_full_pages.remove(page_number)
 
         # Otherwise, create the new page.
         else:
-            page = DataPage(self.records_per_page)
+            page = DataPage(self.data_page_size, self.data_next_page)
+            self.data_next_page += 1
             self.add_data_page_to_buffer(page)
 
         return page
 
+    def take_empty_data_page(self) -> int:
+        # Returns the number of an empty page, which is marked as full until it is written.
+        page_number = self.data_space.find(self.data_page_capacity)
+        if page_number is None:
+            page_number = self.data_next_page
+            self.data_next_page += 1
+        elif page_number == self.last_data_page_number:
+            self.last_data_page_number = None
+
+        self.data_space.set(page_number, 0)
+        return page_number
+
+    def free_data_page(self, page_number: int) -> None:
+        free_page = DataPage(self.data_page_size, page_number)
+        free_page.dirty_bit = True
+        self.add_data_page_to_buffer(free_page)
+        self.update_data_space(free_page)
+
     def flush_data_buffer(self) -> None:
-        for data_page in self.data_buffer:
-            self.save_data_page(data_page)
-        self.data_buffer = []
+        self.data_buffer.flush()
 
     def flush_index_buffer(self) -> None:
-        for index_page in self.index_buffer:
-            self.save_index_page(index_page)
+        self.index_buffer.flush()
 
-        self.index_buffer = []
+    def load_data_page(self, page_number: int = 1) -> DataPage | OverflowPage:
+        buffer, offset = self.get_page_image(WriteAheadLog.data_page, page_number)
+        data_page = self.codec.decode_data_page(buffer, page_number, offset)
+        self.metrics.count("data_reads")
 
-    def load_data_page(self, page_number: int = 1) -> DataPage:
-        data_page = DataPage(self.records_per_page, page_number)
-        with open(self.data_filename, "rb") as file:
-            file.seek((page_number - 1) * data_page.max_size)
+        if not data_page.is_overflow():
+            for record in data_page.records:
+                if record.overflow_page is not None:
+                    record.data = self.read_overflow_data(record.overflow_page)
 
-            for _ in range(self.records_per_page):
-                record = DataRecord.deserialize(file)
+        return self.data_buffer.add_if_absent(data_page)
 
-                if record.key != DataRecord.null_byte_key:
-                    data_page.records.append(record)
+    def read_overflow_data(self, page_number: int) -> str:
+        # Overflow pages are read past the buffer, so that reading them never evicts a page in use.
+        parts = []
+        while page_number is not None:
+            overflow_page = self.data_buffer.get(page_number)
+            if overflow_page is None:
+                buffer, offset = self.get_page_image(WriteAheadLog.data_page, page_number)
+                overflow_page = self.codec.decode_data_page(buffer, page_number, offset)
+                self.metrics.count("data_reads")
+            if not overflow_page.is_overflow():
+                break
 
-        self.add_data_page_to_buffer(data_page)
-        self.data_reads += 1
-        return data_page
+            parts.append(overflow_page.data)
+            page_number = overflow_page.next_page
 
-    def load_index_page(self, page_number: int = 1) -> IndexPage:  # == load BTreeNode
-        int_size = 4
-        byte_order = "big"
-
-        index_page = IndexPage(self.records_per_page, page_number)
-        with open(self.index_filename, "rb") as file:
-            file.seek((page_number - 1) * index_page.max_size)
-
-            read_bytes = 0
-            read_counter = 0
-            while read_bytes < index_page.max_size - int_size:
-                number = int.from_bytes(file.read(int_size), byte_order)
-                if read_counter % 3 == 0:
-                    if number != DataRecord.null_byte_key:
-                        index_page.pointers.append(number)
-                    read_bytes += int_size
-                    read_counter += 1
-                else:
-                    key = number
-                    page = int.from_bytes(file.read(int_size), byte_order)
-                    if key != DataRecord.null_byte_key or page != DataRecord.null_byte_key:
-                        index_page.records.append(IndexRecord(key, page))
+        return b"".join(parts).decode("utf-8", errors="replace")
 
-                    read_bytes += 2 * int_size
-                    read_counter += 2
-
-            parent_page = int.from_bytes(file.read(int_size), byte_order)
-            if parent_page != DataRecord.null_byte_key:
-                index_page.parent_page = parent_page
+    def load_index_page(self, page_number: int = 1) -> IndexPage:  # == load BTreeNode
+        buffer, offset = self.get_page_image(WriteAheadLog.index_page, page_number)
+        index_page = self.codec.decode_index_page(buffer, page_number, offset)
+        self.metrics.count("index_reads")
 
-        self.add_index_page_to_buffer(index_page)
-        self.index_reads += 1
-        return index_page
+        if self.layout == "clustered" and index_page.is_leaf():
+            for record in index_page.records:
+                if record.overflow_page is not None:
+                    record.data = self.read_overflow_data(record.overflow_page)
 
-    @staticmethod
-    def move_to_the_beginning(buffer, page: IndexPage | DataPage) -> None:
-        buffer.remove(page)
-        buffer.insert(0, page)
+        # Other threads can read the page at the same time, only the first copy is kept.
+        return self.index_buffer.add_if_absent(index_page)
 
-    def save_data_page(self, data_page: DataPage) -> None:
+    def save_data_page(self, data_page: DataPage | OverflowPage) -> None:
         if data_page.is_dirty():
-            with open(self.data_filename, "rb+") as file:
-                file.seek((data_page.page_number - 1) * data_page.max_size)
-                serialized_entries = data_page.serialize()
-                for entry in serialized_entries:
-                    file.write(entry)
-            self.data_writes += 1
+            self.update_data_space(data_page)
+            self.store_page_image(WriteAheadLog.data_page, data_page.page_number, self.codec.encode_data_page(data_page))
+            data_page.dirty_bit = False
+            self.metrics.count("data_writes")
 
     def save_index_page(self, index_page: IndexPage) -> None:
         if not index_page.is_dirty():
             return
 
-        if index_page.is_empty() and index_page.page_number not in self.index_empty_pages:
-            self.index_empty_pages.append(index_page.page_number)
-
-        with open(self.index_filename, "rb+") as file:
-            # set pointer in file
-            file.seek((index_page.page_number - 1) * index_page.max_size)
-
-            # save to file
-            for entry in index_page.serialize():
-                file.write(entry)
+        self.index_space.set(index_page.page_number, 1 if index_page.is_empty() else 0)
 
-        self.index_writes += 1
+        self.store_page_image(WriteAheadLog.index_page, index_page.page_number,
+                              self.codec.encode_index_page(index_page))
+        index_page.dirty_bit = False
+        self.metrics.count("index_writes")
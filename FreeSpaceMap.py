@@ -0,0 +1,157 @@
+import struct
+
+from PageFile import PageFile
+
+
+class FreeSpaceMap:
+    # Free space of every page of a file, kept in a file of its own: the number of free bytes of a data page, or 1
+    # for a free index page and 0 for a page in use. The whole map is held in memory, together with sets of pages
+    # with free space grouped in buckets: one per level below 8, above it 8 per power of two. Any page of a bucket
+    # starting at or above the needed space fits, and a mask of non empty buckets finds the first of them in O(1).
+    # Only when there is none are the pages of the bucket of the needed space scanned, which differ by less than 1/8.
+    # The map file is made of blocks, only changed blocks are written.
+    block_size = 4096
+    level_format = struct.Struct(">I")
+    max_level = 0xFFFFFFFF
+    bucket_bits = 3     # buckets per power of two are 2 ** bucket_bits
+
+    def __init__(self, filename: str) -> None:
+        self.file = PageFile(filename, FreeSpaceMap.block_size)
+        self.levels_per_block: int = FreeSpaceMap.block_size // FreeSpaceMap.level_format.size
+        self.block_format = struct.Struct(f">{self.levels_per_block}I")
+
+        self.levels: [int] = []
+        self.free_pages: [set] = [set() for _ in range(FreeSpaceMap.get_bucket(FreeSpaceMap.max_level) + 1)]
+        self.used_buckets: int = 0      # bit i set when free_pages[i] is not empty
+        self.dirty_blocks: set = set()
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+# public:
+    def get(self, page_number: int) -> int:
+        if page_number > len(self.levels):
+            return 0
+        return self.levels[page_number - 1]
+
+    def set(self, page_number: int, level: int) -> None:
+        level = min(level, FreeSpaceMap.max_level)
+        if page_number > len(self.levels):
+            if not level:
+                return
+            self.levels.extend([0] * (page_number - len(self.levels)))
+        elif self.levels[page_number - 1] == level:
+            return
+
+        self.remove_free_page(page_number)
+        self.levels[page_number - 1] = level
+        self.dirty_blocks.add((page_number - 1) // self.levels_per_block + 1)
+        self.add_free_page(page_number)
+
+    def find(self, needed: int = 1) -> int | None:
+        # A page with at least needed free space. Every page of a bucket from the first one starting at or above
+        # needed has enough, in the bucket of needed only some of them may have.
+        bucket = FreeSpaceMap.get_bucket(needed)
+        first = bucket if FreeSpaceMap.get_bucket_start(bucket) >= needed else bucket + 1
+        used = self.used_buckets >> first
+        if used:
+            return next(iter(self.free_pages[first + (used & -used).bit_length() - 1]))
+
+        for page_number in self.free_pages[bucket]:
+            if self.levels[page_number - 1] >= needed:
+                return page_number
+        return None
+
+    def get_free_pages(self, last_page: int | None = None) -> [int]:
+        # Pages with free space in increasing order, up to last_page.
+        return sorted(page_number for pages in self.free_pages for page_number in pages
+                      if last_page is None or page_number <= last_page)
+
+    def get_total(self) -> int:
+        return sum(self.levels)
+
+    def get_free_count(self) -> int:
+        return sum(len(pages) for pages in self.free_pages)
+
+    def truncate(self, pages: int) -> None:
+        # Forgets pages after the given number of pages, when the file they belong to is shortened.
+        for page_number in range(pages + 1, len(self.levels) + 1):
+            self.remove_free_page(page_number)
+        del self.levels[pages:]
+
+        blocks = -(-pages // self.levels_per_block)
+        self.dirty_blocks = {block for block in self.dirty_blocks if block <= blocks}
+        if blocks:
+            self.dirty_blocks.add(blocks)
+        self.file.truncate(blocks * FreeSpaceMap.block_size)
+
+    def clear(self) -> None:
+        self.levels = []
+        self.free_pages = [set() for _ in self.free_pages]
+        self.used_buckets = 0
+        self.dirty_blocks = set()
+        self.file.truncate()
+
+    def flush(self, write_block) -> None:
+        # write_block(block number, block) writes the block to the map file, possibly through the write-ahead log.
+        for block_number in sorted(self.dirty_blocks):
+            write_block(block_number, self.encode_block(block_number))
+        self.dirty_blocks = set()
+
+    def write_block(self, block_number: int, block: bytes) -> None:
+        self.file.write_page(block_number, block)
+
+    def sync(self) -> None:
+        self.file.sync()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def load(self) -> None:
+        self.levels = []
+        for block_number in range(1, self.file.get_pages_count() + 1):
+            self.levels.extend(self.block_format.unpack(self.file.read_page(block_number)))
+
+        # The last block is padded with zeros, which are pages not created yet.
+        while self.levels and not self.levels[-1]:
+            self.levels.pop()
+        self.free_pages = [set() for _ in self.free_pages]
+        self.used_buckets = 0
+        for page_number in range(1, len(self.levels) + 1):
+            self.add_free_page(page_number)
+        self.dirty_blocks = set()
+
+# private:
+    @staticmethod
+    def get_bucket(level: int) -> int:
+        # Levels below 2 ** bucket_bits have a bucket each, larger ones share it with the levels of the same highest
+        # bucket_bits + 1 bits.
+        if level >> FreeSpaceMap.bucket_bits == 0:
+            return level
+        shift = level.bit_length() - FreeSpaceMap.bucket_bits - 1
+        return (shift << FreeSpaceMap.bucket_bits) + (level >> shift)
+
+    @staticmethod
+    def get_bucket_start(bucket: int) -> int:
+        # The lowest level of the bucket.
+        shift = max((bucket >> FreeSpaceMap.bucket_bits) - 1, 0)
+        return (bucket - (shift << FreeSpaceMap.bucket_bits)) << shift
+
+    def add_free_page(self, page_number: int) -> None:
+        level = self.levels[page_number - 1]
+        if level:
+            bucket = FreeSpaceMap.get_bucket(level)
+            self.free_pages[bucket].add(page_number)
+            self.used_buckets |= 1 << bucket
+
+    def remove_free_page(self, page_number: int) -> None:
+        bucket = FreeSpaceMap.get_bucket(self.levels[page_number - 1])
+        pages = self.free_pages[bucket]
+        pages.discard(page_number)
+        if not pages:
+            self.used_buckets &= ~(1 << bucket)
+
+    def encode_block(self, block_number: int) -> bytes:
+        start = (block_number - 1) * self.levels_per_block
+        levels = self.levels[start:start + self.levels_per_block]
+        return self.block_format.pack(*levels, *[0] * (self.levels_per_block - len(levels)))
@@ -1,3 +1,6 @@
+import bisect
+import operator
+
 from DataPage import DataRecord
 
 
@@ -8,26 +11,38 @@ class IndexRecord:
 
 
 class IndexPage:
-    next_page: int = 1
     max_size: int = 0
+    record_key = operator.attrgetter("key")   # records are kept sorted by key, so they are bisected on it
 
-    def __init__(self, records_per_page: int, page_number: int | None = None) -> None:
-        INT_SIZE = 4
+    def __init__(self, records_per_page: int, page_number: int) -> None:
         self.records_per_page: int = records_per_page
-        IndexPage.max_size = records_per_page * (3 * INT_SIZE) + INT_SIZE + INT_SIZE
+        IndexPage.max_size = IndexPage.get_max_size(records_per_page)
         self.current_size: int = 0
-
-        if page_number is None:
-            self.page_number: int = IndexPage.next_page
-            IndexPage.next_page += 1
-        else:
-            self.page_number: int = page_number
+        self.page_number: int = page_number
 
         self.records: [IndexRecord] = []
         self.pointers: [int] = []
-        self.parent_page: int | None = None
         self.dirty_bit: bool = False
 
+    @staticmethod
+    def get_max_size(records_per_page: int) -> int:
+        INT_SIZE = 4
+        return records_per_page * (3 * INT_SIZE) + INT_SIZE
+
+    @staticmethod
+    def get_order_for_page_size(page_size: int) -> int:
+        # The largest d for which a page of 2d records fits in the given number of bytes.
+        header_size = IndexPage.get_max_size(0)
+        record_size = IndexPage.get_max_size(1) - header_size
+        d = (page_size - header_size) // (2 * record_size)
+        if d < 1:
+            raise ValueError(f"Page size {page_size} is too small for a single B-Tree node!")
+        return d
+
+    def find_position(self, key: int) -> int:
+        # Position of the record with the given key or, if there is none, of the first record with a greater key.
+        return bisect.bisect_left(self.records, key, key=IndexPage.record_key)
+
     def add_record(self, position: int, record: IndexRecord):
         self.records.insert(position, record)
         self.dirty_bit = True
@@ -68,13 +83,14 @@ class IndexPage:
 
         return self.pointers[:index_to]
 
-    def get_parent(self) -> int:
-        return self.parent_page
-
     def set_record(self, record_number: int, new_record: IndexRecord) -> None:
         self.records[record_number] = new_record
         self.dirty_bit = True
 
+    def set_pointer(self, pointer_number: int, new_pointer: int) -> None:
+        self.pointers[pointer_number] = new_pointer
+        self.dirty_bit = True
+
     def set_records(self, new_records: [IndexRecord]) -> None:
         self.records = new_records
         self.dirty_bit = True
@@ -83,10 +99,6 @@ class IndexPage:
         self.pointers = new_pointers
         self.dirty_bit = True
 
-    def set_parent(self, new_parent_page: int | None) -> None:
-        self.parent_page = new_parent_page
-        self.dirty_bit = True
-
     def remove_record(self, record: IndexRecord) -> None:
         self.records.remove(record)
         self.dirty_bit = True
@@ -95,6 +107,11 @@ class IndexPage:
         self.pointers.remove(pointer)
         self.dirty_bit = True
 
+    def free(self) -> None:
+        self.records = []
+        self.pointers = []
+        self.dirty_bit = True
+
     def serialize(self) -> [bytes]:
         int_size = 4
         byte_order = "big"
@@ -119,11 +136,6 @@ class IndexPage:
             for _ in range(3):
                 result.append(DataRecord.null_byte_key.to_bytes(int_size, byte_order))
 
-        if self.parent_page:
-            result.append(self.parent_page.to_bytes(int_size, byte_order))
-        else:
-            result.append(DataRecord.null_byte_key.to_bytes(int_size, byte_order))
-
         return result
 
     def is_leaf(self) -> bool:
@@ -136,6 +148,6 @@ class IndexPage:
         return self.dirty_bit
 
     def is_empty(self) -> bool:
-        if len(self.records) == 0 and len(self.pointers) == 0 and self.parent_page is None:
+        if len(self.records) == 0 and len(self.pointers) == 0:
             return True
         return False
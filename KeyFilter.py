@@ -0,0 +1,118 @@
+import os
+import struct
+import threading
+
+
+class KeyFilter:
+    # Bloom filter over the keys of a tree, which tells for sure that a key is not in the tree, so lookups and
+    # removals of absent keys need no descent. A key reported present may still be absent, in about one lookup out of
+    # a hundred. Keys cannot be taken out of the filter: removed keys are reported present until it is rebuilt.
+    # The filter is a list of layers of growing capacity, a layer is added once the last one is full, so it never has
+    # to be rebuilt while keys are inserted. A key is added to the last layer and looked up in all of them.
+    magic_number = 0x4B455946   # "KEYF"
+    bits_per_key = 10
+    hash_count = 7              # optimal for bits_per_key, about 0.8% false positives per layer
+    initial_capacity = 1024     # keys of the first layer of an empty filter
+    growth_factor = 4           # capacity of a new layer relative to all keys before it
+    header_format = struct.Struct(">II")        # magic number, layers count
+    layer_format = struct.Struct(">QQ")         # capacity, keys count
+    mask = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self, capacity: int | None = None) -> None:
+        self.layers: [bytearray] = []
+        self.capacities: [int] = []
+        self.counts: [int] = []
+        self.mutex = threading.Lock()   # adding sets bits with read-modify-writes, which must not interleave
+        self.add_layer(capacity if capacity else KeyFilter.initial_capacity)
+
+    def __len__(self) -> int:
+        return sum(self.counts)
+
+# public:
+    def add(self, key: int) -> None:
+        first, step = KeyFilter.hash(key)
+        with self.mutex:
+            if self.counts[-1] >= self.capacities[-1]:
+                self.add_layer(KeyFilter.growth_factor * len(self))
+            bits = self.layers[-1]
+            size = len(bits) * 8
+            for i in range(KeyFilter.hash_count):
+                position = (first + i * step) % size
+                bits[position >> 3] |= 1 << (position & 7)
+            self.counts[-1] += 1
+
+    def may_contain(self, key: int) -> bool:
+        # The last layer, holding most keys, is looked up first.
+        first, step = KeyFilter.hash(key)
+        for bits in reversed(self.layers):
+            size = len(bits) * 8
+            for i in range(KeyFilter.hash_count):
+                position = (first + i * step) % size
+                if not bits[position >> 3] & (1 << (position & 7)):
+                    break
+            else:
+                return True
+        return False
+
+    def save(self, filename: str) -> None:
+        # The file is replaced at once, so it is never found half written.
+        with self.mutex:
+            parts = [KeyFilter.header_format.pack(KeyFilter.magic_number, len(self.layers))]
+            for bits, capacity, count in zip(self.layers, self.capacities, self.counts):
+                parts.append(KeyFilter.layer_format.pack(capacity, count))
+                parts.append(bytes(bits))
+
+        with open(filename + ".tmp", "wb") as file:
+            file.write(b"".join(parts))
+        os.replace(filename + ".tmp", filename)
+
+    @staticmethod
+    def load(filename: str):
+        # Returns None when there is no filter or the file is not a filter.
+        if not os.path.exists(filename):
+            return None
+        with open(filename, "rb") as file:
+            raw = file.read()
+
+        if len(raw) < KeyFilter.header_format.size:
+            return None
+        magic_number, layers_count = KeyFilter.header_format.unpack_from(raw)
+        if magic_number != KeyFilter.magic_number or not layers_count:
+            return None
+
+        key_filter = KeyFilter()
+        key_filter.layers, key_filter.capacities, key_filter.counts = [], [], []
+        offset = KeyFilter.header_format.size
+        for _ in range(layers_count):
+            if offset + KeyFilter.layer_format.size > len(raw):
+                return None
+            capacity, count = KeyFilter.layer_format.unpack_from(raw, offset)
+            offset += KeyFilter.layer_format.size
+            size = KeyFilter.get_layer_size(capacity)
+            if offset + size > len(raw):
+                return None
+            key_filter.layers.append(bytearray(raw[offset:offset + size]))
+            key_filter.capacities.append(capacity)
+            key_filter.counts.append(count)
+            offset += size
+        return key_filter
+
+# private:
+    @staticmethod
+    def hash(key: int) -> (int, int):
+        # Positions of the key in a layer are first + i * step, for i below hash_count (double hashing). Both come
+        # from one 64 bit hash, mixed like in splitmix64, so that neighbouring keys spread over the whole layer.
+        z = (key + 0x9E3779B97F4A7C15) & KeyFilter.mask
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & KeyFilter.mask
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & KeyFilter.mask
+        z ^= z >> 31
+        return z >> 32, (z & 0xFFFFFFFF) | 1
+
+    @staticmethod
+    def get_layer_size(capacity: int) -> int:
+        return -(-capacity * KeyFilter.bits_per_key // 8)
+
+    def add_layer(self, capacity: int) -> None:
+        self.layers.append(bytearray(KeyFilter.get_layer_size(capacity)))
+        self.capacities.append(capacity)
+        self.counts.append(0)
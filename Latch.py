@@ -0,0 +1,96 @@
+import contextlib
+import threading
+
+
+class Latch:
+    # Reader-writer latch: any number of threads hold it shared, or a single thread holds it exclusively. Threads
+    # waiting for the exclusive latch hold new shared requests back, so a stream of readers cannot starve them.
+    # The exclusive holder can take the latch again in either mode, which only nests. A shared holder can neither
+    # take it again nor upgrade it.
+
+    def __init__(self) -> None:
+        self.condition = threading.Condition(threading.Lock())
+        self.readers: int = 0
+        self.writers_waiting: int = 0
+        self.owner: int | None = None   # ident of the thread holding the latch exclusively
+        self.depth: int = 0             # nested acquisitions of the exclusive holder
+
+# public:
+    def acquire(self, exclusive: bool = False) -> None:
+        if exclusive:
+            self.acquire_exclusive()
+        else:
+            self.acquire_shared()
+
+    def release(self, exclusive: bool = False) -> None:
+        if exclusive:
+            self.release_exclusive()
+        else:
+            self.release_shared()
+
+    def acquire_shared(self) -> None:
+        if self.is_owned():
+            self.depth += 1
+            return
+
+        with self.condition:
+            while self.owner is not None or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_shared(self) -> None:
+        if self.is_owned():
+            self.depth -= 1
+            return
+
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_exclusive(self, blocking: bool = True) -> bool:
+        # Without blocking the latch is taken only if no other thread holds it or waits for it, returns whether it was.
+        if self.is_owned():
+            self.depth += 1
+            return True
+
+        with self.condition:
+            if not blocking and (self.owner is not None or self.readers or self.writers_waiting):
+                return False
+
+            self.writers_waiting += 1
+            while self.owner is not None or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.owner = threading.get_ident()
+            self.depth = 1
+            return True
+
+    def release_exclusive(self) -> None:
+        self.depth -= 1
+        if self.depth:
+            return
+
+        with self.condition:
+            self.owner = None
+            self.condition.notify_all()
+
+    def is_owned(self) -> bool:
+        # Whether the calling thread holds the latch exclusively.
+        return self.owner == threading.get_ident()
+
+    @contextlib.contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield self
+        finally:
+            self.release_shared()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        self.acquire_exclusive()
+        try:
+            yield self
+        finally:
+            self.release_exclusive()
@@ -0,0 +1,206 @@
+import bisect
+import functools
+import json
+import threading
+import time
+
+
+class LatencyHistogram:
+    # Counts of latencies in buckets with the given upper bounds in seconds, the last bucket has no upper bound.
+
+    def __init__(self, bounds: [float]) -> None:
+        self.bounds: [float] = bounds
+        self.counts: [int] = [0] * (len(bounds) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def get_quantile(self, quantile: float) -> float:
+        # Upper bound of the bucket holding the given quantile, but never more than the largest latency recorded.
+        rank = quantile * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.get_quantile(0.5),
+            "p99": self.get_quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.bounds + [float("inf")], self.counts)},
+        }
+
+
+class OperationState(threading.local):
+    # The operation being measured, every thread has its own.
+
+    def __init__(self) -> None:
+        self.depth: int = 0
+        self.operation: str | None = None
+        self.start: float = 0.0
+        self.start_counters: dict | None = None
+
+
+class Metrics:
+    # Counters of a tree since it was opened and of its last operation, and latency histograms of every operation
+    # type. Counters are either counted as things happen or taken from collectors, functions returning current
+    # values of counters kept elsewhere, like buffer hits, which are read at the start and the end of operations.
+    # Operations can be nested, e.g. update is a remove and an insert, only the outermost one is measured.
+    # Operations of other threads running at the same time are counted in the counters of the last operation too.
+    counter_names = ("index_reads", "index_writes", "data_reads", "data_writes", "index_buffer_hits",
+                     "index_buffer_misses", "data_buffer_hits", "data_buffer_misses", "splits", "compensations",
+                     "merges", "root_changes", "log_commits", "log_syncs", "prefetched_pages", "key_filter_skips")
+    latency_bounds = [0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                      0.1, 0.25, 0.5, 1.0, 2.5]
+
+    def __init__(self) -> None:
+        self.counters: dict = dict.fromkeys(Metrics.counter_names, 0)
+        self.operation_counters: dict = dict.fromkeys(Metrics.counter_names, 0)
+        self.last_operation: str | None = None
+        self.latencies: dict = {}   # operation name -> LatencyHistogram
+        self.collectors: list = []
+        self.collector_offsets: dict = {}   # collected values at the last reset
+        # Hooks are called with the event name, "begin" or "end" and the arguments of the traced method.
+        self.trace_hooks: list = []
+
+        self.mutex = threading.Lock()
+        self.state = OperationState()
+
+# public:
+    def count(self, name: str, n: int = 1) -> None:
+        with self.mutex:
+            self.counters[name] += n
+
+    def add_collector(self, collector) -> None:
+        self.collectors.append(collector)
+        self.collect()
+
+    def add_trace_hook(self, hook) -> None:
+        self.trace_hooks.append(hook)
+
+    def remove_trace_hook(self, hook) -> None:
+        self.trace_hooks.remove(hook)
+
+    def begin_operation(self, name: str) -> None:
+        state = self.state
+        state.depth += 1
+        if state.depth > 1:
+            return
+
+        with self.mutex:
+            self.collect()
+            state.start_counters = dict(self.counters)
+        state.operation = name
+        state.start = time.perf_counter()
+
+    def end_operation(self) -> None:
+        state = self.state
+        state.depth -= 1
+        if state.depth:
+            return
+
+        seconds = time.perf_counter() - state.start
+        with self.mutex:
+            self.collect()
+            self.operation_counters = {name: value - state.start_counters[name]
+                                       for name, value in self.counters.items()}
+            self.last_operation = state.operation
+            histogram = self.latencies.get(state.operation)
+            if histogram is None:
+                histogram = self.latencies[state.operation] = LatencyHistogram(Metrics.latency_bounds)
+            histogram.add(seconds)
+        state.operation = None
+
+    def call_trace_hooks(self, event: str, phase: str, arguments: tuple) -> None:
+        for hook in self.trace_hooks:
+            hook(event, phase, arguments)
+
+    def get_counters(self) -> dict:
+        with self.mutex:
+            self.collect()
+            return dict(self.counters)
+
+    def get_operation_counters(self) -> dict:
+        # Counters of the last finished operation.
+        return dict(self.operation_counters)
+
+    def get_latencies(self) -> dict:
+        with self.mutex:
+            return {name: histogram.to_dict() for name, histogram in self.latencies.items()}
+
+    def reset(self) -> None:
+        # Cumulative counters kept by collectors are not reset, they are only counted from now on.
+        with self.mutex:
+            self.counters = dict.fromkeys(Metrics.counter_names, 0)
+            self.operation_counters = dict.fromkeys(Metrics.counter_names, 0)
+            self.latencies = {}
+            self.collector_offsets = {}
+            self.collect_offsets()
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "counters": self.get_counters(),
+            "last_operation": {"name": self.last_operation, "counters": self.get_operation_counters()},
+            "latencies": self.get_latencies(),
+        }, indent=2)
+
+    def to_prometheus(self, prefix: str = "btree") -> str:
+        # Text exposition format: a counter for every counter and a histogram of latencies labelled by operation.
+        lines = []
+        for name, value in self.get_counters().items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+
+        lines.append(f"# TYPE {prefix}_operation_seconds histogram")
+        with self.mutex:
+            histograms = list(self.latencies.items())
+        for operation, histogram in histograms:
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_operation_seconds_sum{{operation="{operation}"}} {histogram.sum}')
+            lines.append(f'{prefix}_operation_seconds_count{{operation="{operation}"}} {histogram.count}')
+
+        return "\n".join(lines) + "\n"
+
+# private:
+    def collect(self) -> None:
+        for collector in self.collectors:
+            for name, value in collector().items():
+                self.counters[name] = value - self.collector_offsets.get(name, 0)
+
+    def collect_offsets(self) -> None:
+        for collector in self.collectors:
+            self.collector_offsets.update(collector())
+
+
+def traced(event: str, counter: str | None = None):
+    # Decorates a tree method, so that it is counted in the given counter and trace hooks are called around it.
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *arguments, **keyword_arguments):
+            metrics = self.metrics
+            if counter is not None:
+                metrics.count(counter)
+            if not metrics.trace_hooks:
+                return method(self, *arguments, **keyword_arguments)
+
+            metrics.call_trace_hooks(event, "begin", arguments)
+            try:
+                return method(self, *arguments, **keyword_arguments)
+            finally:
+                metrics.call_trace_hooks(event, "end", arguments)
+        return wrapper
+    return decorator
@@ -0,0 +1,311 @@
+import struct
+
+from BPlusPage import BPlusPage, ClusteredPage
+from DataPage import DataPage, OverflowPage
+from DataRecord import DataRecord
+from IndexPage import IndexPage, IndexRecord
+
+
+class PageCodec:
+    # Packs pages into preallocated buffers with struct.pack_into and unpacks them with struct.unpack_from straight
+    # from the buffer holding the page, which may be the memory map of the file.
+    # The index page layout is the same as the one of IndexPage.serialize:
+    #   index page:    pointer, records_per_page * (key, data page number, pointer)
+    #   data page:     kind, slots count, slots count * (key, data offset, data length), free space, data of the
+    #                  slots packed from the end of the page
+    #   overflow page: kind, key, next page, data length, data
+    # Unused fields are filled with DataRecord.null_byte_key. When a page size is given, index pages are padded with
+    # zeros up to it. The data length in a slot has overflow_flag set when the data is the first overflow page.
+    data_kind = 0           # pages that were never written read as zeros, so they are empty data pages
+    overflow_kind = 1
+    overflow_flag = 0x80000000
+
+    def __init__(self, records_per_page: int, index_page_size: int | None = None,
+                 data_page_size: int | None = None) -> None:
+        self.records_per_page: int = records_per_page
+
+        self.index_struct = struct.Struct(f">{3 * records_per_page + 1}I")
+        self.empty_index_values: [int] = [DataRecord.null_byte_key] * (3 * records_per_page + 1)
+        self.index_buffer = bytearray(max(self.index_struct.size, index_page_size or 0))
+
+        self.data_page_size: int = data_page_size if data_page_size else DataPage.get_page_size(records_per_page)
+        self.data_header_struct = struct.Struct(">II")
+        self.slot_struct = struct.Struct(">III")
+        self.overflow_reference_struct = struct.Struct(">I")
+        self.overflow_header_struct = struct.Struct(">IIII")
+        self.data_buffer = bytearray(self.data_page_size)
+
+        self.data_record_header_struct = struct.Struct(">II")   # key and data length of a record out of a page
+
+# public:
+    def create_index_page(self, page_number: int) -> IndexPage:
+        return IndexPage(self.records_per_page, page_number)
+
+    def encode_index_page(self, index_page: IndexPage) -> bytearray:
+        # The returned buffer is reused by the next call.
+        values = self.empty_index_values.copy()
+        records_end = 3 * len(index_page.records)
+
+        values[1:records_end + 1:3] = [record.key for record in index_page.records]
+        values[2:records_end + 2:3] = [record.data_page_number for record in index_page.records]
+        if index_page.pointers:
+            values[0] = index_page.pointers[0]
+            values[3:records_end + 3:3] = index_page.pointers[1:]
+
+        self.index_struct.pack_into(self.index_buffer, 0, *values)
+        return self.index_buffer
+
+    def decode_index_page(self, buffer, page_number: int, offset: int = 0) -> IndexPage:
+        index_page = self.create_index_page(page_number)
+        if len(buffer) - offset < self.index_struct.size:
+            return index_page
+
+        values = self.index_struct.unpack_from(buffer, offset)
+        null = DataRecord.null_byte_key
+
+        keys = values[1::3]
+        data_page_numbers = values[2::3]
+        count = 0
+        while count < self.records_per_page and (keys[count] != null or data_page_numbers[count] != null):
+            count += 1
+
+        index_page.records = [IndexRecord(keys[i], data_page_numbers[i]) for i in range(count)]
+        if values[0] != null:
+            index_page.pointers = [values[0]] + list(values[3:3 * count + 3:3])
+
+        return index_page
+
+    def encode_data_page(self, data_page: DataPage | OverflowPage) -> bytearray:
+        # The returned buffer is reused by the next call.
+        if data_page.is_overflow():
+            return self.encode_overflow_page(data_page)
+
+        data_end = self.data_page_size
+        slot_offset = self.data_header_struct.size
+        for record in data_page.records:
+            if record.overflow_page is not None:
+                data = self.overflow_reference_struct.pack(record.overflow_page)
+                length = len(data) | PageCodec.overflow_flag
+            else:
+                data = record.data.encode("utf-8")
+                length = len(data)
+
+            data_end -= len(data)
+            self.data_buffer[data_end:data_end + len(data)] = data
+            self.slot_struct.pack_into(self.data_buffer, slot_offset, record.key, data_end, length)
+            slot_offset += self.slot_struct.size
+
+        self.data_header_struct.pack_into(self.data_buffer, 0, PageCodec.data_kind, len(data_page.records))
+        self.data_buffer[slot_offset:data_end] = bytes(data_end - slot_offset)
+        return self.data_buffer
+
+    def decode_data_page(self, buffer, page_number: int, offset: int = 0) -> DataPage | OverflowPage:
+        # Data of records kept in overflow pages is not read, those records have only overflow_page set.
+        data_page = DataPage(self.data_page_size, page_number)
+        if len(buffer) - offset < self.data_page_size:
+            return data_page
+
+        kind, count = self.data_header_struct.unpack_from(buffer, offset)
+        if kind == PageCodec.overflow_kind:
+            return self.decode_overflow_page(buffer, page_number, offset)
+
+        slot_offset = offset + self.data_header_struct.size
+        for _ in range(count):
+            key, data_offset, length = self.slot_struct.unpack_from(buffer, slot_offset)
+            slot_offset += self.slot_struct.size
+
+            data_offset += offset
+            if length & PageCodec.overflow_flag:
+                overflow_page, = self.overflow_reference_struct.unpack_from(buffer, data_offset)
+                record = DataRecord(key, None, overflow_page)
+                data_page.free_space -= DataPage.slot_size + DataPage.overflow_reference_size
+            else:
+                record = DataRecord(key, bytes(buffer[data_offset:data_offset + length]).decode("utf-8"))
+                data_page.free_space -= DataPage.slot_size + length
+            data_page.records.append(record)
+
+        return data_page
+
+    def encode_data_record(self, record: DataRecord) -> bytes:
+        data = record.data.encode("utf-8")
+        return self.data_record_header_struct.pack(record.key, len(data)) + data
+
+    def read_data_record(self, file) -> DataRecord | None:
+        # Reads a record written by encode_data_record, returns None at the end of the file.
+        header = file.read(self.data_record_header_struct.size)
+        if len(header) < self.data_record_header_struct.size:
+            return None
+
+        key, length = self.data_record_header_struct.unpack(header)
+        return DataRecord(key, file.read(length).decode("utf-8"))
+
+# private:
+    def encode_overflow_page(self, overflow_page: OverflowPage) -> bytearray:
+        next_page = overflow_page.next_page if overflow_page.next_page is not None else DataRecord.null_byte_key
+        self.overflow_header_struct.pack_into(self.data_buffer, 0, PageCodec.overflow_kind, overflow_page.key,
+                                              next_page, len(overflow_page.data))
+
+        data_start = self.overflow_header_struct.size
+        data_end = data_start + len(overflow_page.data)
+        self.data_buffer[data_start:data_end] = overflow_page.data
+        self.data_buffer[data_end:] = bytes(self.data_page_size - data_end)
+        return self.data_buffer
+
+    def decode_overflow_page(self, buffer, page_number: int, offset: int = 0) -> OverflowPage:
+        _, key, next_page, length = self.overflow_header_struct.unpack_from(buffer, offset)
+
+        overflow_page = OverflowPage(page_number)
+        overflow_page.key = key
+        overflow_page.next_page = next_page if next_page != DataRecord.null_byte_key else None
+        data_start = offset + self.overflow_header_struct.size
+        overflow_page.data = bytes(buffer[data_start:data_start + length])
+        return overflow_page
+
+
+class BPlusPageCodec(PageCodec):
+    # Index pages of the B+ tree layout:
+    #   kind, records count, previous leaf, next leaf, first pointer, capacity * (key, data page number or pointer)
+    # Data pages are the same as in the B-Tree layout.
+
+    def __init__(self, records_per_page: int, index_page_size: int | None = None,
+                 data_page_size: int | None = None) -> None:
+        super().__init__(records_per_page, None, data_page_size)
+
+        page_size = index_page_size if index_page_size else BPlusPage.get_max_size(records_per_page)
+        self.capacity: int = BPlusPage.get_capacity(page_size)
+        self.leaf_capacity: int = self.capacity
+
+        self.index_struct = struct.Struct(f">{5 + 2 * self.capacity}I")
+        self.empty_index_values: [int] = [DataRecord.null_byte_key] * (5 + 2 * self.capacity)
+        self.index_buffer = bytearray(max(self.index_struct.size, page_size))
+
+# public:
+    def create_index_page(self, page_number: int) -> BPlusPage:
+        return BPlusPage(self.capacity, page_number)
+
+    def encode_index_page(self, index_page: BPlusPage) -> bytearray:
+        values = self.empty_index_values.copy()
+        records_end = 5 + 2 * len(index_page.records)
+
+        if index_page.is_leaf():
+            values[0] = BPlusPage.leaf_kind
+            values[6:records_end:2] = [record.data_page_number for record in index_page.records]
+        elif index_page.is_empty():
+            values[0] = BPlusPage.free_kind
+        else:
+            values[0] = BPlusPage.internal_kind
+            values[4] = index_page.pointers[0]
+            values[6:records_end:2] = index_page.pointers[1:]
+
+        values[1] = len(index_page.records)
+        values[5:records_end:2] = [record.key for record in index_page.records]
+        if index_page.prev_page is not None:
+            values[2] = index_page.prev_page
+        if index_page.next_page is not None:
+            values[3] = index_page.next_page
+
+        self.index_struct.pack_into(self.index_buffer, 0, *values)
+        return self.index_buffer
+
+    def decode_index_page(self, buffer, page_number: int, offset: int = 0) -> BPlusPage:
+        index_page = self.create_index_page(page_number)
+        if len(buffer) - offset < self.index_struct.size:
+            return index_page
+
+        values = self.index_struct.unpack_from(buffer, offset)
+        null = DataRecord.null_byte_key
+
+        # Pages that were never written read as zeros, so they are free pages too.
+        kind, count = values[0], values[1]
+        if kind not in (BPlusPage.leaf_kind, BPlusPage.internal_kind):
+            return index_page
+
+        keys = values[5:5 + 2 * count:2]
+        numbers = values[6:6 + 2 * count:2]
+        index_page.leaf = kind == BPlusPage.leaf_kind
+        if index_page.leaf:
+            index_page.records = [IndexRecord(keys[i], numbers[i]) for i in range(count)]
+        else:
+            index_page.records = [IndexRecord(key, None) for key in keys]
+            index_page.pointers = [values[4]] + list(numbers)
+
+        index_page.prev_page = values[2] if values[2] != null else None
+        index_page.next_page = values[3] if values[3] != null else None
+        return index_page
+
+
+class ClusteredPageCodec(BPlusPageCodec):
+    # Index pages of the clustered layout. Internal pages are the same as in the B+ tree layout, leaves are:
+    #   kind, records count, previous leaf, next leaf, unused, leaf_capacity * (key, data length, data)
+    # The data length has overflow_flag set when the data is the number of the first overflow page.
+
+    def __init__(self, records_per_page: int, index_page_size: int | None = None,
+                 data_page_size: int | None = None) -> None:
+        page_size = index_page_size if index_page_size else ClusteredPage.get_max_size(records_per_page)
+        super().__init__(records_per_page, page_size, data_page_size)
+        self.leaf_capacity: int = ClusteredPage.get_leaf_capacity(page_size)
+
+        self.leaf_header_struct = struct.Struct(">5I")
+        self.leaf_entry_struct = struct.Struct(f">II{ClusteredPage.inline_data_size}s")
+
+# public:
+    def create_index_page(self, page_number: int) -> ClusteredPage:
+        return ClusteredPage(self.capacity, page_number)
+
+    def encode_index_page(self, index_page: ClusteredPage) -> bytearray:
+        if not index_page.is_leaf():
+            return super().encode_index_page(index_page)
+
+        null = DataRecord.null_byte_key
+        prev_page = index_page.prev_page if index_page.prev_page is not None else null
+        next_page = index_page.next_page if index_page.next_page is not None else null
+        self.leaf_header_struct.pack_into(self.index_buffer, 0, BPlusPage.leaf_kind, len(index_page.records),
+                                          prev_page, next_page, null)
+
+        offset = self.leaf_header_struct.size
+        for record in index_page.records:
+            self.leaf_entry_struct.pack_into(self.index_buffer, offset, *self.get_leaf_entry(record))
+            offset += self.leaf_entry_struct.size
+        self.index_buffer[offset:] = bytes(len(self.index_buffer) - offset)
+        return self.index_buffer
+
+    def decode_index_page(self, buffer, page_number: int, offset: int = 0) -> ClusteredPage:
+        # Data of records kept in overflow pages is not read, those records have only overflow_page set.
+        if len(buffer) - offset < self.index_struct.size:
+            return super().decode_index_page(buffer, page_number, offset)
+
+        kind, count, prev_page, next_page, _ = self.leaf_header_struct.unpack_from(buffer, offset)
+        if kind != BPlusPage.leaf_kind:
+            return super().decode_index_page(buffer, page_number, offset)
+
+        leaf = self.create_index_page(page_number)
+        leaf.leaf = True
+        leaf.prev_page = prev_page if prev_page != DataRecord.null_byte_key else None
+        leaf.next_page = next_page if next_page != DataRecord.null_byte_key else None
+
+        entries = self.leaf_entry_struct.size
+        start = offset + self.leaf_header_struct.size
+        leaf.records = [self.get_leaf_record(*self.leaf_entry_struct.unpack_from(buffer, start + i * entries))
+                        for i in range(count)]
+        return leaf
+
+    def encode_leaf_record(self, record: DataRecord) -> bytes:
+        # The slot of the record in a leaf, also used to spill leaf records while a tree is built.
+        return self.leaf_entry_struct.pack(*self.get_leaf_entry(record))
+
+    def decode_leaf_record(self, entry: bytes) -> DataRecord:
+        return self.get_leaf_record(*self.leaf_entry_struct.unpack(entry))
+
+# private:
+    def get_leaf_entry(self, record: DataRecord) -> (int, int, bytes):
+        if record.overflow_page is not None:
+            data = self.overflow_reference_struct.pack(record.overflow_page)
+            return record.key, len(data) | PageCodec.overflow_flag, data
+
+        data = record.data.encode("utf-8")
+        return record.key, len(data), data
+
+    def get_leaf_record(self, key: int, length: int, data: bytes) -> DataRecord:
+        if length & PageCodec.overflow_flag:
+            return DataRecord(key, None, self.overflow_reference_struct.unpack_from(data)[0])
+        return DataRecord(key, data[:length].decode("utf-8"))
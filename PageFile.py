@@ -0,0 +1,157 @@
+import mmap
+import os
+
+
+class PageFile:
+    # A file of fixed size pages, numbered from 1, which stays open until close() is called.
+    # Whole pages are read and written with a single call, either through a memory map or with pread/pwrite.
+    # A file opened read-only can be written by another process meanwhile, see refresh().
+    # Pages about to be read can be asked for ahead, see prefetch, and once pages are read one after another, the
+    # following ones are asked for before they are read. The OS then reads them in the background.
+    growth_pages = 64   # a mapped file is extended by at least that many pages at once
+    readahead_pages = 32    # pages asked for ahead of sequential reads, 0 switches it off
+
+    def __init__(self, filename: str, page_size: int, use_mmap: bool = False, read_only: bool = False) -> None:
+        self.filename: str = filename
+        self.page_size: int = page_size
+        self.use_mmap: bool = use_mmap
+        self.read_only: bool = read_only
+
+        flags = os.O_RDONLY if read_only else os.O_RDWR | os.O_CREAT
+        self.fd: int = os.open(filename, flags | getattr(os, "O_BINARY", 0), 0o644)
+        self.size: int = os.fstat(self.fd).st_size
+        self.mapped_size: int = 0
+        self.map: mmap.mmap | None = None
+        self.map_file(self.size)
+        self.last_read: int = 0         # number of the page read last
+        self.advised_until: int = 0     # pages before it were already asked for by the sequential read-ahead
+
+# public:
+    @staticmethod
+    def align_to_os_page(size: int) -> int:
+        # Rounds the size up to a multiple of the OS memory page, so that pages never straddle two OS pages.
+        return -(-size // mmap.PAGESIZE) * mmap.PAGESIZE
+
+    def read_page(self, page_number: int) -> bytes:
+        self.read_ahead(page_number)
+        offset = (page_number - 1) * self.page_size
+        if self.map is not None:
+            return self.map[offset:min(offset + self.page_size, self.size)]
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, self.page_size, offset)
+
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        return os.read(self.fd, self.page_size)
+
+    def get_page_buffer(self, page_number: int) -> (bytes | mmap.mmap, int):
+        # Returns a buffer holding the page and the page offset in it. A mapped file is returned as it is,
+        # so the page can be decoded without copying it.
+        if self.map is not None:
+            self.read_ahead(page_number)
+            offset = (page_number - 1) * self.page_size
+            if offset + self.page_size <= self.size:
+                return self.map, offset
+        return self.read_page(page_number), 0
+
+    def write_page(self, page_number: int, data: bytes) -> None:
+        offset = (page_number - 1) * self.page_size
+        end = offset + len(data)
+
+        if self.use_mmap:
+            if end > self.mapped_size:
+                self.resize(max(end, self.mapped_size + max(self.mapped_size // 2,
+                                                            PageFile.growth_pages * self.page_size)))
+            self.map[offset:end] = data
+            self.size = max(self.size, end)
+            return
+
+        if hasattr(os, "pwrite"):
+            os.pwrite(self.fd, data, offset)
+        else:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            os.write(self.fd, data)
+        self.size = max(self.size, end)
+
+    def prefetch(self, page_numbers) -> int:
+        # Asks the OS to read the pages in the background, neighbouring pages with a single request. It is only a
+        # hint, which does nothing where the OS takes none. Returns the number of pages asked for.
+        page_numbers = sorted(set(page_numbers))
+        first = 0
+        for i in range(1, len(page_numbers) + 1):
+            if i == len(page_numbers) or page_numbers[i] != page_numbers[i - 1] + 1:
+                self.advise(page_numbers[first], i - first)
+                first = i
+        return len(page_numbers)
+
+    def get_pages_count(self) -> int:
+        return self.size // self.page_size
+
+    def refresh(self) -> None:
+        # Takes the size of a file that another process could have changed.
+        self.size = os.fstat(self.fd).st_size
+        if self.map is not None and self.size != self.mapped_size:
+            self.unmap_file()
+            self.map_file(self.size)
+
+    def truncate(self, size: int = 0) -> None:
+        self.resize(size)
+        self.size = size
+
+    def sync(self) -> None:
+        if self.map is not None:
+            self.map.flush()
+        os.fsync(self.fd)
+
+    def close(self) -> None:
+        if self.fd < 0:
+            return
+
+        if self.map is not None and not self.read_only:
+            self.map.flush()
+        self.unmap_file()
+        if self.mapped_size > self.size and not self.read_only:
+            # Space reserved ahead of the last page is given back.
+            os.ftruncate(self.fd, self.size)
+        os.close(self.fd)
+        self.fd = -1
+
+# private:
+    def map_file(self, size: int) -> None:
+        # An empty file cannot be mapped, so the map is created with the first page.
+        self.mapped_size = size
+        if self.use_mmap and size > 0:
+            self.map = mmap.mmap(self.fd, size, access=mmap.ACCESS_READ if self.read_only else mmap.ACCESS_WRITE)
+
+    def unmap_file(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def read_ahead(self, page_number: int) -> None:
+        # A read of the page after the one read last continues a sequential run, which is then asked for
+        # readahead_pages ahead, in windows of half of that. Concurrent readers can only make the hint less useful.
+        if page_number == self.last_read + 1 and page_number + PageFile.readahead_pages // 2 >= self.advised_until:
+            start = max(page_number + 1, self.advised_until)
+            self.advised_until = page_number + 1 + PageFile.readahead_pages
+            if self.advised_until > start:
+                self.advise(start, self.advised_until - start)
+        self.last_read = page_number
+
+    def advise(self, first_page: int, count: int) -> None:
+        offset = (first_page - 1) * self.page_size
+        length = min(count * self.page_size, self.size - offset)
+        if length <= 0:
+            return
+
+        if self.map is not None:
+            # The range of a map has to start at a memory page.
+            start = offset - offset % mmap.PAGESIZE
+            if hasattr(self.map, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+                self.map.madvise(mmap.MADV_WILLNEED, start, min(offset + length, self.mapped_size) - start)
+        elif hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.fd, offset, length, os.POSIX_FADV_WILLNEED)
+
+    def resize(self, size: int) -> None:
+        self.unmap_file()
+        os.ftruncate(self.fd, size)
+        self.map_file(size)
@@ -1,24 +1,105 @@
 import os
+import sys
+import time
 if os.name != 'nt':
-    import getch
+    try:
+        import getch
+    except ImportError:
+        getch = None    # only the interactive menu needs it, scripts run without it
 
+from BPlusTree import BPlusTree
 from BTree import BTree
-from DataRecord import generate_random_record_data
+from ClusteredTree import ClusteredTree
+from DataRecord import DataRecord, generate_random_record_data
 
 
 class ProgramManager:
-    def __init__(self, d) -> None:
-        self.btree = BTree(d)
+    script_commands = ("insert", "search", "get", "remove", "update", "upsert", "range", "checkpoint", "vacuum",
+                       "metrics")
 
-    def run(self) -> None:
-        self.main_loop()
+    def __init__(self, d, reopen: bool = True, page_size: int | None = None, bplus: bool = False,
+                 clustered: bool = False, **options) -> None:
+        # options are passed to the B-Tree, see BTree.__init__. The tree is reopened when its catalog, the default one
+        # or the one given in options, exists.
+        if reopen and BTree.exists(options.get("catalog_filename", "data/catalog.txt")):
+            self.btree = BTree.open(**options)
+        elif bplus:
+            self.btree = BPlusTree.create(d, page_size=page_size, **options)
+        elif clustered:
+            self.btree = ClusteredTree.create(d, page_size=page_size, **options)
+        else:
+            self.btree = BTree.create(d, page_size=page_size, **options)
+
+    def run(self, script=None) -> None:
+        # With a script given, its commands are run instead of the menu, see run_script.
+        try:
+            if script is None:
+                self.main_loop()
+            else:
+                self.run_script(script)
+        finally:
+            self.btree.close()
+
+    def run_script(self, lines, output=sys.stdout) -> dict:
+        # Runs one command per line:
+        #   insert KEY [DATA]           random data is generated when none is given
+        #   search KEY
+        #   get KEY [KEY ...]           prints the records, all keys are looked up together
+        #   remove KEY
+        #   update OLD_KEY NEW_KEY [DATA]
+        #   upsert KEY [DATA]           inserts the record or replaces the one with the key
+        #   range LOW HIGH
+        #   checkpoint, vacuum
+        #   metrics [json|prometheus]   prints the metrics of the tree
+        # Empty lines and lines starting with # are skipped. Operations print nothing of their own, only found keys,
+        # records in ranges and failed operations are written to output as they come. At the end, the totals are
+        # printed and returned.
+        self.btree.verbose = False
+        counts = dict.fromkeys(ProgramManager.script_commands, 0)
+        failures = 0
+        errors = 0
+        start_counters = self.btree.metrics.get_counters()
+
+        start = time.perf_counter()
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            try:
+                command, succeeded = self.execute_script_command(line, output)
+            except ValueError as error:
+                print(f"line {line_number}: {error}", file=sys.stderr)
+                errors += 1
+                continue
+
+            counts[command] += 1
+            failures += not succeeded
+        seconds = time.perf_counter() - start
+
+        operations = sum(counts.values())
+        totals = {
+            "operations": operations,
+            "commands": counts,
+            "failed": failures,
+            "errors": errors,
+            "seconds": seconds,
+            "ops_per_second": operations / seconds if seconds else 0.0,
+            "counters": {name: value - start_counters[name]
+                         for name, value in self.btree.metrics.get_counters().items()},
+            "latencies": self.btree.metrics.get_latencies(),
+            "height": self.btree.h,
+        }
+        self.btree.verbose = True
+        self.print_script_totals(totals)
+        return totals
 
     def main_loop(self) -> None:
         running = True
         while running:
             self.print_menu()
 
-            if os.name == 'nt':
+            if os.name == 'nt' or getch is None:
                 choosen_option = input()
             else:
                 choosen_option = getch.getch()
@@ -42,11 +123,17 @@ class ProgramManager:
                 case '8':
                     self.btree.filesHandler.print_data_file()
                     pass
+                case '9':
+                    self.command_range()
+                case 'v':
+                    self.btree.vacuum()
+                case 'm':
+                    print(self.btree.metrics.to_json())
                 case 'q':
                     running = False
                     break
 
-            if os.name == 'nt':
+            if os.name == 'nt' or getch is None:
                 pass
             else:
                 print("\npress any button to continue")
@@ -85,6 +172,121 @@ class ProgramManager:
         except:
             pass
 
+    def command_range(self) -> None:
+        try:
+            print("Range")
+            low = int(input("Enter lowest key: "))
+            high = int(input("Enter highest key: "))
+            for record in self.btree.range(low, high):
+                print(record)
+            self.btree.print_reads_and_writes()
+        except:
+            pass
+
+    def execute_script_command(self, line: str, output) -> (str, bool):
+        # Returns the command and whether it succeeded, which only a rejected insert, remove or update does not.
+        # Raises ValueError for a line that is not a valid command.
+        command, *arguments = line.split(maxsplit=1)
+        command = command.lower()
+        arguments = arguments[0] if arguments else ""
+
+        match command:
+            case "insert":
+                key, data = self.parse_script_arguments(line, arguments, 1)
+                inserted = self.btree.insert(self.create_script_record(key[0], data))
+                if not inserted:
+                    print(f"insert {key[0]}: key exists", file=output)
+                return command, inserted
+            case "search":
+                key, _ = self.parse_script_arguments(line, arguments, 1, data=False)
+                found = self.btree.search(key[0])
+                print(f"{key[0]} {'found' if found else 'not found'}", file=output)
+                return command, True
+            case "get":
+                keys, _ = self.parse_script_arguments(line, arguments, len(arguments.split()), data=False)
+                if not keys:
+                    raise ValueError(f"wrong number of arguments in {line!r}")
+                for key, record in zip(keys, self.btree.get_many(keys)):
+                    print(record if record is not None else f"{key} not found", file=output)
+                return command, True
+            case "remove":
+                key, _ = self.parse_script_arguments(line, arguments, 1, data=False)
+                removed = self.btree.remove(key[0])
+                if not removed:
+                    print(f"remove {key[0]}: no such key", file=output)
+                return command, removed
+            case "update":
+                (old_key, new_key), data = self.parse_script_arguments(line, arguments, 2)
+                updated = self.btree.update(old_key, self.create_script_record(new_key, data))
+                if not updated:
+                    print(f"update {old_key}: no such key or key {new_key} exists", file=output)
+                return command, updated
+            case "upsert":
+                key, data = self.parse_script_arguments(line, arguments, 1)
+                self.btree.upsert(self.create_script_record(key[0], data))
+                return command, True
+            case "range":
+                (low, high), _ = self.parse_script_arguments(line, arguments, 2, data=False, bounds=True)
+                for record in self.btree.range(low, high):
+                    print(record, file=output)
+                return command, True
+            case "checkpoint" | "vacuum":
+                self.parse_script_arguments(line, arguments, 0, data=False)
+                getattr(self.btree, command)()
+                return command, True
+            case "metrics":
+                if arguments not in ("", "json", "prometheus"):
+                    raise ValueError(f"unknown metrics format {arguments!r}")
+                if arguments == "prometheus":
+                    print(self.btree.metrics.to_prometheus(), end="", file=output)
+                else:
+                    print(self.btree.metrics.to_json(), file=output)
+                return command, True
+
+        raise ValueError(f"unknown command {command!r}")
+
+    @staticmethod
+    def parse_script_arguments(line: str, arguments: str, keys: int, data: bool = True,
+                               bounds: bool = False) -> ([int], str | None):
+        # Splits arguments into the given number of integer keys and, if allowed, the data taking the rest of the line.
+        # Keys have to be ones the tree can store, unless they are only bounds of a range.
+        parts = arguments.split(maxsplit=keys)
+        if len(parts) < keys or (len(parts) > keys and not data):
+            raise ValueError(f"wrong number of arguments in {line!r}")
+        try:
+            parsed_keys = [int(part) for part in parts[:keys]]
+        except ValueError:
+            raise ValueError(f"key is not an integer in {line!r}") from None
+        if not bounds and any(not 0 <= key < DataRecord.null_byte_key for key in parsed_keys):
+            raise ValueError(f"key out of range 0..{DataRecord.null_byte_key - 1} in {line!r}")
+        return parsed_keys, parts[keys] if len(parts) > keys else None
+
+    @staticmethod
+    def create_script_record(key: int, data: str | None) -> DataRecord:
+        if data is None:
+            return generate_random_record_data(key, verbose=False)
+        return DataRecord(key, data)
+
+    @staticmethod
+    def print_script_totals(totals: dict) -> None:
+        print(f"{totals['operations']} operations in {totals['seconds']:.3f} s, "
+              f"{totals['ops_per_second']:.0f} ops/s, {totals['failed']} failed, {totals['errors']} invalid lines",
+              file=sys.stderr)
+        print("\t" + "\t".join(f"{command}: {count}" for command, count in totals["commands"].items() if count),
+              file=sys.stderr)
+        counters = totals["counters"]
+        print(f"\tIndex\treads: {counters['index_reads']}\twrites: {counters['index_writes']}"
+              f"\tbuffer hits: {counters['index_buffer_hits']}\tmisses: {counters['index_buffer_misses']}",
+              file=sys.stderr)
+        print(f"\tData\treads: {counters['data_reads']}\twrites: {counters['data_writes']}"
+              f"\tbuffer hits: {counters['data_buffer_hits']}\tmisses: {counters['data_buffer_misses']}",
+              file=sys.stderr)
+        print(f"\tsplits: {counters['splits']}\tcompensations: {counters['compensations']}"
+              f"\tmerges: {counters['merges']}\theight: {totals['height']}", file=sys.stderr)
+        for operation, latency in totals["latencies"].items():
+            print(f"\t{operation}\tp50: {latency['p50'] * 1000:.3f} ms\tp99: {latency['p99'] * 1000:.3f} ms"
+                  f"\tmax: {latency['max'] * 1000:.3f} ms", file=sys.stderr)
+
     @staticmethod
     def print_menu() -> None:
         if os.name != 'nt':
@@ -99,6 +301,9 @@ class ProgramManager:
         print("\t[6] Update")
         print("\t[7] Print index file")
         print("\t[8] Prind data file")
+        print("\t[9] Range")
+        print("\t[V] Vacuum")
+        print("\t[M] Metrics")
 
         print("\t[Q] Quit")
         print()
\ No newline at end of file
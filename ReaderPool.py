@@ -0,0 +1,76 @@
+import concurrent.futures
+import os
+
+from BTree import BTree
+from DataRecord import DataRecord
+
+reader: BTree | None = None     # the tree of a worker process, open read-only
+
+
+def open_reader(files: dict, options: dict) -> None:
+    global reader
+    reader = BTree.open(**files, read_only=True, **options)
+    reader.verbose = False
+
+
+def search_keys(keys: [int]) -> [bool]:
+    return reader.read_snapshot(lambda: [reader.search(key) for key in keys])
+
+
+def get_keys(keys: [int]) -> [DataRecord | None]:
+    return reader.read_snapshot(lambda: list(reader.get_many(keys)))
+
+
+def scan(low: int, high: int) -> [DataRecord]:
+    return reader.read_snapshot(lambda: list(reader.range(low, high)))
+
+
+class ReaderPool:
+    # Serves lookups and range scans of a tree from a pool of processes, so that they are not limited by a single
+    # interpreter lock. Every process opens the tree read-only and answers from the last state published by the
+    # process writing it, which keeps working meanwhile, see BTree.read_snapshot. The answer to one call of a
+    # process comes from a single state, answers of different calls and processes can come from different ones.
+
+    def __init__(self, index_filename: str = "data/index.txt", data_filename: str = "data/data.txt",
+                 catalog_filename: str = "data/catalog.txt", processes: int | None = None, **options) -> None:
+        # options are passed to the tree of every process, e.g. buffer_size, see BTree.__init__.
+        self.processes: int = processes if processes else os.cpu_count() or 1
+        files = {"index_filename": index_filename, "data_filename": data_filename,
+                 "catalog_filename": catalog_filename}
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.processes, initializer=open_reader,
+                                                           initargs=(files, options))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+# public:
+    def search_many(self, keys) -> [bool]:
+        return self.run_split(search_keys, list(keys))
+
+    def get_many(self, keys) -> [DataRecord | None]:
+        # Every process looks up a part of the keys with BTree.get_many.
+        return self.run_split(get_keys, list(keys))
+
+    def range(self, low: int, high: int) -> [DataRecord]:
+        # Records with keys from low to high inclusive, in key order. The keys are split into a range of equal
+        # width for every process.
+        if low > high:
+            return []
+
+        width = -(-(high - low + 1) // self.processes)
+        futures = [self.pool.submit(scan, start, min(start + width - 1, high))
+                   for start in range(low, high + 1, width)]
+        return [record for future in futures for record in future.result()]
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+
+# private:
+    def run_split(self, function, keys: list) -> list:
+        # Runs the function on parts of the keys of similar size, one per process, and joins the results in order.
+        size = max(1, -(-len(keys) // self.processes))
+        futures = [self.pool.submit(function, keys[i:i + size]) for i in range(0, len(keys), size)]
+        return [result for future in futures for result in future.result()]
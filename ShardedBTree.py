@@ -0,0 +1,307 @@
+import bisect
+import concurrent.futures
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import shutil
+import tempfile
+
+from BPlusTree import BPlusTree
+from BTree import BTree
+from ClusteredTree import ClusteredTree
+from DataRecord import DataRecord
+
+
+def shard_files(directory: str) -> dict:
+    return {"index_filename": os.path.join(directory, "index.txt"),
+            "data_filename": os.path.join(directory, "data.txt"),
+            "catalog_filename": os.path.join(directory, "catalog.txt")}
+
+
+def read_records(btree: BTree, spill):
+    record = btree.filesHandler.codec.read_data_record(spill)
+    while record is not None:
+        yield record
+        record = btree.filesHandler.codec.read_data_record(spill)
+
+
+def build_shard(directory: str, options: dict, spill_filename: str, fill_factor: float, run_size: int | None) -> int:
+    # Runs in a process of the pool. Bulk loads the shard from the records ShardedBTree.bulk_load spilled for it.
+    with BTree.open(**shard_files(directory), **options) as btree:
+        btree.verbose = False
+        with open(spill_filename, "rb") as spill:
+            return btree.bulk_load(read_records(btree, spill), fill_factor, run_size)
+
+
+def rebuild_shard(directory: str, options: dict, fill_factor: float) -> int:
+    # Runs in a process of the pool. Bulk loads the records of the shard in key order into new files next to it,
+    # which then take the place of the old ones, see replace_shard.
+    new_directory = directory + ".new"
+    shutil.rmtree(new_directory, ignore_errors=True)
+    os.makedirs(new_directory)
+
+    with BTree.open(**shard_files(directory), **options) as btree:
+        btree.verbose = False
+        with type(btree)(btree.d, **shard_files(new_directory), create=True,
+                         page_size=btree.filesHandler.catalog.page_size, **options) as new_btree:
+            new_btree.verbose = False
+            count = new_btree.bulk_load(btree.cursor(), fill_factor)
+
+    replace_shard(directory)
+    return count
+
+
+def replace_shard(directory: str) -> None:
+    # A crash between the renames is finished by recover_shard.
+    os.rename(directory, directory + ".old")
+    os.rename(directory + ".new", directory)
+    shutil.rmtree(directory + ".old")
+
+
+def recover_shard(directory: str) -> None:
+    # Without the shard, the old one was moved aside after the new one was complete, which then takes its place. A
+    # new shard left next to an existing one is from a rebuild that did not finish.
+    if not os.path.exists(directory) and os.path.exists(directory + ".new"):
+        os.rename(directory + ".new", directory)
+    shutil.rmtree(directory + ".old", ignore_errors=True)
+    shutil.rmtree(directory + ".new", ignore_errors=True)
+
+
+class ShardedBTree:
+    # Spreads records over shards, independent trees with files of their own in numbered subdirectories of one
+    # directory, which can be links to different disks. A key belongs to a single shard: with "hash" partitioning
+    # to the one its hash picks, with "range" partitioning to the one whose key range holds it, the ranges being
+    # split by the bounds. Operations on a key run on its shard only, ranges are read from all shards that can hold
+    # them and merged in key order. The partitioning is saved in the manifest in the directory.
+    # Bulk loading and rebuilding run on a pool of processes, one shard per process, so they scale with cores and
+    # disks. Meanwhile the shards are closed, so no other operation can run.
+    manifest_filename = "shards.json"
+    partitionings = ("hash", "range")
+    hash_multiplier = 2654435761    # Knuth's multiplicative hash, spreads keys with a common stride over all shards
+    max_key = DataRecord.null_byte_key - 1
+
+    def __init__(self, directory: str, partitioning: str, bounds: [int], shards: [BTree], options: dict) -> None:
+        self.directory: str = directory
+        self.partitioning: str = partitioning
+        self.bounds: [int] = bounds     # for range partitioning, the first key of every shard but the first one
+        self.shards: [BTree] = shards
+        self.options: dict = options    # passed to every shard when it is opened, see BTree.__init__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+# public:
+    @staticmethod
+    def create(shards: int = 4, d: int = 2, directory: str = "data/shards", partitioning: str = "hash",
+               bounds: list[int] | None = None, page_size: int | None = None, bplus: bool = False,
+               clustered: bool = False, **options):
+        # Without bounds, range partitioning splits the keys from 0 to max_key into ranges of equal width. bplus
+        # and clustered choose the layout of the shards, see BPlusTree and ClusteredTree.
+        if shards < 1:
+            raise ValueError("At least one shard is needed!")
+        if partitioning not in ShardedBTree.partitionings:
+            raise ValueError(f"Unknown partitioning {partitioning!r}!")
+
+        if partitioning == "hash":
+            bounds = []
+        elif bounds is None:
+            bounds = [(ShardedBTree.max_key + 1) * i // shards for i in range(1, shards)]
+        elif len(bounds) != shards - 1 or any(low >= high for low, high in zip(bounds, bounds[1:])):
+            raise ValueError(f"Range partitioning of {shards} shards needs {shards - 1} increasing bounds!")
+
+        os.makedirs(directory, exist_ok=True)
+        tree_class = BPlusTree if bplus else ClusteredTree if clustered else BTree
+        trees = []
+        for i in range(shards):
+            shard_directory = os.path.join(directory, str(i))
+            os.makedirs(shard_directory, exist_ok=True)
+            trees.append(tree_class.create(d, **shard_files(shard_directory), page_size=page_size, **options))
+            trees[-1].verbose = False
+
+        with open(os.path.join(directory, ShardedBTree.manifest_filename), "w") as file:
+            json.dump({"shards": shards, "partitioning": partitioning, "bounds": bounds}, file)
+        return ShardedBTree(directory, partitioning, list(bounds), trees, options)
+
+    @staticmethod
+    def open(directory: str = "data/shards", **options):
+        with open(os.path.join(directory, ShardedBTree.manifest_filename)) as file:
+            manifest = json.load(file)
+
+        trees = []
+        for i in range(manifest["shards"]):
+            shard_directory = os.path.join(directory, str(i))
+            recover_shard(shard_directory)
+            trees.append(BTree.open(**shard_files(shard_directory), **options))
+            trees[-1].verbose = False
+        return ShardedBTree(directory, manifest["partitioning"], manifest["bounds"], trees, options)
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+
+    def checkpoint(self) -> None:
+        for shard in self.shards:
+            shard.checkpoint()
+
+    def insert(self, record: DataRecord) -> bool:
+        return self.shard_of(record.key).insert(record)
+
+    def search(self, key: int) -> bool:
+        return self.shard_of(key).search(key)
+
+    def get(self, key: int) -> DataRecord | None:
+        return self.shard_of(key).get(key)
+
+    def get_many(self, keys) -> [DataRecord | None]:
+        # Returns the record of every key, or None if there is none, in the order of the keys. Keys of a shard are
+        # looked up together, see BTree.get_many.
+        keys = list(keys)
+        records = {}
+        for shard_number, shard_keys in self.group_by_shard(keys).items():
+            records.update(zip(shard_keys, self.shards[shard_number].get_many(shard_keys)))
+        return [records[key] for key in keys]
+
+    def remove(self, key: int) -> bool:
+        return self.shard_of(key).remove(key)
+
+    def insert_many(self, records) -> int:
+        # Records of every shard are inserted in one batch of it.
+        groups = {}
+        for record in records:
+            groups.setdefault(self.shard_number(record.key), []).append(record)
+        return sum(self.shards[shard_number].insert_many(group) for shard_number, group in groups.items())
+
+    def remove_many(self, keys) -> int:
+        return sum(self.shards[shard_number].remove_many(shard_keys)
+                   for shard_number, shard_keys in self.group_by_shard(keys).items())
+
+    @contextlib.contextmanager
+    def batch(self):
+        # A batch of every shard, see BTree.batch. Each shard writes its pages at the end, so a crash can leave the
+        # changes of some shards only.
+        with contextlib.ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.batch())
+            yield self
+
+    def update(self, old_key: int, record: DataRecord) -> bool:
+        # Within one shard see BTree.update. A record moving to another shard is inserted there first and then
+        # removed from its old one, so a crash in between leaves it in both shards.
+        old_shard = self.shard_of(old_key)
+        new_shard = self.shard_of(record.key)
+        if old_shard is new_shard:
+            return old_shard.update(old_key, record)
+
+        if not old_shard.search(old_key) or not new_shard.insert(record):
+            return False
+        return old_shard.remove(old_key)
+
+    def update_value(self, key: int, data: str) -> bool:
+        return self.shard_of(key).update_value(key, data)
+
+    def upsert(self, record: DataRecord) -> bool:
+        return self.shard_of(record.key).upsert(record)
+
+    def range(self, low: int, high: int):
+        # Yields records with keys from low to high inclusive, in key order. With range partitioning the shards are
+        # read one after another, with hash partitioning all of them at once and their records are merged.
+        if self.partitioning == "range":
+            first, last = self.shard_number(low), self.shard_number(high)
+            return itertools.chain.from_iterable(shard.range(low, high) for shard in self.shards[first:last + 1])
+        return heapq.merge(*[shard.range(low, high) for shard in self.shards], key=lambda record: record.key)
+
+    def bulk_load(self, records, fill_factor: float = 1.0, run_size: int | None = None,
+                  processes: int | None = None) -> int:
+        # Builds all shards, which have to be empty, from records in any order. The records are spilled to a file of
+        # every shard, then the shards are built from them in parallel, see BTree.bulk_load. Returns the number of
+        # records loaded.
+        if any(shard.root_page is not None for shard in self.shards):
+            raise ValueError("Bulk loading requires an empty B-Tree!")
+
+        spills = []
+        try:
+            for i, shard in enumerate(self.shards):
+                fd, filename = tempfile.mkstemp(prefix="bulk_", dir=self.shard_directory(i))
+                spills.append((filename, os.fdopen(fd, "wb")))
+            for record in records:
+                shard_number = self.shard_number(record.key)
+                spills[shard_number][1].write(self.shards[shard_number].filesHandler.codec.encode_data_record(record))
+            for _, spill in spills:
+                spill.close()
+
+            return sum(self.run_on_shards(processes, build_shard, lambda i: (spills[i][0], fill_factor, run_size)))
+        finally:
+            for filename, spill in spills:
+                spill.close()
+                os.remove(filename)
+
+    def rebuild(self, fill_factor: float = 1.0, processes: int | None = None) -> int:
+        # Builds every shard again from its records, with pages filled to the fill factor and the files as short as
+        # they can be, in parallel. Returns the number of records.
+        return sum(self.run_on_shards(processes, rebuild_shard, lambda i: (fill_factor,)))
+
+    def vacuum(self) -> (int, int):
+        # Returns numbers of moved records and moved index pages of all shards, see BTree.vacuum.
+        moved_records, moved_pages = 0, 0
+        for shard in self.shards:
+            records, pages = shard.vacuum()
+            moved_records += records
+            moved_pages += pages
+        return moved_records, moved_pages
+
+    def print(self, print_records: bool = False) -> None:
+        for i, shard in enumerate(self.shards):
+            print(f"Shard {i}:")
+            shard.print(print_records)
+
+    def check_structure(self) -> int:
+        # Checks every shard, see BTree.check_structure, and that its records belong to it. Returns the number of
+        # records.
+        count = 0
+        for i, shard in enumerate(self.shards):
+            count += shard.check_structure()
+            for record in shard.cursor():
+                if self.shard_number(record.key) != i:
+                    raise ValueError(f"Key {record.key} is in shard {i} instead of {self.shard_number(record.key)}!")
+        return count
+
+# private:
+    def shard_number(self, key: int) -> int:
+        if self.partitioning == "range":
+            return bisect.bisect_right(self.bounds, key)
+        # The high bits of the product are the ones mixed from all bits of the key.
+        return (key * ShardedBTree.hash_multiplier % 2 ** 32) * len(self.shards) >> 32
+
+    def shard_of(self, key: int) -> BTree:
+        return self.shards[self.shard_number(key)]
+
+    def shard_directory(self, shard_number: int) -> str:
+        return os.path.join(self.directory, str(shard_number))
+
+    def group_by_shard(self, keys) -> {int: [int]}:
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.shard_number(key), []).append(key)
+        return groups
+
+    def run_on_shards(self, processes: int | None, function, arguments) -> list:
+        # Closes the shards, runs function(shard directory, options, *arguments(shard number)) for every shard on a
+        # pool of processes and opens the shards again. Returns the results in shard order.
+        for shard in self.shards:
+            shard.close()
+        try:
+            processes = processes if processes else min(len(self.shards), os.cpu_count() or 1)
+            with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+                futures = [pool.submit(function, self.shard_directory(i), self.options, *arguments(i))
+                           for i in range(len(self.shards))]
+                return [future.result() for future in futures]
+        finally:
+            for i in range(len(self.shards)):
+                recover_shard(self.shard_directory(i))
+                self.shards[i] = BTree.open(**shard_files(self.shard_directory(i)), **self.options)
+                self.shards[i].verbose = False
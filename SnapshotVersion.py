@@ -0,0 +1,101 @@
+import contextlib
+import mmap
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:     # without it, e.g. on Windows, a reader only ever reads again
+    fcntl = None
+
+
+class SnapshotVersion:
+    # Version of the tree state held by the files, kept in a small file of its own, which the writer and read-only
+    # readers in other processes map into memory. It works like a sequence lock: the writer makes the version odd
+    # before it writes the first page in place and even again once the files hold a consistent tree. A reader
+    # takes an even version, reads pages and checks that the version is still the same, otherwise what it read
+    # could mix two states and is read again. Neither side waits for the other one, unless a reader that keeps
+    # failing holds the writer off, see hold.
+    size = 8
+    byte_order = "big"
+
+    def __init__(self, filename: str, read_only: bool = False) -> None:
+        self.filename: str = filename
+        self.read_only: bool = read_only
+        self.map: mmap.mmap | None = None
+        self.lock_fd: int | None = None     # the file open for its lock, which the writer holds while writing
+        self.mutex = threading.Lock()
+
+        if read_only:
+            self.map_for_reading()
+        else:
+            self.lock_fd = os.open(filename, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            if os.fstat(self.lock_fd).st_size < SnapshotVersion.size:
+                os.ftruncate(self.lock_fd, SnapshotVersion.size)
+            self.map = mmap.mmap(self.lock_fd, SnapshotVersion.size)
+
+        # An odd version left by a writer that crashed is made even by the next publish.
+        self.writing: bool = not read_only and self.read() % 2 == 1
+        if self.writing:
+            self.lock(fcntl.LOCK_EX if fcntl else None)
+
+# public:
+    def read(self) -> int:
+        if self.map is None and (not self.read_only or not self.map_for_reading()):
+            return 0
+        return int.from_bytes(self.map[:SnapshotVersion.size], SnapshotVersion.byte_order)
+
+    def begin_write(self) -> None:
+        # Called before every write in place, only the first one after a publish changes the version. It waits
+        # for readers holding the writer off.
+        with self.mutex:
+            if not self.writing:
+                self.lock(fcntl.LOCK_EX if fcntl else None)
+                self.write(self.read() + 1)
+                self.writing = True
+
+    def publish(self) -> None:
+        # Called once the files hold a consistent tree.
+        with self.mutex:
+            if self.writing:
+                self.write(self.read() + 1)
+                self.writing = False
+                self.lock(fcntl.LOCK_UN if fcntl else None)
+
+    @contextlib.contextmanager
+    def hold(self):
+        # For a reader. Waits until the writer has published and keeps it from writing in place until the block
+        # ends, so that the version read in it stays the same. Readers hold it along each other.
+        if self.map is None:
+            self.map_for_reading()
+        self.lock(fcntl.LOCK_SH if fcntl else None)
+        try:
+            yield
+        finally:
+            self.lock(fcntl.LOCK_UN if fcntl else None)
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+
+# private:
+    def map_for_reading(self) -> bool:
+        # Without the file no writer has published anything since the tree was written, the version is then 0
+        # until one does.
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) < SnapshotVersion.size:
+            return False
+
+        self.lock_fd = os.open(self.filename, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        self.map = mmap.mmap(self.lock_fd, SnapshotVersion.size, access=mmap.ACCESS_READ)
+        return True
+
+    def lock(self, operation: int | None) -> None:
+        if operation is not None and self.lock_fd is not None:
+            fcntl.flock(self.lock_fd, operation)
+
+    def write(self, version: int) -> None:
+        self.map[:SnapshotVersion.size] = version.to_bytes(SnapshotVersion.size, SnapshotVersion.byte_order)
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import os
+import random
+import string
+import sys
+import tempfile
+import threading
+import time
+
+from BPlusTree import BPlusTree
+from BTree import BTree
+from ClusteredTree import ClusteredTree
+from DataRecord import DataRecord
+from TreeExecutor import TreeExecutor
+
+
+class StressTest:
+    # Runs threads that change and read one tree at the same time, each of them in its own range of keys. Every
+    # thread keeps a model of its range and checks all it reads against it. The structure of the tree is checked
+    # while they run, and its contents once they are done and again after the tree is reopened. A violation raises
+    # ValueError.
+    layouts = {"btree": BTree, "bplus": BPlusTree, "clustered": ClusteredTree}
+    operations = ("insert", "remove", "upsert", "update_value", "get", "search", "get_many", "range")
+
+    def __init__(self, layout: str = "btree", d: int = 2, threads: int = 4, operations_per_thread: int = 2000,
+                 keys_per_thread: int = 500, seed: int = 0, check_interval: float = 0.05, **options) -> None:
+        # options are passed to the created tree, see BTree.__init__.
+        if layout not in StressTest.layouts:
+            raise ValueError(f"Unknown layout {layout}!")
+
+        self.layout: str = layout
+        self.d: int = d
+        self.threads: int = threads
+        self.operations_per_thread: int = operations_per_thread
+        self.keys_per_thread: int = keys_per_thread
+        self.seed: int = seed
+        self.check_interval: float = check_interval   # seconds between structure checks
+        self.options: dict = options
+        self.structure_checks: int = 0
+
+# public:
+    def run(self) -> dict:
+        # Returns counts of what was done and checked.
+        models = [{} for _ in range(self.threads)]
+        done = threading.Event()
+
+        with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+            files = {
+                "index_filename": os.path.join(directory, "index.txt"),
+                "data_filename": os.path.join(directory, "data.txt"),
+                "catalog_filename": os.path.join(directory, "catalog.txt"),
+            }
+            # Messages of the tree are switched off by the executor, only the reopened tree could print.
+            with contextlib.redirect_stdout(devnull):
+                btree = StressTest.layouts[self.layout].create(self.d, **files, **self.options)
+                start = time.perf_counter()
+                with TreeExecutor(btree, self.threads + 1) as executor:
+                    self.preload(executor, models)
+                    checker = executor.submit(self.check_while, btree, done)
+                    workers = [executor.submit(self.work, btree, thread, models[thread])
+                               for thread in range(self.threads)]
+                    try:
+                        for worker in workers:
+                            worker.result()
+                    finally:
+                        done.set()
+                    checker.result()
+                seconds = time.perf_counter() - start
+
+                expected = sorted(item for model in models for item in model.items())
+                self.check_contents(btree, expected)
+                btree.close()
+
+                btree = BTree.open(**files, **self.options)
+                btree.verbose = False
+                try:
+                    self.check_contents(btree, expected)
+                finally:
+                    btree.close()
+
+        return {
+            "layout": self.layout,
+            "d": self.d,
+            "threads": self.threads,
+            "operations": self.threads * self.operations_per_thread,
+            "seconds": seconds,
+            "records": len(expected),
+            "structure_checks": self.structure_checks,
+        }
+
+# private:
+    def key_range(self, thread: int) -> range:
+        return range(thread * self.keys_per_thread, (thread + 1) * self.keys_per_thread)
+
+    def preload(self, executor: TreeExecutor, models: [dict]) -> None:
+        # Fills every range with half of its keys, in parallel.
+        rng = random.Random(self.seed)
+        records = []
+        for thread, model in enumerate(models):
+            for key in rng.sample(self.key_range(thread), self.keys_per_thread // 2):
+                record = self.create_record(rng, key)
+                model[key] = record.data
+                records.append(record)
+
+        inserted = executor.insert_many(records)
+        if inserted != len(records):
+            raise ValueError(f"Inserted {inserted} of {len(records)} preloaded records!")
+
+    def check_while(self, btree: BTree, done: threading.Event) -> None:
+        while not done.wait(self.check_interval):
+            btree.check_structure()
+            self.structure_checks += 1
+
+    def work(self, btree: BTree, thread: int, model: dict) -> None:
+        rng = random.Random(self.seed * 1000 + thread + 1)
+        keys = self.key_range(thread)
+        for _ in range(self.operations_per_thread):
+            operation = rng.choice(StressTest.operations)
+            key = rng.choice(keys)
+            match operation:
+                case "insert":
+                    record = self.create_record(rng, key)
+                    self.expect(operation, key, btree.insert(record), key not in model)
+                    model.setdefault(key, record.data)
+                case "remove":
+                    self.expect(operation, key, btree.remove(key), key in model)
+                    model.pop(key, None)
+                case "upsert":
+                    record = self.create_record(rng, key)
+                    self.expect(operation, key, btree.upsert(record), key not in model)
+                    model[key] = record.data
+                case "update_value":
+                    data = self.create_record(rng, key).data
+                    self.expect(operation, key, btree.update_value(key, data), key in model)
+                    if key in model:
+                        model[key] = data
+                case "get":
+                    record = btree.get(key)
+                    self.expect(operation, key, record.data if record else None, model.get(key))
+                case "search":
+                    self.expect(operation, key, btree.search(key), key in model)
+                case "get_many":
+                    chosen = rng.sample(keys, 20)
+                    found = [record.data if record else None for record in btree.get_many(chosen)]
+                    self.expect(operation, chosen[0], found, [model.get(key) for key in chosen])
+                case "range":
+                    low = rng.choice(keys)
+                    high = min(low + 50, keys.stop - 1)
+                    found = [(record.key, record.data) for record in btree.range(low, high)]
+                    self.expect(operation, low, found, sorted(item for item in model.items() if low <= item[0] <= high))
+
+    @staticmethod
+    def expect(operation: str, key: int, result, expected) -> None:
+        if result != expected:
+            raise ValueError(f"{operation} of key {key} returned {result!r} instead of {expected!r}!")
+
+    @staticmethod
+    def check_contents(btree: BTree, expected: [tuple]) -> None:
+        records = btree.check_structure()
+        if records != len(expected):
+            raise ValueError(f"The tree holds {records} records instead of {len(expected)}!")
+        found = [(record.key, record.data) for record in btree.range(0, expected[-1][0] if expected else 0)]
+        if found != expected:
+            raise ValueError("Records of the tree differ from the ones written!")
+
+    @staticmethod
+    def create_record(rng: random.Random, key: int) -> DataRecord:
+        # Now and then data too long for a data page, which goes to overflow pages.
+        length = rng.randint(1, DataRecord.max_length) if rng.random() < 0.95 else rng.randint(200, 1000)
+        return DataRecord(key, "".join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+
+
+def main():
+    # Usage: StressTest.py [--layouts btree bplus clustered] [--orders D ...] [--threads N] [--operations N] [--keys N]
+    # Exits with status 1 when a check fails.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layouts", nargs="+", default=["btree", "bplus"], choices=list(StressTest.layouts))
+    parser.add_argument("--orders", type=int, nargs="+", default=[2, 8], help="orders d of the trees")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--operations", type=int, default=2000, help="operations run by every thread")
+    parser.add_argument("--keys", type=int, default=500, help="keys in the range of every thread")
+    parser.add_argument("--buffer-size", type=int, default=16, help="buffer size in pages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--wal", action="store_true", help="write changes through the write-ahead log")
+    arguments = parser.parse_args()
+
+    for layout in arguments.layouts:
+        for d in arguments.orders:
+            stress_test = StressTest(layout, d, arguments.threads, arguments.operations, arguments.keys,
+                                     arguments.seed, buffer_size=arguments.buffer_size, wal=arguments.wal)
+            try:
+                result = stress_test.run()
+            except ValueError as error:
+                print(f"{layout} d={d}: {error}")
+                sys.exit(1)
+            print(f"{layout:<6} d={d:<3} threads={result['threads']:<3}{result['operations']:>8} operations in "
+                  f"{result['seconds']:.2f} s\trecords: {result['records']}\tstructure checks: "
+                  f"{result['structure_checks']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import collections
+
+
+class TreeClient:
+    # Client of a TreeServer, see its protocol. Requests are sent as soon as they are made, without waiting for the
+    # responses to earlier ones, so concurrent calls on one client are pipelined over its connection. An ERROR
+    # response raises ValueError.
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.waiting = collections.deque()  # futures of the requests sent, in the order of their responses
+        self.receiver = asyncio.create_task(self.receive_responses())
+
+    @staticmethod
+    async def connect(host: str = "127.0.0.1", port: int = 7070, path: str | None = None):
+        # With path given, connects to a Unix socket instead of host and port.
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return TreeClient(reader, writer)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+# public:
+    async def get(self, key: int) -> str | None:
+        # Returns data of the record with the key, None if there is none.
+        response = (await self.request(f"GET {key}"))[0]
+        return response[len("VALUE "):] if response.startswith("VALUE ") else None
+
+    async def put(self, key: int, data: str) -> None:
+        await self.request(f"PUT {key} {self.check_data(data)}")
+
+    async def delete(self, key: int) -> bool:
+        # Returns whether there was a record with the key.
+        return (await self.request(f"DEL {key}"))[0] == "OK"
+
+    async def range(self, low: int, high: int) -> [(int, str)]:
+        # Returns (key, data) of the records with keys from low to high inclusive, in key order.
+        records = []
+        for line in (await self.request(f"RANGE {low} {high}"))[1:]:
+            key, data = line.split(" ", 1)
+            records.append((int(key), data))
+        return records
+
+    async def batch(self, changes: [(int, str | None)]) -> int:
+        # Applies changes (key, data) together, data None removes the key. Returns the number of changes that
+        # changed the tree.
+        lines = [f"BATCH {len(changes)}"]
+        for key, data in changes:
+            lines.append(f"DEL {key}" if data is None else f"PUT {key} {self.check_data(data)}")
+        response = (await self.request("\n".join(lines)))[0]
+        return int(response.split()[1])
+
+    async def ping(self) -> bool:
+        return (await self.request("PING"))[0] == "PONG"
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self.receiver
+
+# private:
+    async def request(self, text: str) -> [str]:
+        # Sends the request and returns the lines of its response.
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        self.writer.write((text + "\n").encode("utf-8"))
+        await self.writer.drain()
+        lines = await future
+        if lines[0].startswith("ERROR"):
+            raise ValueError(lines[0][len("ERROR "):] + "!")
+        return lines
+
+    async def receive_responses(self) -> None:
+        # Responses come in request order, every one completes the oldest request waiting.
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+
+                lines = [line.decode("utf-8").rstrip("\n")]
+                if lines[0].startswith("RECORDS "):
+                    for _ in range(int(lines[0].split()[1])):
+                        lines.append((await self.reader.readline()).decode("utf-8").rstrip("\n"))
+                self.waiting.popleft().set_result(lines)
+        except ConnectionError:
+            pass
+        finally:
+            while self.waiting:
+                self.waiting.popleft().set_exception(ConnectionError("Connection closed!"))
+
+    @staticmethod
+    def check_data(data: str) -> str:
+        if not data or "\n" in data:
+            raise ValueError("Data must be a non-empty single line!")
+        return data
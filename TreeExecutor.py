@@ -0,0 +1,68 @@
+import concurrent.futures
+
+from BTree import BTree
+from DataRecord import DataRecord
+
+
+class TreeExecutor:
+    # Runs operations of a tree on a pool of threads. Lookups run along each other, and so do changes of different
+    # leaves, see BTree.run_latched. Threads share the interpreter lock, so the work scales only as far as it waits
+    # for page reads and writes. Messages of the tree are switched off until the executor is closed.
+
+    def __init__(self, btree: BTree, workers: int = 4) -> None:
+        if workers < 1:
+            raise ValueError("At least one worker is needed!")
+
+        self.btree = btree
+        self.workers: int = workers
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="btree")
+        self.verbose: bool = btree.verbose
+        btree.verbose = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+# public:
+    def submit(self, function, *arguments) -> concurrent.futures.Future:
+        return self.pool.submit(function, *arguments)
+
+    def map(self, operation: str, arguments) -> list:
+        # Calls the tree method of the given name with every argument, returns the results in argument order.
+        method = getattr(self.btree, operation)
+        return list(self.pool.map(method, arguments))
+
+    def search_many(self, keys) -> [bool]:
+        return self.map("search", keys)
+
+    def get_many(self, keys) -> [DataRecord | None]:
+        # Every worker looks up a part of the keys with BTree.get_many, which shares page reads between them.
+        parts = self.split(list(keys))
+        futures = [self.pool.submit(lambda part: list(self.btree.get_many(part)), part) for part in parts]
+        return [record for future in futures for record in future.result()]
+
+    def insert_many(self, records) -> int:
+        # Records are split into ranges of consecutive keys, one per worker, so that workers mostly change
+        # different leaves. Returns the number of records inserted.
+        parts = self.split(sorted(records, key=lambda record: record.key))
+        return self.run_parts(self.btree.insert, parts)
+
+    def remove_many(self, keys) -> int:
+        parts = self.split(sorted(keys))
+        return self.run_parts(self.btree.remove, parts)
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+        self.btree.verbose = self.verbose
+
+# private:
+    def split(self, items: list) -> [list]:
+        # Splits the items into at most as many contiguous parts of similar size as there are workers.
+        size = -(-len(items) // self.workers)
+        return [items[i:i + size] for i in range(0, len(items), size)] if items else []
+
+    def run_parts(self, operation, parts: [list]) -> int:
+        futures = [self.pool.submit(lambda part: sum(operation(item) for item in part), part) for part in parts]
+        return sum(future.result() for future in futures)
@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+
+from BPlusTree import BPlusTree
+from BTree import BTree
+from ClusteredTree import ClusteredTree
+from DataRecord import DataRecord
+from TreeExecutor import TreeExecutor
+
+
+class TreeServer:
+    # Serves a tree over TCP or a Unix socket with a line protocol. Every request is a line, and so is every
+    # response except for RANGE:
+    #   GET KEY                 -> VALUE DATA | NONE
+    #   PUT KEY DATA            -> OK                   inserts the record or replaces the one with the key
+    #   DEL KEY                 -> OK | NONE
+    #   RANGE LOW HIGH          -> RECORDS N, then N lines KEY DATA
+    #   BATCH N                 -> OK CHANGED           followed by N lines of PUT and DEL applied together
+    #   PING                    -> PONG
+    # An invalid request is answered with ERROR MESSAGE. A client can send requests without waiting for responses,
+    # they are answered in request order. Reads of a connection run in parallel, writes after all its requests
+    # before them. Page I/O runs on the threads of a TreeExecutor, so a slow read does not stall other clients.
+    # Writes of all clients that arrive while a group of them is applied are applied next in a single batch, which
+    # writes the changed pages once.
+    max_pipeline: int = 256     # requests of a connection waiting for their responses before it is read further
+
+    def __init__(self, btree: BTree, host: str = "127.0.0.1", port: int = 7070, path: str | None = None,
+                 workers: int = 4) -> None:
+        # With path given, the server listens on a Unix socket instead of host and port. Port 0 picks a free one.
+        self.btree = btree
+        self.host: str = host
+        self.port: int = port
+        self.path: str | None = path
+        self.workers: int = workers
+        self.executor: TreeExecutor | None = None
+        self.server: asyncio.AbstractServer | None = None
+        self.pending_writes: list = []  # (command, changes, future) of writes not applied yet, in arrival order
+        self.writes_waiting: asyncio.Event | None = None
+        self.writer_task: asyncio.Task | None = None
+        self.closing: bool = False
+        self.write_batches: int = 0     # batches the writes were applied in
+
+# public:
+    async def start(self) -> None:
+        self.executor = TreeExecutor(self.btree, self.workers)
+        self.closing = False
+        self.writes_waiting = asyncio.Event()
+        self.writer_task = asyncio.create_task(self.apply_pending_writes())
+        if self.path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+        await self.server.serve_forever()
+
+    async def close(self) -> None:
+        # Stops accepting connections and waits until the writes received are applied. The tree stays open.
+        if self.server is None:
+            return
+
+        self.server.close()
+        await self.server.wait_closed()
+        self.closing = True
+        self.writes_waiting.set()
+        await self.writer_task
+        self.executor.close()
+        self.server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+# private:
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Requests are read while earlier ones run, their responses are sent in order by send_responses. A write
+        # waits until reads before it are done and is queued right away, so writes are applied in request order and
+        # reads after a write wait for it.
+        responses = asyncio.Queue(TreeServer.max_pipeline)
+        sender = asyncio.create_task(self.send_responses(responses, writer))
+        last_write = None
+        reads = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    command, arguments = await self.read_request(line, reader)
+                except ValueError as error:
+                    await responses.put(self.completed([f"ERROR {error}"]))
+                    continue
+
+                if command in ("GET", "RANGE", "PING"):
+                    read = asyncio.create_task(self.read(command, arguments, last_write))
+                    reads = [earlier for earlier in reads if not earlier.done()] + [read]
+                    await responses.put(read)
+                else:
+                    if reads:
+                        await asyncio.wait(reads)
+                        reads = []
+                    last_write = self.queue_write(command, arguments)
+                    await responses.put(last_write)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await responses.put(None)
+            await sender
+            writer.close()
+
+    async def read_request(self, line: bytes, reader: asyncio.StreamReader) -> (str, list):
+        # Returns the command and its arguments, for writes the list of changes (key, data), data None for DEL.
+        # Raises ValueError for an invalid request.
+        command, *rest = line.decode("utf-8").rstrip("\r\n").split(" ", 1)
+        command = command.upper()
+        arguments = rest[0] if rest else ""
+
+        match command:
+            case "GET":
+                return command, [self.parse_key(arguments)]
+            case "RANGE":
+                return command, self.parse_keys(arguments, 2)
+            case "PING":
+                return command, []
+            case "PUT" | "DEL":
+                return command, [self.parse_change(command, arguments)]
+            case "BATCH":
+                count = self.parse_keys(arguments, 1)[0]
+                if count < 0:
+                    raise ValueError("negative batch size")
+                # All lines of the batch are read, so that an invalid one does not leave the rest to be taken for
+                # requests.
+                lines = [(await reader.readuntil(b"\n")).decode("utf-8").rstrip("\r\n") for _ in range(count)]
+                changes = []
+                for change in lines:
+                    change_command, *change_rest = change.split(" ", 1)
+                    if change_command.upper() not in ("PUT", "DEL"):
+                        raise ValueError(f"only PUT and DEL can be batched, not {change_command!r}")
+                    changes.append(self.parse_change(change_command.upper(), change_rest[0] if change_rest else ""))
+                return command, changes
+
+        raise ValueError(f"unknown command {command!r}")
+
+    @staticmethod
+    def parse_keys(arguments: str, count: int) -> [int]:
+        parts = arguments.split()
+        if len(parts) != count:
+            raise ValueError(f"expected {count} keys")
+        try:
+            return [int(part) for part in parts]
+        except ValueError:
+            raise ValueError("key is not an integer") from None
+
+    @staticmethod
+    def parse_key(arguments: str) -> int:
+        # A key of a record, unlike the bounds of RANGE, has to be one the tree can store.
+        key = TreeServer.parse_keys(arguments, 1)[0]
+        if not 0 <= key < DataRecord.null_byte_key:
+            raise ValueError(f"key out of range 0..{DataRecord.null_byte_key - 1}")
+        return key
+
+    @staticmethod
+    def parse_change(command: str, arguments: str) -> (int, str | None):
+        if command == "DEL":
+            return TreeServer.parse_key(arguments), None
+
+        key, *data = arguments.split(" ", 1)
+        if not data or not data[0]:
+            raise ValueError("PUT needs data")
+        return TreeServer.parse_key(key), data[0]
+
+    async def read(self, command: str, arguments: list, last_write: asyncio.Future | None) -> [str]:
+        if last_write is not None:
+            await asyncio.wait([last_write])
+
+        match command:
+            case "GET":
+                record = await self.run(self.btree.get, arguments[0])
+                return [f"VALUE {record.data}" if record is not None else "NONE"]
+            case "RANGE":
+                records = await self.run(lambda low, high: list(self.btree.range(low, high)), *arguments)
+                return [f"RECORDS {len(records)}"] + [f"{record.key} {record.data}" for record in records]
+            case "PING":
+                return ["PONG"]
+
+    def queue_write(self, command: str, changes: [(int, str | None)]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.pending_writes.append((command, changes, future))
+        self.writes_waiting.set()
+        return future
+
+    async def apply_pending_writes(self) -> None:
+        # Takes all writes queued so far and applies them in one batch on an executor thread. Writes queued
+        # meanwhile form the next batch. Once the server is closing, it ends when no write is left.
+        while self.pending_writes or not self.closing:
+            await self.writes_waiting.wait()
+            self.writes_waiting.clear()
+            if not self.pending_writes:
+                continue
+
+            writes, self.pending_writes = self.pending_writes, []
+            try:
+                results = await self.run(self.apply_writes, [(command, changes) for command, changes, _ in writes])
+            except Exception as error:
+                # The batch as a whole failed, when it was flushed, so none of its writes is known to be durable.
+                results = [[f"ERROR {error}"]] * len(writes)
+            self.write_batches += 1
+            for (_, _, future), result in zip(writes, results):
+                future.set_result(result)
+
+    def apply_writes(self, writes: [(str, [(int, str | None)])]) -> [[str]]:
+        # Every write gets a result of its own: one failing does not undo the writes applied before it, nor stops
+        # the ones after it. Changes of a BATCH applied before the failing one stay applied.
+        results = []
+        with self.btree.batch():
+            for command, changes in writes:
+                try:
+                    changed = self.apply_changes(changes)
+                except Exception as error:
+                    results.append([f"ERROR {error}"])
+                    continue
+
+                if command == "BATCH":
+                    results.append([f"OK {changed}"])
+                else:
+                    results.append(["OK" if changed else "NONE"])
+        return results
+
+    def apply_changes(self, changes: [(int, str | None)]) -> int:
+        changed = 0
+        for key, data in changes:
+            if data is None:
+                changed += self.btree.remove(key)
+            else:
+                self.btree.upsert(DataRecord(key, data))
+                changed += 1
+        return changed
+
+    async def run(self, function, *arguments):
+        return await asyncio.wrap_future(self.executor.submit(function, *arguments))
+
+    @staticmethod
+    async def send_responses(responses: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        while True:
+            response = await responses.get()
+            if response is None:
+                break
+
+            try:
+                lines = await response
+            except Exception as error:
+                lines = [f"ERROR {error}"]
+            writer.write(("\n".join(lines) + "\n").encode("utf-8"))
+            # Responses ready together go out with one write to the socket.
+            if responses.empty():
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+
+    @staticmethod
+    def completed(lines: [str]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(lines)
+        return future
+
+
+def main():
+    # Usage: TreeServer.py [d] [--new] [--bplus | --clustered] [--wal] [--host HOST] [--port PORT | --unix PATH]
+    #                      [--workers N]
+    # An existing database in data/ is reopened unless --new is given.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("d", type=int, nargs="?", default=2, help="order of the B-Tree")
+    parser.add_argument("--new", action="store_true", help="create a new database even if one exists")
+    parser.add_argument("--bplus", action="store_true", help="create a B+ tree, with records in linked leaves only")
+    parser.add_argument("--clustered", action="store_true", help="create a B+ tree holding the records in its leaves")
+    parser.add_argument("--wal", action="store_true", help="write changes through the write-ahead log")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070)
+    parser.add_argument("--unix", help="path of a Unix socket to listen on instead of a TCP port")
+    parser.add_argument("--workers", type=int, default=4, help="threads running page I/O")
+    arguments = parser.parse_args()
+
+    if not arguments.new and BTree.exists():
+        btree = BTree.open(wal=arguments.wal)
+    else:
+        tree_class = BPlusTree if arguments.bplus else ClusteredTree if arguments.clustered else BTree
+        btree = tree_class.create(arguments.d, wal=arguments.wal)
+
+    server = TreeServer(btree, arguments.host, arguments.port, arguments.unix, arguments.workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        btree.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import struct
+import time
+import zlib
+
+
+class WriteAheadLog:
+    # Redo log of whole page images. Every flush of the B-Tree buffers is one transaction: images of the pages it
+    # changed and of the catalog, then a commit record. Pages are written in place only after the log holding their
+    # images is synced, so after a crash the files are brought to the last committed state by writing again the
+    # images of every transaction with a commit record. Since pages are never written before their transaction is
+    # committed, nothing has to be undone.
+    # Record: kind, page number, length of the image, image, crc32 of everything before it.
+    header_format = struct.Struct(">BII")
+    checksum_format = struct.Struct(">I")
+
+    index_page = 1
+    data_page = 2
+    catalog = 3
+    commit_record = 4
+    index_space_map = 5
+    data_space_map = 6
+
+    checkpoint_size = 4 * 1024 * 1024   # the log is truncated once it grows over that many bytes
+
+    def __init__(self, filename: str, write_page, write_catalog, group_commit: int = 1,
+                 group_commit_interval: float | None = None) -> None:
+        # write_page(kind, page number, image) and write_catalog(image) write images in place.
+        # Commits are synced in groups of group_commit, or earlier when group_commit_interval seconds have passed
+        # since the last sync. Commits that are not synced yet are lost in a crash, but never partially.
+        self.filename: str = filename
+        self.write_page = write_page
+        self.write_catalog = write_catalog
+        self.group_commit: int = max(1, group_commit)
+        self.group_commit_interval: float | None = group_commit_interval
+
+        self.fd: int = os.open(filename, os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        self.size: int = os.fstat(self.fd).st_size
+
+        self.records: [bytes] = []          # records of the current transaction
+        self.pending_pages: dict = {}       # (kind, page number) -> image logged but not written in place yet
+        self.pending_catalog: bytes | None = None
+        self.unsynced_commits: int = 0
+        self.last_sync: float = time.monotonic()
+
+        self.commits: int = 0
+        self.syncs: int = 0
+
+# public:
+    def log_page(self, kind: int, page_number: int, image) -> None:
+        image = bytes(image)
+        self.records.append(self.create_record(kind, page_number, image))
+        self.pending_pages[(kind, page_number)] = image
+
+    def log_catalog(self, image: bytes) -> None:
+        self.records.append(self.create_record(WriteAheadLog.catalog, 0, image))
+        self.pending_catalog = image
+
+    def get_page(self, kind: int, page_number: int) -> bytes | None:
+        # Pages are read from the log until they are written in place.
+        return self.pending_pages.get((kind, page_number))
+
+    def commit(self) -> None:
+        if not self.records:
+            return
+
+        self.records.append(self.create_record(WriteAheadLog.commit_record, 0, b""))
+        data = b"".join(self.records)
+        os.write(self.fd, data)
+        self.size += len(data)
+        self.records = []
+        self.commits += 1
+        self.unsynced_commits += 1
+
+        if self.unsynced_commits >= self.group_commit or (self.group_commit_interval is not None and
+                                                          time.monotonic() - self.last_sync >= self.group_commit_interval):
+            self.sync()
+
+    def sync(self) -> None:
+        # Makes committed transactions durable, then writes their pages in place.
+        if self.unsynced_commits:
+            os.fsync(self.fd)
+            self.syncs += 1
+            self.unsynced_commits = 0
+        self.last_sync = time.monotonic()
+
+        self.write_pending()
+
+    def checkpoint(self, sync_files) -> None:
+        # Once the files holding the pages are synced by sync_files(), the log is not needed anymore.
+        self.sync()
+        sync_files()
+        self.truncate()
+
+    def should_checkpoint(self) -> bool:
+        return self.size >= WriteAheadLog.checkpoint_size
+
+    def recover(self) -> int:
+        # Writes in place the images of every committed transaction in the log, in the order they were logged.
+        # Reading stops at the first record that is incomplete or has a wrong checksum, which is where a crash
+        # interrupted writing to the log. Returns the number of recovered transactions.
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        with os.fdopen(os.dup(self.fd), "rb") as file:
+            transactions = 0
+            transaction = []
+            while True:
+                record = self.read_record(file)
+                if record is None:
+                    break
+
+                kind, page_number, image = record
+                if kind != WriteAheadLog.commit_record:
+                    transaction.append(record)
+                    continue
+
+                for kind, page_number, image in transaction:
+                    if kind == WriteAheadLog.catalog:
+                        self.pending_catalog = image
+                    else:
+                        self.pending_pages[(kind, page_number)] = image
+                transaction = []
+                transactions += 1
+
+        self.write_pending()
+        return transactions
+
+    def truncate(self) -> None:
+        # Drops the whole log together with pages that were not written in place.
+        self.records = []
+        self.pending_pages = {}
+        self.pending_catalog = None
+        self.unsynced_commits = 0
+        os.ftruncate(self.fd, 0)
+        os.fsync(self.fd)
+        self.size = 0
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+# private:
+    @staticmethod
+    def create_record(kind: int, page_number: int, image: bytes) -> bytes:
+        record = WriteAheadLog.header_format.pack(kind, page_number, len(image)) + image
+        return record + WriteAheadLog.checksum_format.pack(zlib.crc32(record))
+
+    @staticmethod
+    def read_record(file) -> tuple | None:
+        header = file.read(WriteAheadLog.header_format.size)
+        if len(header) < WriteAheadLog.header_format.size:
+            return None
+
+        kind, page_number, length = WriteAheadLog.header_format.unpack(header)
+        image = file.read(length)
+        checksum = file.read(WriteAheadLog.checksum_format.size)
+        if len(image) < length or len(checksum) < WriteAheadLog.checksum_format.size:
+            return None
+        if WriteAheadLog.checksum_format.unpack(checksum)[0] != zlib.crc32(header + image):
+            return None
+
+        return kind, page_number, image
+
+    def write_pending(self) -> None:
+        for (kind, page_number), image in self.pending_pages.items():
+            self.write_page(kind, page_number, image)
+        if self.pending_catalog is not None:
+            self.write_catalog(self.pending_catalog)
+
+        self.pending_pages = {}
+        self.pending_catalog = None
@@ -1,12 +1,36 @@
+import argparse
 import sys
 
 from ProgramManager import ProgramManager
 
 
 def main():
-    d = sys.argv[1] if len(sys.argv) > 1 else 2
-    programManager = ProgramManager(d)
-    programManager.run()
+    # Usage: main.py [d] [--new] [--page-size BYTES] [--bplus | --clustered] [--wal [--group-commit N]]
+    #                [--key-filter] [--script FILE]
+    # An existing database in data/ is reopened unless --new is given, its layout is then taken from its catalog.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("d", type=int, nargs="?", default=2, help="order of the B-Tree")
+    parser.add_argument("--new", action="store_true", help="create a new database even if one exists")
+    parser.add_argument("--page-size", type=int, default=None,
+                        help="page size in bytes, e.g. 4096 or 16384, d is then derived from it")
+    parser.add_argument("--bplus", action="store_true", help="create a B+ tree, with records in linked leaves only")
+    parser.add_argument("--clustered", action="store_true", help="create a B+ tree holding the records in its leaves")
+    parser.add_argument("--wal", action="store_true", help="write changes through the write-ahead log")
+    parser.add_argument("--group-commit", type=int, default=1, help="number of operations sharing one log sync")
+    parser.add_argument("--key-filter", action="store_true", help="answer lookups of absent keys from a filter")
+    parser.add_argument("--script", help="file of commands run instead of the menu, - for standard input")
+    arguments = parser.parse_args()
+
+    programManager = ProgramManager(arguments.d, reopen=not arguments.new, page_size=arguments.page_size,
+                                    bplus=arguments.bplus, clustered=arguments.clustered, wal=arguments.wal,
+                                    group_commit=arguments.group_commit, key_filter=arguments.key_filter)
+    if arguments.script is None:
+        programManager.run()
+    elif arguments.script == "-":
+        programManager.run(sys.stdin)
+    else:
+        with open(arguments.script) as script:
+            programManager.run(script)
 
 
 if __name__ == "__main__":
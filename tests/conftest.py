@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The modules of the tree live at the root of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def tree_files(tmp_path) -> dict:
+    # File names of a tree in a temporary directory, passed to BTree.create and BTree.open.
+    return {
+        "index_filename": str(tmp_path / "index.txt"),
+        "data_filename": str(tmp_path / "data.txt"),
+        "catalog_filename": str(tmp_path / "catalog.txt"),
+    }
@@ -0,0 +1,46 @@
+from Benchmark import Benchmark
+
+
+def make_result(ops_per_second: float, noise: float = 0.0) -> dict:
+    return {"workload": "lookup", "read_ratio": None, "layout": "btree", "d": 2, "buffer_size": 4,
+            "ops_per_second": ops_per_second, "noise": noise, "index_reads_per_op": 1.0, "index_writes_per_op": 0.0,
+            "data_reads_per_op": 0.0, "data_writes_per_op": 0.0}
+
+
+def test_baseline_of_another_configuration_is_refused():
+    configuration = {"records": 500, "seed": 0, "wal": False, "key_filter": True}
+    assert Benchmark.compare_configuration(configuration, dict(configuration, results=[])) == []
+    mismatches = Benchmark.compare_configuration(configuration, {"records": 2000, "seed": 0, "wal": False})
+    assert len(mismatches) == 2
+    assert mismatches[0].startswith("records is 500")
+
+
+def test_noise_widens_allowed_drop_up_to_a_cap():
+    baseline = [make_result(1000.0)]
+    assert Benchmark.compare([make_result(850.0)], baseline, tolerance=0.1)
+    assert not Benchmark.compare([make_result(850.0, noise=0.1)], baseline, tolerance=0.1)
+    assert Benchmark.compare([make_result(700.0, noise=0.1)], baseline, tolerance=0.1)
+
+    # However noisy the new result, the drop allowed is at most tolerance + max_noise.
+    limit = 1000.0 * (1 - 0.1 - Benchmark.max_noise)
+    assert Benchmark.compare([make_result(limit - 1, noise=0.9)], baseline, tolerance=0.1)
+    assert Benchmark.compare([make_result(1.0, noise=1.0)], baseline, tolerance=0.1)
+    assert not Benchmark.compare([make_result(limit + 1, noise=0.9)], baseline, tolerance=0.1)
+
+
+def test_baseline_noise_does_not_widen_allowed_drop():
+    baseline = [make_result(1000.0, noise=0.5)]
+    assert Benchmark.compare([make_result(850.0)], baseline, tolerance=0.1)
+
+
+def test_default_tolerance_grows_for_short_workloads():
+    assert Benchmark.get_default_tolerance(2000) == Benchmark.tolerance
+    assert Benchmark.get_default_tolerance(20000) == Benchmark.tolerance
+    assert Benchmark.get_default_tolerance(500) == 2 * Benchmark.tolerance
+
+
+def test_run_repeats_workload_and_reports_noise():
+    result = Benchmark(records=50, repeats=2).run_workload("lookup", "btree", 2, 4)
+    assert result["operations"] == 50
+    assert 0.0 <= result["noise"] < 1.0
+    assert result["ops_per_second"] > 0
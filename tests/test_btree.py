@@ -0,0 +1,68 @@
+import pytest
+
+from BPlusTree import BPlusTree
+from BTree import BTree
+from ClusteredTree import ClusteredTree
+from DataRecord import DataRecord
+
+
+@pytest.fixture(params=[BTree, BPlusTree, ClusteredTree])
+def btree(request, tree_files):
+    # A tree of every layout holding keys 0, 10, ..., 190, with data long enough for overflow pages for some.
+    btree = request.param.create(2, **tree_files)
+    btree.verbose = False
+    for key in range(0, 200, 10):
+        btree.insert(DataRecord(key, f"v{key}" * (50 if key % 30 == 0 else 1)))
+    yield btree
+    btree.close()
+
+
+def records_of(btree: BTree) -> dict:
+    return {record.key: record.data for record in btree.range(0, DataRecord.null_byte_key - 1)}
+
+
+def test_update_with_same_key_replaces_record(btree):
+    expected = records_of(btree)
+    for key, data in ((50, "x"), (60, "y" * 500), (0, "z")):
+        assert btree.update(key, DataRecord(key, data))
+        expected[key] = data
+
+    latencies = btree.metrics.get_latencies()
+    assert latencies["update"]["count"] == 3 and "upsert" not in latencies
+    assert records_of(btree) == expected
+    assert btree.check_structure() == 20
+
+
+def test_update_with_changed_key_moves_record(btree):
+    expected = records_of(btree)
+    assert btree.update(50, DataRecord(55, "moved"))
+    del expected[50]
+    expected[55] = "moved"
+
+    assert not btree.update(60, DataRecord(70, "taken"))
+    assert records_of(btree) == expected
+    assert btree.check_structure() == 20
+
+
+@pytest.mark.parametrize("new_key", [5, 15])
+def test_update_of_missing_key_changes_nothing(btree, new_key):
+    expected = records_of(btree)
+    assert not btree.update(5, DataRecord(new_key, "x"))
+    assert records_of(btree) == expected
+
+
+def test_upsert_inserts_or_replaces(btree):
+    assert btree.upsert(DataRecord(5, "new"))
+    assert not btree.upsert(DataRecord(10, "replaced"))
+    records = records_of(btree)
+    assert records[5] == "new" and records[10] == "replaced"
+    assert btree.check_structure() == 21
+
+
+def test_update_value_replaces_data_of_existing_key_only(btree):
+    assert btree.update_value(30, "short")
+    assert btree.update_value(40, "long" * 200)
+    assert not btree.update_value(35, "missing")
+    records = records_of(btree)
+    assert records[30] == "short" and records[40] == "long" * 200 and 35 not in records
+    assert btree.check_structure() == 20
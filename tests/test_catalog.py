@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from BTree import BTree
+from Catalog import Catalog
+from DataRecord import DataRecord
+
+
+def test_catalog_round_trips(tmp_path):
+    filename = str(tmp_path / "catalog.txt")
+    catalog = Catalog(4, 4096, "bplus")
+    catalog.root_page = 3
+    catalog.h = 2
+    catalog.save(filename)
+
+    loaded = Catalog.load(filename)
+    assert loaded.serialize() == catalog.serialize()
+    assert not os.path.exists(filename + ".tmp")
+
+
+def test_failed_save_leaves_old_catalog(tmp_path, monkeypatch):
+    filename = str(tmp_path / "catalog.txt")
+    Catalog(4).save(filename)
+
+    # A crash between writing the new catalog and renaming it over the old one.
+    def crash(*arguments):
+        raise OSError("crash")
+    monkeypatch.setattr(os, "replace", crash)
+    new_catalog = Catalog(4)
+    new_catalog.root_page = 9
+    with pytest.raises(OSError):
+        new_catalog.save(filename)
+
+    assert Catalog.load(filename).root_page is None
+
+
+def test_tree_reopens_after_catalog_saves(tree_files):
+    btree = BTree.create(2, **tree_files)
+    btree.verbose = False
+    for key in range(50):
+        btree.insert(DataRecord(key, str(key)))
+    btree.close()
+
+    btree = BTree.open(**tree_files)
+    btree.verbose = False
+    try:
+        assert btree.check_structure() == 50
+    finally:
+        btree.close()
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from FreeSpaceMap import FreeSpaceMap
+
+
+@pytest.fixture
+def free_space_map(tmp_path):
+    free_space_map = FreeSpaceMap(str(tmp_path / "free_space.txt"))
+    yield free_space_map
+    free_space_map.close()
+
+
+def test_find_returns_page_with_enough_space(free_space_map):
+    for page_number, level in enumerate([0, 1, 7, 100, 119, 130, 4000], 1):
+        free_space_map.set(page_number, level)
+
+    assert free_space_map.find(1) is not None
+    assert free_space_map.find(8) in (4, 5, 6, 7)
+    assert free_space_map.find(120) in (6, 7)
+    # 119 shares the bucket of 112 to 127, so it is found only by scanning that bucket.
+    free_space_map.set(6, 0)
+    free_space_map.set(7, 0)
+    assert free_space_map.find(115) == 5
+    assert free_space_map.find(120) is None
+
+
+def test_find_skips_pages_filled_or_truncated(free_space_map):
+    for page_number in range(1, 11):
+        free_space_map.set(page_number, 50)
+    for page_number in range(1, 10):
+        free_space_map.set(page_number, 0)
+    assert free_space_map.find(50) == 10
+
+    free_space_map.truncate(9)
+    assert free_space_map.find(1) is None
+    assert free_space_map.get_free_count() == 0
+
+
+def test_find_after_load(free_space_map):
+    free_space_map.set(3, 200)
+    free_space_map.set(5000, 20)
+    free_space_map.flush(free_space_map.write_block)
+
+    loaded = FreeSpaceMap(free_space_map.file.filename)
+    loaded.load()
+    assert loaded.find(100) == 3
+    assert loaded.find(21) == 3
+    assert loaded.find(201) is None
+    assert loaded.get_free_count() == 2
+    loaded.close()
+
+
+def test_find_matches_scan_under_churn(free_space_map):
+    generator = random.Random(7)
+    for _ in range(3000):
+        free_space_map.set(generator.randint(1, 300), generator.choice([0, generator.randint(1, 5000)]))
+        needed = generator.randint(1, 5000)
+        page_number = free_space_map.find(needed)
+        if page_number is None:
+            assert all(level < needed for level in free_space_map.levels)
+        else:
+            assert free_space_map.get(page_number) >= needed
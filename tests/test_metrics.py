@@ -0,0 +1,21 @@
+import random
+
+from Metrics import LatencyHistogram, Metrics
+
+
+def test_quantiles_are_ordered_and_never_above_max():
+    rng = random.Random(0)
+    for _ in range(100):
+        histogram = LatencyHistogram(Metrics.latency_bounds)
+        for _ in range(rng.randint(1, 50)):
+            histogram.add(rng.choice([rng.uniform(0, 0.0003), rng.expovariate(1000), rng.uniform(2, 4)]))
+
+        p50, p99 = histogram.get_quantile(0.5), histogram.get_quantile(0.99)
+        assert p50 <= p99 <= histogram.max
+
+
+def test_quantile_of_single_latency_is_that_latency():
+    histogram = LatencyHistogram(Metrics.latency_bounds)
+    histogram.add(0.000233)
+    assert histogram.get_quantile(0.5) == histogram.get_quantile(0.99) == 0.000233
+    assert LatencyHistogram(Metrics.latency_bounds).get_quantile(0.5) == 0.0
@@ -0,0 +1,110 @@
+import io
+
+import pytest
+
+from DataPage import DataPage, OverflowPage
+from DataRecord import DataRecord
+from IndexPage import IndexPage, IndexRecord
+from PageCodec import PageCodec
+
+boundary_keys = [0, 1, DataRecord.null_byte_key - 1]
+
+
+def to_bytes(*numbers: int) -> bytes:
+    # The on-disk integers, written the way IndexPage.serialize writes them.
+    return b"".join(number.to_bytes(DataRecord.int_size, DataRecord.byte_order) for number in numbers)
+
+
+def records_of(page) -> [(int, str | None, int | None)]:
+    return [(record.key, record.data, record.overflow_page) for record in page.records]
+
+
+@pytest.mark.parametrize("leaf", [True, False])
+@pytest.mark.parametrize("index_page_size", [None, 4096])
+def test_index_page_matches_serialize(leaf, index_page_size):
+    records_per_page = 4
+    codec = PageCodec(records_per_page, index_page_size)
+    index_page = IndexPage(records_per_page, 3)
+    index_page.set_records([IndexRecord(key, data_page_number)
+                            for key, data_page_number in zip(boundary_keys, [1, 7, DataRecord.null_byte_key - 1])])
+    if not leaf:
+        index_page.set_pointers([2, 5, 9, DataRecord.null_byte_key - 1])
+
+    encoded = bytes(codec.encode_index_page(index_page))
+    serialized = b"".join(index_page.serialize())
+    assert encoded[:len(serialized)] == serialized
+    assert encoded[len(serialized):] == bytes(len(encoded) - len(serialized))
+
+    decoded = codec.decode_index_page(encoded, 3)
+    assert [(record.key, record.data_page_number) for record in decoded.records] == \
+        [(record.key, record.data_page_number) for record in index_page.records]
+    assert decoded.pointers == index_page.pointers
+    assert decoded.is_leaf() == leaf
+
+
+def test_empty_index_page_round_trips():
+    codec = PageCodec(2)
+    encoded = bytes(codec.encode_index_page(IndexPage(2, 1)))
+    assert encoded == to_bytes(*[DataRecord.null_byte_key] * 7)
+    assert codec.decode_index_page(encoded, 1).records == []
+
+
+def test_data_page_matches_slotted_layout():
+    # Slots (key, data offset, data length) follow the header, data is packed from the end of the page in slot
+    # order, and a record kept in overflow pages holds the first of them with PageCodec.overflow_flag set.
+    page_size = 256
+    codec = PageCodec(2, data_page_size=page_size)
+    data_page = DataPage(page_size, 4)
+    data_page.add_record(DataRecord(0, "first"))
+    data_page.add_record(DataRecord(5, None, overflow_page=DataRecord.null_byte_key - 1))
+    data_page.add_record(DataRecord(DataRecord.null_byte_key - 1, "żółw"))
+
+    first, last = "first".encode("utf-8"), "żółw".encode("utf-8")
+    reference = to_bytes(DataRecord.null_byte_key - 1)
+    data = last + reference + first
+    data_start = page_size - len(data)
+    expected = (to_bytes(PageCodec.data_kind, 3)
+                + to_bytes(0, page_size - len(first), len(first))
+                + to_bytes(5, page_size - len(first) - len(reference), len(reference) | PageCodec.overflow_flag)
+                + to_bytes(DataRecord.null_byte_key - 1, data_start, len(last)))
+    expected += bytes(data_start - len(expected)) + data
+
+    encoded = bytes(codec.encode_data_page(data_page))
+    assert encoded == expected
+
+    decoded = codec.decode_data_page(encoded, 4)
+    assert records_of(decoded) == records_of(data_page)
+    assert decoded.free_space == data_page.free_space
+
+
+def test_overflow_page_round_trips():
+    page_size = 64
+    codec = PageCodec(2, data_page_size=page_size)
+    for next_page in (None, 8):
+        overflow_page = OverflowPage(6)
+        overflow_page.key = DataRecord.null_byte_key - 1
+        overflow_page.next_page = next_page
+        overflow_page.data = b"x" * 10
+
+        encoded = bytes(codec.encode_data_page(overflow_page))
+        header = to_bytes(PageCodec.overflow_kind, DataRecord.null_byte_key - 1,
+                          DataRecord.null_byte_key if next_page is None else next_page, 10)
+        assert encoded == header + b"x" * 10 + bytes(page_size - len(header) - 10)
+
+        decoded = codec.decode_data_page(encoded, 6)
+        assert decoded.is_overflow()
+        assert (decoded.key, decoded.next_page, decoded.data) == (overflow_page.key, next_page, overflow_page.data)
+
+
+def test_data_record_matches_record_layout():
+    # Records out of pages, e.g. in sort runs of the bulk loader, are (key, data length, data).
+    codec = PageCodec(2)
+    records = [DataRecord(key, data) for key, data in zip(boundary_keys, ["a", "", "żółw"])]
+    encoded = b"".join(codec.encode_data_record(record) for record in records)
+    assert encoded == b"".join(to_bytes(record.key, len(record.data.encode("utf-8"))) + record.data.encode("utf-8")
+                               for record in records)
+
+    file = io.BytesIO(encoded)
+    decoded = [codec.read_data_record(file) for _ in records]
+    assert [(record.key, record.data) for record in decoded] == [(record.key, record.data) for record in records]
+    assert codec.read_data_record(file) is None
@@ -0,0 +1,33 @@
+import io
+
+from ProgramManager import ProgramManager
+
+
+def test_script_reports_invalid_lines_and_failures_without_stopping(tree_files, capsys):
+    program_manager = ProgramManager(2, reopen=False, **tree_files)
+    output = io.StringIO()
+    script = ["insert 1 one", "insert -5 x", "insert 99999999999 x", "insert 1 again", "remove 7", "get 1",
+              "range -10 99999999999"]
+    try:
+        totals = program_manager.run_script(script, output)
+    finally:
+        program_manager.btree.close()
+
+    assert totals["errors"] == 2
+    assert totals["failed"] == 2
+    assert totals["commands"]["insert"] == 2
+    assert output.getvalue().splitlines() == ["insert 1: key exists", "remove 7: no such key", '1: "one"', '1: "one"']
+    stderr = capsys.readouterr().err
+    assert "line 2: key out of range" in stderr and "line 3: key out of range" in stderr
+
+
+def test_reopen_uses_catalog_of_given_files(tree_files):
+    program_manager = ProgramManager(2, reopen=False, **tree_files)
+    program_manager.run_script(["insert 1 one", "insert 2 two"], io.StringIO())
+    program_manager.btree.close()
+
+    program_manager = ProgramManager(2, reopen=True, **tree_files)
+    try:
+        assert [record.key for record in program_manager.btree.range(0, 10)] == [1, 2]
+    finally:
+        program_manager.btree.close()
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from BTree import BTree
+from DataRecord import DataRecord
+from TreeClient import TreeClient
+from TreeServer import TreeServer
+
+
+def serve(btree: BTree, session) -> None:
+    # Runs the coroutine function session(client) against a server of the tree on a free port.
+    async def run() -> None:
+        async with TreeServer(btree, port=0) as server:
+            client = await TreeClient.connect(port=server.port)
+            try:
+                await session(client)
+            finally:
+                await client.close()
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def btree(tree_files):
+    btree = BTree.create(2, **tree_files)
+    btree.verbose = False
+    yield btree
+    btree.close()
+
+
+@pytest.mark.parametrize("key", [-5, DataRecord.null_byte_key, 2 ** 32])
+def test_invalid_key_is_rejected_and_later_writes_succeed(btree, key):
+    async def session(client: TreeClient) -> None:
+        with pytest.raises(ValueError, match="out of range"):
+            await client.put(key, "x")
+        with pytest.raises(ValueError, match="out of range"):
+            await client.batch([(1, "a"), (key, "x")])
+        with pytest.raises(ValueError, match="out of range"):
+            await client.delete(key)
+
+        await client.put(1, "one")
+        assert await client.batch([(2, "two"), (DataRecord.null_byte_key - 1, "last")]) == 2
+        assert await client.get(1) == "one"
+        assert await client.range(0, 2 ** 32) == [(1, "one"), (2, "two"), (DataRecord.null_byte_key - 1, "last")]
+
+    serve(btree, session)
+    assert btree.check_structure() == 3
+
+
+@pytest.mark.parametrize("key", [-1, DataRecord.null_byte_key])
+def test_tree_rejects_invalid_key_before_changing_pages(btree, key):
+    btree.insert(DataRecord(1, "one"))
+    for change in (lambda: btree.insert(DataRecord(key, "x")), lambda: btree.upsert(DataRecord(key, "x")),
+                   lambda: btree.update(1, DataRecord(key, "x"))):
+        with pytest.raises(ValueError, match="out of range"):
+            change()
+
+    assert btree.insert(DataRecord(2, "two"))
+    assert [(record.key, record.data) for record in btree.range(0, 10)] == [(1, "one"), (2, "two")]
+
+
+def fail_upserts(btree: BTree, monkeypatch, failing_key: int) -> None:
+    # Upserts of the key raise, like on a failing disk, after the checks of the request passed.
+    upsert = btree.upsert
+
+    def failing_upsert(record: DataRecord) -> bool:
+        if record.key == failing_key:
+            raise OSError("disk full")
+        return upsert(record)
+    monkeypatch.setattr(btree, "upsert", failing_upsert)
+
+
+def test_failing_write_of_a_batch_does_not_fail_the_others(btree, monkeypatch):
+    fail_upserts(btree, monkeypatch, 13)
+    btree.insert(DataRecord(4, "four"))
+
+    results = TreeServer(btree).apply_writes([("PUT", [(1, "one")]), ("PUT", [(13, "x")]),
+                                              ("BATCH", [(2, "two"), (13, "x"), (3, "three")]), ("DELETE", [(4, None)]),
+                                              ("PUT", [(5, "five")])])
+    assert results == [["OK"], ["ERROR disk full"], ["ERROR disk full"], ["OK"], ["OK"]]
+    # The changes of the failed BATCH before its failing one stay applied.
+    assert [(record.key, record.data) for record in btree.range(0, 20)] == [(1, "one"), (2, "two"), (5, "five")]
+    assert btree.check_structure() == 3
+
+
+def test_concurrent_writes_get_results_of_their_own(btree, monkeypatch):
+    fail_upserts(btree, monkeypatch, 13)
+
+    async def session(client: TreeClient) -> None:
+        results = await asyncio.gather(*(client.put(key, str(key)) for key in range(10, 20)), return_exceptions=True)
+        for key, result in zip(range(10, 20), results):
+            if key == 13:
+                assert isinstance(result, ValueError) and "disk full" in str(result)
+            else:
+                assert not isinstance(result, Exception)
+        assert await client.range(0, 100) == [(key, str(key)) for key in range(10, 20) if key != 13]
+
+    serve(btree, session)
@@ -0,0 +1,141 @@
+import multiprocessing
+import os
+
+import pytest
+
+from BTree import BTree
+from DataRecord import DataRecord
+from WriteAheadLog import WriteAheadLog
+
+
+def write_records(tree_files: dict, keys: [int], group_commit: int, connection) -> None:
+    # Runs in a writer process, which is killed once it reports the counters of its log.
+    btree = BTree.create(2, wal=True, group_commit=group_commit, **tree_files)
+    btree.verbose = False
+    for key in keys:
+        btree.insert(DataRecord(key, get_data(key)))
+    connection.send((btree.filesHandler.wal.commits, btree.filesHandler.wal.syncs))
+    connection.recv()
+
+
+def get_data(key: int) -> str:
+    return f"record {key} " * (key % 4 + 1)
+
+
+def crash_writer(tree_files: dict, keys: [int], group_commit: int) -> (int, int):
+    # Writes the records in a process killed after its last commit, before it closes the tree. Returns the number of
+    # commits and of syncs of its log.
+    parent, child = multiprocessing.get_context("fork").Pipe()
+    process = multiprocessing.get_context("fork").Process(target=write_records,
+                                                          args=(tree_files, keys, group_commit, child))
+    process.start()
+    counters = parent.recv()
+    process.kill()
+    process.join()
+    return counters
+
+
+def get_log_filename(tree_files: dict) -> str:
+    return os.path.splitext(tree_files["catalog_filename"])[0] + ".log"
+
+
+def get_commit_ends(log_filename: str) -> [int]:
+    # Offsets in the log just after every commit record.
+    ends = []
+    with open(log_filename, "rb") as file:
+        while (record := WriteAheadLog.read_record(file)) is not None:
+            if record[0] == WriteAheadLog.commit_record:
+                ends.append(file.tell())
+    return ends
+
+
+def flip_byte(log_filename: str, offset: int) -> None:
+    with open(log_filename, "r+b") as file:
+        file.seek(offset)
+        byte = file.read(1)[0]
+        file.seek(offset)
+        file.write(bytes([byte ^ 0xFF]))
+
+
+def get_records(tree_files: dict) -> [(int, str)]:
+    with BTree.open(wal=True, **tree_files) as btree:
+        btree.verbose = False
+        count = btree.check_structure()
+        records = [(record.key, record.data) for record in btree.range(0, 1000)]
+        assert len(records) == count
+        return records
+
+
+def expected_records(keys: [int]) -> [(int, str)]:
+    return sorted((key, get_data(key)) for key in keys)
+
+
+@pytest.fixture
+def crashed_writer(tree_files):
+    # A writer that inserted 30 records, one transaction each, and was killed before any of them was synced or
+    # written in place, so the log alone holds them.
+    keys = list(range(0, 300, 10))
+    commits, syncs = crash_writer(tree_files, keys, group_commit=100)
+    assert (commits, syncs) == (len(keys), 0)
+    assert len(get_commit_ends(get_log_filename(tree_files))) == len(keys)
+    return keys
+
+
+def test_committed_records_survive_killed_writer(tree_files, crashed_writer):
+    assert get_records(tree_files) == expected_records(crashed_writer)
+    # Recovery wrote the records in place and the close emptied the log.
+    assert os.path.getsize(get_log_filename(tree_files)) == 0
+    assert get_records(tree_files) == expected_records(crashed_writer)
+
+
+@pytest.mark.parametrize("cut", [1, WriteAheadLog.checksum_format.size + 1, "transaction"])
+def test_truncated_log_tail_loses_only_last_transaction(tree_files, crashed_writer, cut):
+    log_filename = get_log_filename(tree_files)
+    ends = get_commit_ends(log_filename)
+    # Cut within the commit record, within the last page image, or right after the transaction before the last.
+    size = ends[-2] + 1 if cut == "transaction" else ends[-1] - cut
+    os.truncate(log_filename, size)
+
+    assert get_records(tree_files) == expected_records(crashed_writer[:-1])
+
+
+@pytest.mark.parametrize("position", ["commit checksum", "page image"])
+def test_torn_record_with_bad_checksum_ends_recovery(tree_files, crashed_writer, position):
+    log_filename = get_log_filename(tree_files)
+    ends = get_commit_ends(log_filename)
+    if position == "commit checksum":
+        offset = ends[-1] - 1
+    else:
+        offset = ends[-2] + WriteAheadLog.header_format.size
+    flip_byte(log_filename, offset)
+
+    assert get_records(tree_files) == expected_records(crashed_writer[:-1])
+
+
+def test_bad_record_in_middle_drops_all_later_transactions(tree_files, crashed_writer):
+    log_filename = get_log_filename(tree_files)
+    ends = get_commit_ends(log_filename)
+    # The checksum of the commit record of the tenth transaction.
+    flip_byte(log_filename, ends[9] - 1)
+
+    assert get_records(tree_files) == expected_records(crashed_writer[:9])
+
+
+def test_group_commit_keeps_synced_groups_after_power_loss(tree_files):
+    keys = list(range(7))
+    commits, syncs = crash_writer(tree_files, keys, group_commit=3)
+    assert (commits, syncs) == (7, 2)
+
+    # A killed process loses nothing written to the log, a power loss what was not synced: the last commit.
+    log_filename = get_log_filename(tree_files)
+    ends = get_commit_ends(log_filename)
+    assert len(ends) == 7
+    os.truncate(log_filename, ends[5])
+
+    assert get_records(tree_files) == expected_records(keys[:6])
+
+
+def test_group_commit_keeps_unsynced_commits_of_killed_writer(tree_files):
+    keys = list(range(7))
+    assert crash_writer(tree_files, keys, group_commit=3) == (7, 2)
+    assert get_records(tree_files) == expected_records(keys)